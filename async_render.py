@@ -0,0 +1,188 @@
+"""
+Async rendering API for the Brrow documentation pipeline
+Renders Markdown to PDF from asyncio code without blocking the event loop
+
+Usage:
+    pdf = await render("REPORT.md", "REPORT.pdf", backend="playwright")
+    results = await render_many([("A.md", "A.pdf"), ("B.md", "B.pdf")])
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_CSS = BASE_DIR / "pdf_styles.css"
+
+BACKENDS = ('playwright', 'cdp', 'chrome', 'weasyprint')
+CHROME_TIMEOUT = 60
+
+
+def _convert_markdown_quiet(markdown_path, html_path, css_file):
+    """Run convert_markdown_to_html without its progress output"""
+    import generate_pdf
+    from docs_metrics import quiet
+
+    generate_pdf.convert_markdown_to_html(markdown_path, html_path, css_file, progress=quiet)
+    return html_path
+
+
+def _weasyprint_html_to_pdf(html_path, pdf_path):
+    """Lay out a self-contained HTML file with WeasyPrint"""
+    import weasyprint
+    from convert_to_pdf import size_options
+
+    weasyprint.HTML(filename=html_path).write_pdf(pdf_path, **size_options(weasyprint))
+    return pdf_path
+
+
+async def convert_markdown(markdown_path, html_path, css_file=DEFAULT_CSS, executor=None):
+    """Convert markdown to HTML in an executor (default: the loop's thread pool)"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        executor, _convert_markdown_quiet, str(markdown_path), str(html_path), str(css_file)
+    )
+    return Path(html_path)
+
+
+async def print_pdf_chrome(html_path, pdf_path, timeout=CHROME_TIMEOUT):
+    """Print HTML to PDF with a headless Chrome subprocess"""
+    from generate_pdf import chrome_print_command, find_chrome
+
+    chrome_path = find_chrome()
+    if not chrome_path:
+        raise RuntimeError("Chrome not found")
+
+    cmd = chrome_print_command(chrome_path, os.path.abspath(html_path), pdf_path)
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Chrome exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    return Path(pdf_path)
+
+
+async def print_pdf(html_path, pdf_path, backend='playwright', renderer=None, executor=None):
+    """
+    Print an HTML file to PDF with the selected backend
+
+    Args:
+        html_path: Self-contained HTML file from convert_markdown()
+        pdf_path: Output PDF path
+        backend: One of BACKENDS
+        renderer: Started AsyncPlaywrightPdfRenderer (playwright) or
+            ChromeCDP (cdp) to reuse
+        executor: Executor for the blocking WeasyPrint layout
+    """
+    if backend == 'playwright':
+        if renderer is None:
+            from create_pdf_playwright import AsyncPlaywrightPdfRenderer
+            async with AsyncPlaywrightPdfRenderer(pages=1) as one_shot:
+                await one_shot.render(html_path, pdf_path)
+        else:
+            await renderer.render(html_path, pdf_path)
+    elif backend == 'cdp':
+        if renderer is None:
+            from chrome_cdp import ChromeCDP
+            async with ChromeCDP() as one_shot:
+                await one_shot.print_to_pdf(html_path, pdf_path)
+        else:
+            await renderer.print_to_pdf(html_path, pdf_path)
+    elif backend == 'chrome':
+        await print_pdf_chrome(html_path, pdf_path)
+    elif backend == 'weasyprint':
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, _weasyprint_html_to_pdf, str(html_path), str(pdf_path))
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+    return Path(pdf_path)
+
+
+async def render(markdown_path, out_pdf, backend='playwright', css_file=DEFAULT_CSS,
+                 html_path=None, renderer=None, executor=None):
+    """
+    Render one markdown file to PDF
+
+    Args:
+        markdown_path: Input markdown file
+        out_pdf: Output PDF path
+        backend: One of BACKENDS
+        css_file: Stylesheet inlined into the HTML
+        html_path: Intermediate HTML path (default: out_pdf with .html suffix)
+        renderer: Started AsyncPlaywrightPdfRenderer (playwright) or
+            ChromeCDP (cdp) to reuse
+        executor: Executor for CPU-bound stages (default: the loop's thread pool)
+
+    Returns:
+        Path of the written PDF
+    """
+    html_path = html_path or Path(out_pdf).with_suffix('.html')
+    await convert_markdown(markdown_path, html_path, css_file, executor)
+    return await print_pdf(html_path, out_pdf, backend, renderer, executor)
+
+
+async def render_many(jobs, backend='playwright', css_file=DEFAULT_CSS, concurrency=4, convert_workers=None):
+    """
+    Render many markdown files with bounded concurrency
+
+    Markdown conversion runs in a process pool and PDF printing is limited by
+    a separate semaphore, so document N+1 is converted while document N is
+    printing.
+
+    Args:
+        jobs: Iterable of (markdown_path, out_pdf) pairs
+        backend: One of BACKENDS
+        css_file: Stylesheet inlined into the HTML
+        concurrency: Maximum documents printing at once
+        convert_workers: Conversion processes (default: CPU count)
+
+    Returns:
+        One dict per job, in input order, with 'markdown', 'pdf', 'seconds'
+        and 'error' (None on success); a failing job does not cancel the rest
+    """
+    jobs = list(jobs)
+    convert_workers = convert_workers or os.cpu_count() or 1
+    convert_slots = asyncio.Semaphore(convert_workers)
+    print_slots = asyncio.Semaphore(concurrency)
+    executor = ProcessPoolExecutor(max_workers=convert_workers)
+
+    renderer = None
+    if backend == 'playwright':
+        from create_pdf_playwright import AsyncPlaywrightPdfRenderer
+        renderer = AsyncPlaywrightPdfRenderer(pages=concurrency)
+    elif backend == 'cdp':
+        from chrome_cdp import ChromeCDP
+        renderer = ChromeCDP()
+
+    async def run(markdown_path, out_pdf):
+        result = {'markdown': str(markdown_path), 'pdf': str(out_pdf), 'seconds': None, 'error': None}
+        start = time.perf_counter()
+        html_path = Path(out_pdf).with_suffix('.html')
+        try:
+            async with convert_slots:
+                await convert_markdown(markdown_path, html_path, css_file, executor)
+            async with print_slots:
+                await print_pdf(html_path, out_pdf, backend, renderer, executor)
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    try:
+        if renderer is not None:
+            await renderer.start()
+        return await asyncio.gather(*(run(markdown_path, out_pdf) for markdown_path, out_pdf in jobs))
+    finally:
+        if renderer is not None:
+            await renderer.close()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, executor.shutdown)
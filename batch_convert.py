@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Brrow Documentation Batch Converter
+Renders every Markdown report in the repo to HTML/PDF in parallel
+"""
+
+import argparse
+import atexit
+import contextlib
+import fnmatch
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import as_completed
+from pathlib import Path
+
+import render_workers
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DEFAULT_INCLUDE = ['*.md']
+DEFAULT_EXCLUDE = ['node_modules/*', '.*/*', 'Pods/*', 'docs_output/*']
+BACKENDS = ('auto', 'hedged', 'chrome', 'playwright', 'weasyprint', 'none')
+
+# Backends that render inside the worker process; the others drive Chrome,
+# which reserves far more address space than RLIMIT_AS can allow
+IN_PROCESS_BACKENDS = ('weasyprint', 'none')
+
+# Warm Playwright renderer owned by this worker process
+_playwright_renderer = None
+
+
+def _get_playwright_renderer():
+    """Return this worker's PlaywrightPdfRenderer, launching it on first use"""
+    global _playwright_renderer
+    if _playwright_renderer is None:
+        from create_pdf_playwright import PlaywrightPdfRenderer
+        _playwright_renderer = PlaywrightPdfRenderer().start()
+        atexit.register(_playwright_renderer.close)
+    return _playwright_renderer
+
+
+def discover_markdown_files(root, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE):
+    """
+    Find markdown files under root
+
+    Args:
+        root: Directory to search
+        include: Glob patterns relative to root (use "**/*.md" to recurse)
+        exclude: fnmatch patterns matched against the path relative to root
+
+    Returns:
+        Sorted list of matching paths
+    """
+    root = Path(root)
+    found = set()
+
+    for pattern in include:
+        for path in root.glob(pattern):
+            if not path.is_file():
+                continue
+            relative = path.relative_to(root).as_posix()
+            if any(fnmatch.fnmatch(relative, ex) for ex in exclude):
+                continue
+            found.add(path)
+
+    return sorted(found)
+
+
+def output_name(markdown_file, root):
+    """Output path under the output directory, without suffix: the file's path relative to root"""
+    return Path(markdown_file).relative_to(root).with_suffix('').as_posix()
+
+
+def convert_one(markdown_file, output_dir, css_file, backend, build_date=None, optimize=False, name=None,
+                cache_dir=None):
+    """
+    Convert a single markdown file; runs inside a worker process
+
+    With a build date ("YYYY-MM-DD") or SOURCE_DATE_EPOCH, outputs are
+    byte-identical across runs for unchanged input. With optimize, the PDF
+    is deduplicated, recompressed and linearized (see pdf_postprocess).
+    The document is titled after its first h1, or the file name without one.
+
+    Args:
+        name: Output path under output_dir without suffix, e.g.
+            "guides/setup" (default: the markdown file's stem)
+        cache_dir: Build and fragment cache directory (default:
+            BRROW_DOCS_CACHE_DIR or the repo's .docs_cache)
+
+    Returns:
+        Dict with the input path, outputs, per-stage timings and captured log
+    """
+    from docs_build_cache import BuildCache, FragmentCache
+    from docs_metrics import PipelineMetrics, quiet
+    import generate_pdf
+
+    markdown_file = Path(markdown_file)
+    pinned = generate_pdf.pinned_build_date(build_date)
+    build_date = generate_pdf.resolve_build_date(build_date)
+    output_base = Path(output_dir) / (name or markdown_file.stem)
+    output_base.parent.mkdir(parents=True, exist_ok=True)
+    output_html = output_base.with_name(f"{output_base.name}.html")
+    output_pdf = output_base.with_name(f"{output_base.name}.pdf")
+    with open(markdown_file, 'r', encoding='utf-8') as f:
+        title = generate_pdf.document_title(f, markdown_file.stem.replace('_', ' '))
+    result = {
+        'input': str(markdown_file),
+        'html': None,
+        'pdf': None,
+        'cached': False,
+        'backend': None if backend in ('auto', 'hedged') else backend,
+        'timings': {},
+    }
+    metrics = PipelineMetrics(document=markdown_file.name)
+    log = io.StringIO()
+    start = time.perf_counter()
+
+    with contextlib.redirect_stdout(log):
+        cache = BuildCache(cache_dir)
+        cache_key = cache.key_for_files(
+            markdown_file, css_file, generate_pdf.MARKDOWN_EXTRAS,
+            backend=f"{backend}+optimized" if optimize else backend,
+            renderer_version=generate_pdf.renderer_version(),
+            build_date=build_date.isoformat(), title=title
+        )
+        outputs = {'html': output_html}
+        if backend != 'none':
+            outputs['pdf'] = output_pdf
+
+        if cache.restore(cache_key, **outputs):
+            result.update(cached=True, html=str(output_html))
+            if 'pdf' in outputs:
+                result['pdf'] = str(output_pdf)
+        else:
+            # Highlighted code blocks are shared across reports and runs
+            highlighter = generate_pdf.CodeHighlighter(FragmentCache(cache_dir))
+            stage_start = time.perf_counter()
+            if markdown_file.stat().st_size > generate_pdf.STREAMING_THRESHOLD_BYTES:
+                convert_html = generate_pdf.convert_markdown_to_html_streaming
+                html_options = {}
+            else:
+                # Embed only the CSS rules this report can match
+                convert_html = generate_pdf.convert_markdown_to_html
+                html_options = {'prune_css': True}
+            convert_html(
+                markdown_file, output_html, css_file, progress=quiet, metrics=metrics, build_date=build_date,
+                highlighter=highlighter, title=title, **html_options
+            )
+            result['html'] = str(output_html)
+            result['timings']['html'] = time.perf_counter() - stage_start
+
+            pdf_path = None
+            if backend != 'none':
+                stage_start = time.perf_counter()
+                with metrics.stage('pdf', backend=backend) as stage:
+                    if backend == 'weasyprint':
+                        # Lay out the HTML written above with the worker's shared fonts and
+                        # parsed stylesheet instead of re-parsing its embedded (pruned) copy
+                        import convert_to_pdf
+                        renderer = convert_to_pdf.get_weasyprint_renderer(css_file)
+                        renderer.write_pdf(
+                            generate_pdf.strip_embedded_css(output_html.read_text(encoding='utf-8')), output_pdf,
+                            base_url=str(markdown_file.resolve()), stats=stage
+                        )
+                        pdf_path = output_pdf
+                    elif backend in ('auto', 'hedged'):
+                        from pdf_backends import BackendRegistry
+                        registry = BackendRegistry()
+                        if backend == 'hedged':
+                            result['backend'] = registry.render_hedged(output_html, output_pdf)
+                        else:
+                            result['backend'] = registry.render(output_html, output_pdf)
+                        stage['backend'] = result['backend']
+                        pdf_path = output_pdf if result['backend'] else None
+                    elif backend == 'chrome':
+                        pdf_path = generate_pdf.convert_html_to_pdf_chrome(output_html, output_pdf)
+                    elif backend == 'playwright':
+                        pdf_path = _get_playwright_renderer().render(output_html, output_pdf)
+                    # Browser backends stamp the time and a random ID
+                    if pdf_path and pinned and backend != 'weasyprint':
+                        generate_pdf.make_pdf_reproducible(pdf_path, build_date)
+                result['timings']['pdf'] = time.perf_counter() - stage_start
+
+                if not pdf_path:
+                    raise RuntimeError(f"{backend} did not produce a PDF")
+                result['pdf'] = str(pdf_path)
+
+                if optimize:
+                    from pdf_postprocess import optimize_pdf
+                    stage_start = time.perf_counter()
+                    with metrics.stage('pdf_optimize') as stage:
+                        stage.update(optimize_pdf(pdf_path))
+                    result['timings']['optimize'] = time.perf_counter() - stage_start
+
+            cache.store(cache_key, html=output_html, pdf=pdf_path)
+
+    result['timings']['total'] = time.perf_counter() - start
+    result['stages'] = metrics.records
+    result['log'] = log.getvalue()
+    return result
+
+
+def run_batch(markdown_files, output_dir, css_file, backend='auto', workers=None, memory_limit=None,
+              timeout=render_workers.DEFAULT_TIMEOUT, retries=render_workers.DEFAULT_RETRIES,
+              max_jobs_per_worker=render_workers.DEFAULT_MAX_JOBS_PER_WORKER, build_date=None, optimize=False,
+              root=None, cache_dir=None):
+    """
+    Convert markdown files in isolated render workers
+
+    A failure in one file is recorded and does not stop the others: a file
+    that times out, crashes its worker or exceeds the memory limit costs one
+    worker, which is replaced. Failed files are retried with backoff.
+
+    Args:
+        memory_limit: Per-worker address-space cap in bytes (ignored for
+            backends that drive Chrome)
+        timeout: Seconds per attempt before the worker is killed
+        retries: Extra attempts per file after a failure
+        max_jobs_per_worker: Recycle workers after this many files
+        build_date: Date for cover pages and PDF metadata ("YYYY-MM-DD";
+            default: SOURCE_DATE_EPOCH or today)
+        optimize: Deduplicate, recompress and linearize each PDF
+        root: Directory whose layout is mirrored under output_dir, so
+            same-named files in different folders do not collide
+            (default: the deepest directory containing every input)
+        cache_dir: Build and fragment cache directory shared by the workers
+            (default: BRROW_DOCS_CACHE_DIR or the repo's .docs_cache)
+
+    Returns:
+        Tuple of (results, failures) in input order; failures is a list of
+        {'input', 'error', 'traceback'} dicts
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    if backend not in IN_PROCESS_BACKENDS:
+        memory_limit = None
+    if root is None and markdown_files:
+        root = os.path.commonpath([Path(path).resolve().parent for path in markdown_files])
+    root = Path(root).resolve() if root is not None else None
+
+    results = []
+    failures = []
+
+    pool = render_workers.RenderWorkerPool(
+        workers=workers, memory_limit=memory_limit, timeout=timeout, retries=retries,
+        max_jobs_per_worker=max_jobs_per_worker,
+    )
+    with pool:
+        futures = {
+            pool.submit(convert_one, str(path), str(output_dir), str(css_file), backend, build_date, optimize,
+                        output_name(Path(path).resolve(), root), cache_dir): path
+            for path in markdown_files
+        }
+
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({
+                    'input': str(path),
+                    'error': f"{type(e).__name__}: {e}",
+                    'traceback': traceback.format_exc(),
+                })
+                print(f"✗ {path.name}: {type(e).__name__}: {e}")
+                continue
+
+            results.append(result)
+            status = "cached" if result['cached'] else f"{result['timings']['total']:.2f}s"
+            print(f"✓ {path.name} ({status})")
+
+    if pool.stats['retries'] or pool.stats['recycled']:
+        print(f"Workers: {pool.stats['retries']} retries, {pool.stats['timeouts']} timeouts, "
+              f"{pool.stats['crashed']} crashes, {pool.stats['recycled']} recycled")
+
+    # Completion order varies between runs; report in input order
+    order = {str(path): index for index, path in enumerate(markdown_files)}
+    results.sort(key=lambda result: order[result['input']])
+    failures.sort(key=lambda failure: order[failure['input']])
+    return results, failures
+
+
+def print_report(results, failures, elapsed):
+    """Print per-file timings and a summary"""
+    print("\n" + "=" * 70)
+    print(" BATCH SUMMARY")
+    print("=" * 70)
+
+    for result in sorted(results, key=lambda r: r['timings']['total'], reverse=True):
+        timings = result['timings']
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items() if name != 'total')
+        label = "cached" if result['cached'] else stages
+        if result['backend'] and not result['cached']:
+            label += f", {result['backend']}"
+        print(f"  {timings['total']:7.2f}s  {Path(result['input']).name}  ({label})")
+
+    for failure in failures:
+        print(f"  FAILED   {Path(failure['input']).name}: {failure['error']}")
+
+    print(f"\n{len(results)} converted, {len(failures)} failed in {elapsed:.2f}s")
+
+
+def main(argv=None):
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Render every markdown report to HTML/PDF in parallel")
+    parser.add_argument('root', nargs='?', default=str(BASE_DIR), help="directory to search (default: repo root)")
+    parser.add_argument('--include', action='append', help="glob pattern to include (repeatable, default: *.md)")
+    parser.add_argument('--exclude', action='append', help="pattern to exclude (repeatable)")
+    parser.add_argument('--output-dir', default=None, help="output directory (default: <root>/docs_output)")
+    parser.add_argument('--css', default=str(BASE_DIR / "pdf_styles.css"), help="stylesheet path")
+    parser.add_argument('--backend', choices=BACKENDS, default='auto', help="PDF backend, or 'none' for HTML only")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--timeout', type=float, default=render_workers.DEFAULT_TIMEOUT,
+                        help="seconds per file before its worker is killed (default: %(default)s)")
+    parser.add_argument('--retries', type=int, default=render_workers.DEFAULT_RETRIES,
+                        help="extra attempts for a failed file (default: %(default)s)")
+    parser.add_argument('--max-memory', type=int, default=None, metavar='MB',
+                        help="per-worker memory cap in MB (weasyprint/none backends only)")
+    parser.add_argument('--jobs-per-worker', type=int, default=render_workers.DEFAULT_MAX_JOBS_PER_WORKER,
+                        help="recycle a worker after this many files (default: %(default)s)")
+    parser.add_argument('--build-date', default=None, metavar='YYYY-MM-DD',
+                        help="date for cover pages and PDF metadata (default: SOURCE_DATE_EPOCH or today)")
+    parser.add_argument('--optimize-pdf', action='store_true',
+                        help="deduplicate, recompress and linearize PDFs (fast web view)")
+    parser.add_argument('--metrics', default=None,
+                        help="write per-stage metrics as JSON lines (or a Chrome trace if the path ends in .json)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="build cache directory (default: $BRROW_DOCS_CACHE_DIR or <repo>/.docs_cache)")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root)
+    output_dir = Path(args.output_dir) if args.output_dir else root / "docs_output"
+    include = args.include or DEFAULT_INCLUDE
+    exclude = DEFAULT_EXCLUDE + (args.exclude or [])
+
+    markdown_files = discover_markdown_files(root, include, exclude)
+    if not markdown_files:
+        print(f"No markdown files found under {root}")
+        return 1
+
+    print(f"Converting {len(markdown_files)} markdown files with backend '{args.backend}'...")
+
+    start = time.perf_counter()
+    memory_limit = args.max_memory * 1024 * 1024 if args.max_memory else None
+    results, failures = run_batch(
+        markdown_files, output_dir, args.css, args.backend, args.workers, memory_limit=memory_limit,
+        timeout=args.timeout, retries=args.retries, max_jobs_per_worker=args.jobs_per_worker,
+        build_date=args.build_date, optimize=args.optimize_pdf, root=root, cache_dir=args.cache_dir,
+    )
+    print_report(results, failures, time.perf_counter() - start)
+
+    if args.metrics:
+        from docs_metrics import PipelineMetrics
+        metrics = PipelineMetrics()
+        for result in results:
+            metrics.records.extend(result['stages'])
+        metrics.write(args.metrics)
+        print(f"Metrics written to {args.metrics}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
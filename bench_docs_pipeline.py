@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Brrow Documentation Pipeline Benchmarks
+Times each stage on synthetic Markdown corpora shaped like
+BRROW_COMPLETE_SYSTEM_DOCUMENTATION.md and compares against a saved baseline
+
+Usage:
+    python3 bench_docs_pipeline.py --save-baseline bench_baseline.json
+    python3 bench_docs_pipeline.py --compare bench_baseline.json
+    python3 bench_docs_pipeline.py --full   # include 10 MB and 50 MB corpora
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DEFAULT_SIZES = ['10KB', '100KB', '1MB']
+FULL_SIZES = DEFAULT_SIZES + ['10MB', '50MB']
+DEFAULT_REPEAT = 3
+DEFAULT_PDF_MAX_BYTES = 1024 * 1024
+DEFAULT_THRESHOLD = 0.15
+
+WORDS = (
+    "brrow listing rental borrow lend user payment stripe webhook archive "
+    "message notification backend endpoint database railway firebase token "
+    "session verify profile marketplace garage sale offer checkout escrow "
+    "the a of to and in for with on is that by this be are from as it"
+).split()
+
+CODE_SAMPLES = {
+    'swift': '''struct Listing: Codable {
+    let id: String
+    let title: String
+    let price: Double
+}
+
+func fetchListings() async throws -> [Listing] {
+    let (data, _) = try await URLSession.shared.data(from: endpoint)
+    return try JSONDecoder().decode([Listing].self, from: data)
+}''',
+    'javascript': '''router.post('/api/listings', authenticate, async (req, res) => {
+  const listing = await prisma.listing.create({ data: req.body });
+  res.status(201).json({ success: true, listing });
+});''',
+    'bash': '''#!/bin/bash
+set -euo pipefail
+xcodebuild -workspace Brrow.xcworkspace -scheme Brrow archive
+echo "Archive complete"''',
+    'sql': '''SELECT l.id, l.title, COUNT(f.id) AS favorites
+FROM listings l
+LEFT JOIN favorites f ON f.listing_id = l.id
+GROUP BY l.id
+ORDER BY favorites DESC;''',
+    'json': '''{
+  "success": true,
+  "data": { "id": "lst_123", "status": "AVAILABLE", "price": 25.0 }
+}''',
+}
+
+
+def parse_size(text):
+    """Parse sizes like '10KB', '1MB' or '2048' into bytes"""
+    text = text.strip().upper()
+    for suffix, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024), ('B', 1)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
+
+
+def _sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _section(rng, part, chapter):
+    """Generate one H2 chapter with the block mix of the real documentation"""
+    lines = [f"## {part}.{chapter} {_sentence(rng, 4)[:-1].title()}", ""]
+
+    for sub in range(rng.randint(2, 4)):
+        lines += [f"### {part}.{chapter}.{sub + 1} {_sentence(rng, 3)[:-1].title()}", ""]
+        lines += [' '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5))), ""]
+
+        block = rng.random()
+        if block < 0.35:
+            language = rng.choice(list(CODE_SAMPLES))
+            lines += [f"```{language}", CODE_SAMPLES[language], "```", ""]
+        elif block < 0.55:
+            lines += ["| Field | Type | Description |", "|-------|------|-------------|"]
+            for _ in range(rng.randint(3, 8)):
+                lines.append(f"| `{rng.choice(WORDS)}` | {rng.choice(['String', 'Int', 'Bool'])} | {_sentence(rng, 6)} |")
+            lines.append("")
+        elif block < 0.75:
+            for _ in range(rng.randint(3, 6)):
+                mark = rng.choice([' ', 'x'])
+                lines.append(f"- [{mark}] {_sentence(rng, 6)}")
+            lines.append("")
+        else:
+            for _ in range(rng.randint(3, 6)):
+                lines.append(f"- **{rng.choice(WORDS).title()}**: {_sentence(rng, 8)}")
+            lines.append("")
+
+    lines += ["---", ""]
+    return '\n'.join(lines)
+
+
+def generate_corpus(target_bytes, seed=0):
+    """
+    Generate a deterministic synthetic markdown document of about target_bytes
+
+    Mirrors the real documentation: H1 parts, H2 chapters, H3 sections,
+    paragraphs, fenced code in several languages, tables, task lists and
+    bullet lists.
+    """
+    rng = random.Random(seed)
+    chunks = ["# Brrow Synthetic Documentation\n\n", _sentence(rng, 20), "\n\n---\n\n"]
+    size = sum(len(chunk) for chunk in chunks)
+    part = 0
+
+    while size < target_bytes:
+        part += 1
+        heading = f"# Part {part}: {_sentence(rng, 3)[:-1].title()}\n\n"
+        chunks.append(heading)
+        size += len(heading)
+        for chapter in range(1, rng.randint(4, 8) + 1):
+            section = _section(rng, part, chapter) + '\n'
+            chunks.append(section)
+            size += len(section)
+            if size >= target_bytes:
+                break
+
+    return ''.join(chunks)
+
+
+def time_call(func, repeat):
+    """Run func repeat times; returns (last result, list of seconds)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def summarize(samples):
+    """Statistics for a list of timings"""
+    return {
+        'runs': len(samples),
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'max': max(samples),
+    }
+
+
+def bench_size(size_label, repeat, pdf_max_bytes, work_dir, seed=0):
+    """Benchmark every stage on one corpus size; returns {stage: stats}"""
+    import generate_pdf
+    from pdf_backends import BackendRegistry
+
+    source = generate_corpus(parse_size(size_label), seed)
+    results = {}
+
+    def record(stage, samples):
+        results[stage] = summarize(samples)
+        print(f"  {stage:<24} median {results[stage]['median'] * 1000:10.2f} ms")
+
+    html, samples = time_call(lambda: generate_pdf.markdown_to_html(source), repeat)
+    record('markdown', samples)
+
+    _, samples = time_call(lambda: generate_pdf.render_markdown_parallel(source), repeat)
+    record('markdown_parallel', samples)
+
+    toc_items, samples = time_call(lambda: generate_pdf.extract_toc(source), repeat)
+    record('extract_toc', samples)
+
+    toc_html, samples = time_call(lambda: generate_pdf.generate_toc_html(toc_items), repeat)
+    record('generate_toc_html', samples)
+
+    markdown_file = Path(work_dir) / f"corpus_{size_label}.md"
+    html_file = Path(work_dir) / f"corpus_{size_label}.html"
+    markdown_file.write_text(source, encoding='utf-8')
+    css_file = BASE_DIR / "pdf_styles.css"
+    document = f"<html><head></head><body>{toc_html}{html}</body></html>"
+
+    def write_html():
+        with open(html_file, 'w', encoding='utf-8') as f:
+            f.write(document)
+
+    _, samples = time_call(write_html, repeat)
+    record('html_write', samples)
+
+    if len(source) > pdf_max_bytes:
+        print(f"  (PDF backends skipped: corpus larger than {pdf_max_bytes} bytes)")
+        return results
+
+    # Full document for the PDF backends
+    from docs_metrics import quiet
+    generate_pdf.convert_markdown_to_html(markdown_file, html_file, css_file, progress=quiet)
+
+    # Probe state stays in the scratch directory, away from the build cache
+    registry = BackendRegistry(Path(work_dir) / "backends.json")
+    available = registry.ordered()
+    if not available:
+        print("  (PDF backends skipped: none available on this host)")
+
+    for backend, probe in available:
+        pdf_file = Path(work_dir) / f"corpus_{size_label}.{backend.name}.pdf"
+        try:
+            _, samples = time_call(
+                lambda: backend.run(probe['binary'], html_file.resolve(), pdf_file), repeat
+            )
+        except Exception as e:
+            print(f"  pdf:{backend.name:<20} failed: {type(e).__name__}: {e}")
+            continue
+        record(f'pdf:{backend.name}', samples)
+
+    return results
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare median timings against a baseline
+
+    Returns:
+        List of (size, stage, baseline_median, current_median) regressions
+        slower than baseline by more than threshold (a fraction)
+    """
+    regressions = []
+    for size, stages in current['results'].items():
+        for stage, stats in stages.items():
+            previous = baseline.get('results', {}).get(size, {}).get(stage)
+            if not previous:
+                continue
+            if stats['median'] > previous['median'] * (1 + threshold):
+                regressions.append((size, stage, previous['median'], stats['median']))
+    return regressions
+
+
+def main(argv=None):
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark the documentation pipeline on synthetic corpora")
+    parser.add_argument('--sizes', nargs='+', default=None, help="corpus sizes, e.g. 10KB 1MB (default: 10KB 100KB 1MB)")
+    parser.add_argument('--full', action='store_true', help="benchmark 10KB up to 50MB")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per stage")
+    parser.add_argument('--seed', type=int, default=0, help="corpus generator seed")
+    parser.add_argument('--pdf-max-bytes', type=parse_size, default=DEFAULT_PDF_MAX_BYTES,
+                        help="skip PDF backends for larger corpora (default: 1MB)")
+    parser.add_argument('--output', default=None, help="write results JSON to this path")
+    parser.add_argument('--save-baseline', default=None, help="write results as the new baseline")
+    parser.add_argument('--compare', default=None, help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before a stage counts as a regression (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)
+
+    import markdown2
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'markdown2': markdown2.__version__,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="brrow-bench-") as work_dir:
+        for size in sizes:
+            print(f"\nCorpus {size}:")
+            report['results'][size] = bench_size(size, args.repeat, args.pdf_max_bytes, work_dir, args.seed)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+            print(f"\nResults written to {path}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for size, stage, before, after in regressions:
+                print(f"  {size:>6} {stage:<24} {before * 1000:9.2f} ms -> {after * 1000:9.2f} ms")
+            return 1
+        print(f"\n✓ No regressions over {args.threshold:.0%} against {args.compare}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Brrow Documentation CLI
+One entry point for the documentation pipeline: brrow-docs build|html|pdf|batch|serve|startup
+Each subcommand imports only the engines it uses, so --help and cheap runs start fast
+
+Usage:
+    python3 brrow_docs.py html REPORT.md -o REPORT.html
+    python3 brrow_docs.py pdf REPORT.md --backend weasyprint --workers 4
+    python3 brrow_docs.py build REPORT.md --output-dir docs_output
+    python3 brrow_docs.py batch --backend none
+    python3 brrow_docs.py serve --port 8765
+    python3 brrow_docs.py startup --budget-ms 50
+"""
+
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DEFAULT_CSS = BASE_DIR / "pdf_styles.css"
+PDF_BACKENDS = ('auto', 'hedged', 'weasyprint', 'chrome', 'playwright', 'wkhtmltopdf', 'cupsfilter')
+BUILD_BACKENDS = ('auto', 'hedged', 'chrome', 'playwright', 'weasyprint', 'none')
+
+# Import-time budget for cheap invocations (--help), in milliseconds
+STARTUP_BUDGET_MS = 50
+# Modules that must never be imported by a cheap invocation
+HEAVY_MODULES = ('markdown2', 'weasyprint', 'pygments', 'playwright', 'pypdf', 'generate_pdf', 'multiprocessing')
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def _metrics(args):
+    """PipelineMetrics for a run, tracing memory only when metrics are written"""
+    from docs_metrics import PipelineMetrics
+    return PipelineMetrics(trace_memory=bool(args.metrics), document=Path(args.input).name)
+
+
+def _write_metrics(args, metrics):
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f"Metrics written to {args.metrics}")
+
+
+def _toc_depth(args):
+    """--toc-depth, or generate_pdf.TOC_DEPTH (read after the engine is imported)"""
+    import generate_pdf
+    return args.toc_depth or generate_pdf.TOC_DEPTH
+
+
+def cmd_html(args):
+    """Convert one markdown file to a styled HTML document"""
+    import generate_pdf
+
+    from docs_build_cache import FragmentCache
+
+    markdown_file = Path(args.input)
+    output_html = Path(args.output) if args.output else markdown_file.with_suffix('.html')
+    metrics = _metrics(args)
+    highlighter = generate_pdf.CodeHighlighter(FragmentCache())
+
+    if args.streaming or markdown_file.stat().st_size > generate_pdf.STREAMING_THRESHOLD_BYTES:
+        generate_pdf.convert_markdown_to_html_streaming(
+            markdown_file, output_html, args.css, metrics=metrics, build_date=args.build_date,
+            highlighter=highlighter, toc_depth=_toc_depth(args)
+        )
+    else:
+        generate_pdf.convert_markdown_to_html(
+            markdown_file, output_html, args.css, metrics=metrics, workers=args.workers, build_date=args.build_date,
+            highlighter=highlighter, prune_css=not args.full_css, toc_depth=_toc_depth(args)
+        )
+
+    _write_metrics(args, metrics)
+    return 0
+
+
+def cmd_pdf(args):
+    """Convert one markdown file to PDF (the HTML is kept next to the PDF)"""
+    markdown_file = Path(args.input)
+    output_pdf = Path(args.output) if args.output else markdown_file.with_suffix('.pdf')
+    metrics = _metrics(args)
+
+    if args.backend == 'weasyprint':
+        import convert_to_pdf
+        pdf_path = convert_to_pdf.convert_markdown_to_pdf(
+            markdown_file, output_pdf, args.css, metrics=metrics, workers=args.workers, build_date=args.build_date,
+            prune_css=not args.full_css, toc_depth=_toc_depth(args), optimize=args.optimize
+        )
+    else:
+        import generate_pdf
+        from pdf_backends import BackendRegistry, get_backend
+
+        output_html = output_pdf.with_suffix('.html')
+        generate_pdf.convert_markdown_to_html(
+            markdown_file, output_html, args.css, metrics=metrics, workers=args.workers, build_date=args.build_date,
+            prune_css=not args.full_css, toc_depth=_toc_depth(args)
+        )
+        registry = None
+        if args.backend not in ('auto', 'hedged'):
+            registry = BackendRegistry(backends=[get_backend(args.backend)])
+        pdf_path = generate_pdf.convert_html_to_pdf(
+            output_html, output_pdf, registry=registry, hedge=args.backend == 'hedged', metrics=metrics,
+            build_date=args.build_date, optimize=args.optimize
+        )
+
+    _write_metrics(args, metrics)
+    return 0 if pdf_path else 1
+
+
+def cmd_build(args):
+    """HTML and PDF for one file, restored from the build cache when inputs are unchanged"""
+    from batch_convert import convert_one
+
+    output_dir = Path(args.output_dir) if args.output_dir else Path(args.input).resolve().parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        result = convert_one(args.input, output_dir, args.css, args.backend, args.build_date, args.optimize,
+                             cache_dir=args.cache_dir)
+    except Exception as e:
+        print(f"✗ Build failed: {type(e).__name__}: {e}")
+        return 1
+
+    if result['log']:
+        print(result['log'], end='')
+    if result['cached']:
+        print("Inputs unchanged, restored from build cache")
+    for kind in ('html', 'pdf'):
+        if result[kind]:
+            print(f"✓ {kind.upper()}: {result[kind]}")
+    print(f"Done in {result['timings']['total']:.2f}s")
+    return 0 if result['html'] and (result['pdf'] or args.backend == 'none') else 1
+
+
+def cmd_batch(argv):
+    """Delegate to batch_convert's CLI"""
+    import batch_convert
+    return batch_convert.main(argv)
+
+
+def cmd_serve(argv):
+    """Delegate to docs_render_server's CLI"""
+    import docs_render_server
+    return docs_render_server.main(argv)
+
+
+# Subcommands whose arguments are passed through to another script's CLI
+FORWARDED_COMMANDS = {
+    'batch': (cmd_batch, "render every markdown report (see batch_convert.py --help)"),
+    'serve': (cmd_serve, "run the local render server (see docs_render_server.py --help)"),
+}
+
+
+def measure_startup(argv=('--help',)):
+    """
+    Measure the import cost of a CLI invocation with python -X importtime
+
+    Args:
+        argv: Arguments passed to this script
+
+    Returns:
+        Tuple of (total import milliseconds, {top-level module: milliseconds})
+    """
+    import subprocess
+
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(Path(__file__).resolve()), *argv],
+        capture_output=True, text=True,
+    )
+    modules = {}
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        # Top-level imports are indented by a single space
+        if match and len(match.group(3)) == 1:
+            modules[match.group(4)] = int(match.group(2)) / 1000
+    return sum(modules.values()), modules
+
+
+def cmd_startup(args):
+    """Report import time of a cheap invocation against the budget"""
+    argv = args.rest or ['--help']
+    total_ms, modules = measure_startup(argv)
+
+    print(f"Import time for 'brrow-docs {' '.join(argv)}': {total_ms:.1f} ms (budget {args.budget_ms} ms)")
+    for name, ms in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:7.1f} ms  {name}")
+
+    heavy = sorted(name for name in modules if name.split('.')[0] in HEAVY_MODULES)
+    if heavy:
+        print(f"✗ Heavy modules imported: {', '.join(heavy)}")
+    if total_ms > args.budget_ms:
+        print("✗ Over budget")
+    if heavy or total_ms > args.budget_ms:
+        return 1
+    print("✓ Within budget")
+    return 0
+
+
+def build_parser():
+    """Argument parser for every subcommand"""
+    parser = argparse.ArgumentParser(prog='brrow-docs', description="Brrow documentation pipeline")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(sub):
+        sub.add_argument('input', help="markdown file")
+        sub.add_argument('--css', default=str(DEFAULT_CSS), help="stylesheet path")
+        sub.add_argument('--build-date', default=None, metavar='YYYY-MM-DD',
+                         help="date for the cover page and PDF metadata (default: SOURCE_DATE_EPOCH or today)")
+        sub.add_argument('--full-css', action='store_true', help="keep CSS rules that match nothing in the document")
+
+    html = subparsers.add_parser('html', help="markdown to HTML")
+    add_common(html)
+    html.add_argument('-o', '--output', help="output HTML (default: input with .html)")
+    html.add_argument('--workers', type=int, default=None, help="convert h1 sections in parallel")
+    html.add_argument('--toc-depth', type=int, choices=range(1, 7), default=None, metavar='{1-6}',
+                      help="deepest header level in the TOC and PDF outline (default: generate_pdf.TOC_DEPTH)")
+    html.add_argument('--streaming', action='store_true', help="convert block by block in bounded memory")
+    html.add_argument('--metrics', default=None, help="write per-stage metrics (JSON lines or .json trace)")
+    html.set_defaults(func=cmd_html)
+
+    pdf = subparsers.add_parser('pdf', help="markdown to PDF")
+    add_common(pdf)
+    pdf.add_argument('-o', '--output', help="output PDF (default: input with .pdf)")
+    pdf.add_argument('--backend', choices=PDF_BACKENDS, default='auto', help="PDF engine (default: %(default)s)")
+    pdf.add_argument('--workers', type=int, default=None,
+                     help="parallel markdown conversion, and chapter shards with weasyprint")
+    pdf.add_argument('--toc-depth', type=int, choices=range(1, 7), default=None, metavar='{1-6}',
+                     help="deepest header level in the TOC and PDF outline (default: generate_pdf.TOC_DEPTH)")
+    pdf.add_argument('--optimize', action='store_true',
+                     help="deduplicate, recompress and linearize the PDF (fast web view)")
+    pdf.add_argument('--metrics', default=None, help="write per-stage metrics (JSON lines or .json trace)")
+    pdf.set_defaults(func=cmd_pdf)
+
+    build = subparsers.add_parser('build', help="HTML and PDF with the build cache")
+    add_common(build)
+    build.add_argument('--output-dir', default=None, help="output directory (default: next to the input)")
+    build.add_argument('--backend', choices=BUILD_BACKENDS, default='auto', help="PDF engine, or 'none' for HTML only")
+    build.add_argument('--optimize', action='store_true',
+                       help="deduplicate, recompress and linearize the PDF (fast web view)")
+    build.add_argument('--cache-dir', default=None,
+                       help="build cache directory (default: $BRROW_DOCS_CACHE_DIR or <repo>/.docs_cache)")
+    build.set_defaults(func=cmd_build)
+
+    # Listed for --help only; main() dispatches them before parsing
+    for name, (_, help_text) in FORWARDED_COMMANDS.items():
+        subparsers.add_parser(name, help=help_text, add_help=False)
+
+    startup = subparsers.add_parser('startup', help="check import time of a cheap invocation")
+    startup.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS, help="budget (default: %(default)s)")
+    startup.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    startup.add_argument('rest', nargs=argparse.REMAINDER, help="arguments to measure (default: --help)")
+    startup.set_defaults(func=cmd_startup)
+
+    return parser
+
+
+def main(argv=None):
+    """Main function"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in FORWARDED_COMMANDS:
+        return FORWARDED_COMMANDS[argv[0]][0](argv[1:])
+
+    args = build_parser().parse_args(argv)
+    try:
+        status = args.func(args)
+        # Flush here so a closed pipe is reported below, not at interpreter exit
+        sys.stdout.flush()
+        return status
+    except BrokenPipeError:
+        # Output piped to a reader that exited early (e.g. head); stop writing
+        # to it so the final flush at exit stays quiet
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
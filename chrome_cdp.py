@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Long-lived headless Chrome driven over the DevTools protocol
+Stdlib-only (asyncio + --remote-debugging-pipe) alternative to Playwright
+
+Usage:
+    async with ChromeCDP() as chrome:
+        await chrome.print_to_pdf("REPORT.html", "REPORT.pdf")
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pdf_backends import get_backend
+
+CM = 1 / 2.54
+
+# Matches PDF_OPTIONS in create_pdf_playwright.py (A4, 2.5cm/2cm margins)
+PRINT_OPTIONS = {
+    'paperWidth': 21.0 * CM,
+    'paperHeight': 29.7 * CM,
+    'marginTop': 2.5 * CM,
+    'marginBottom': 2.5 * CM,
+    'marginLeft': 2 * CM,
+    'marginRight': 2 * CM,
+    'printBackground': True,
+    'preferCSSPageSize': False,
+    'displayHeaderFooter': False,
+}
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+MESSAGE_LIMIT = 256 * 1024 * 1024
+DEFAULT_TIMEOUT = 60
+
+
+class CDPError(Exception):
+    """Error response from the DevTools protocol"""
+
+
+class ChromeCDP:
+    """
+    Headless Chrome started once and driven over the DevTools pipe
+
+    Chrome reads NUL-terminated JSON commands from fd 3 and writes responses
+    and events to fd 4. Each print opens its own target (tab) on a flattened
+    session, so several documents can print concurrently on one browser.
+    PDFs are streamed back with transferMode=ReturnAsStream and written to
+    disk chunk by chunk.
+    """
+
+    def __init__(self, chrome_path=None, extra_args=(), timeout=DEFAULT_TIMEOUT):
+        self.chrome_path = chrome_path
+        self.extra_args = list(extra_args)
+        self.timeout = timeout
+        self._process = None
+        self._profile_dir = None
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._next_id = 0
+        self._pending = {}
+        self._event_waiters = {}
+
+    async def start(self):
+        """Launch Chrome and connect to its DevTools pipe"""
+        if self._process is not None:
+            return self
+
+        chrome_path = self.chrome_path or get_backend('chrome').find_binary()
+        if not chrome_path:
+            raise RuntimeError("Chrome not found")
+
+        self._profile_dir = tempfile.mkdtemp(prefix="brrow-cdp-")
+        args = [
+            chrome_path,
+            '--headless',
+            '--remote-debugging-pipe',
+            '--disable-gpu',
+            '--no-first-run',
+            '--no-default-browser-check',
+            f'--user-data-dir={self._profile_dir}',
+            *self.extra_args,
+            'about:blank',
+        ]
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            args.insert(1, '--no-sandbox')
+
+        # Chrome expects its command pipe on fd 3 and its reply pipe on fd 4
+        to_chrome_read, to_chrome_write = os.pipe()
+        from_chrome_read, from_chrome_write = os.pipe()
+
+        def attach_pipes():
+            os.dup2(to_chrome_read, 3)
+            os.dup2(from_chrome_write, 4)
+
+        self._process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            preexec_fn=attach_pipes,
+            pass_fds=(3, 4),
+        )
+        os.close(to_chrome_read)
+        os.close(from_chrome_write)
+
+        loop = asyncio.get_running_loop()
+        self._reader = asyncio.StreamReader(limit=MESSAGE_LIMIT)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._reader), os.fdopen(from_chrome_read, 'rb', 0)
+        )
+        self._writer, _ = await loop.connect_write_pipe(asyncio.Protocol, os.fdopen(to_chrome_write, 'wb', 0))
+        self._reader_task = asyncio.create_task(self._read_messages())
+
+        await self.send('Target.setDiscoverTargets', {'discover': False})
+        return self
+
+    async def _read_messages(self):
+        try:
+            while True:
+                raw = await self._reader.readuntil(b'\0')
+                self._dispatch(json.loads(raw[:-1]))
+        except (asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            # Nothing will answer now; fail every command and event still waiting
+            error = CDPError("Chrome closed the DevTools pipe")
+            waiting = list(self._pending.values())
+            for futures in self._event_waiters.values():
+                waiting.extend(futures)
+            for future in waiting:
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+            self._event_waiters.clear()
+
+    def _dispatch(self, message):
+        if 'id' in message:
+            future = self._pending.pop(message['id'], None)
+            if future is None or future.done():
+                return
+            if 'error' in message:
+                future.set_exception(CDPError(f"{message['error'].get('message')} ({message['error'].get('code')})"))
+            else:
+                future.set_result(message.get('result', {}))
+            return
+
+        key = (message.get('sessionId'), message.get('method'))
+        for future in self._event_waiters.pop(key, []):
+            if not future.done():
+                future.set_result(message.get('params', {}))
+
+    async def send(self, method, params=None, session_id=None):
+        """Send a DevTools command and return its result"""
+        if self._reader_task is not None and self._reader_task.done():
+            raise CDPError("Chrome closed the DevTools pipe")
+        self._next_id += 1
+        message_id = self._next_id
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            self._writer.write(json.dumps(message).encode('utf-8') + b'\0')
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            # A reply that never came (timeout, cancellation) must not pin the future
+            self._pending.pop(message_id, None)
+
+    def expect_event(self, method, session_id=None):
+        """Return a future resolved by the next matching event; call before triggering it"""
+        future = asyncio.get_running_loop().create_future()
+        if self._reader_task is not None and self._reader_task.done():
+            future.set_exception(CDPError("Chrome closed the DevTools pipe"))
+        else:
+            self._event_waiters.setdefault((session_id, method), []).append(future)
+        return future
+
+    async def _read_stream(self, handle, pdf_file):
+        """Copy a DevTools IO stream to disk chunk by chunk"""
+        with open(pdf_file, 'wb') as f:
+            while True:
+                chunk = await self.send('IO.read', {'handle': handle, 'size': STREAM_CHUNK_SIZE})
+                data = chunk.get('data', '')
+                f.write(base64.b64decode(data) if chunk.get('base64Encoded') else data.encode('latin-1'))
+                if chunk.get('eof'):
+                    break
+        await self.send('IO.close', {'handle': handle})
+
+    async def print_to_pdf(self, html_file, pdf_file, options=None):
+        """
+        Print an HTML file to PDF in a fresh tab
+
+        Args:
+            html_file: Path to input HTML file
+            pdf_file: Path to output PDF file
+            options: Page.printToPDF parameters overriding PRINT_OPTIONS
+        """
+        if self._process is None:
+            await self.start()
+
+        target = await self.send('Target.createTarget', {'url': 'about:blank'})
+        target_id = target['targetId']
+        try:
+            attached = await self.send('Target.attachToTarget', {'targetId': target_id, 'flatten': True})
+            session = attached['sessionId']
+
+            await self.send('Page.enable', session_id=session)
+            loaded = self.expect_event('Page.loadEventFired', session)
+            try:
+                await self.send('Page.navigate', {'url': Path(html_file).resolve().as_uri()}, session)
+                await asyncio.wait_for(loaded, self.timeout)
+            finally:
+                self._event_waiters.pop((session, 'Page.loadEventFired'), None)
+
+            await self.send('Runtime.evaluate', {
+                'expression': 'document.fonts.ready.then(() => true)',
+                'awaitPromise': True,
+            }, session)
+
+            params = dict(PRINT_OPTIONS, **(options or {}))
+            params['transferMode'] = 'ReturnAsStream'
+            printed = await self.send('Page.printToPDF', params, session)
+            await self._read_stream(printed['stream'], pdf_file)
+        finally:
+            try:
+                await self.send('Target.closeTarget', {'targetId': target_id})
+            except CDPError:
+                pass
+        return pdf_file
+
+    async def close(self):
+        """Close the browser and clean up its profile directory"""
+        if self._process is None:
+            return
+        try:
+            await asyncio.wait_for(self.send('Browser.close'), 5)
+        except (CDPError, asyncio.TimeoutError):
+            pass
+        try:
+            await asyncio.wait_for(self._process.wait(), 5)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            await self._process.wait()
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        shutil.rmtree(self._profile_dir, ignore_errors=True)
+        self._process = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+async def print_many(html_files, output_dir, concurrency=4):
+    """Print HTML files to PDFs in output_dir on one warm browser"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    slots = asyncio.Semaphore(concurrency)
+
+    async with ChromeCDP() as chrome:
+        async def print_one(html_file):
+            pdf_file = output_dir / f"{Path(html_file).stem}.pdf"
+            start = time.perf_counter()
+            async with slots:
+                await chrome.print_to_pdf(html_file, pdf_file)
+            print(f"✓ {pdf_file} ({time.perf_counter() - start:.2f}s)")
+            return pdf_file
+
+        return await asyncio.gather(*(print_one(html_file) for html_file in html_files))
+
+
+def main(argv=None):
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Print HTML files to PDF over the Chrome DevTools protocol")
+    parser.add_argument('html_files', nargs='+', help="HTML files to print")
+    parser.add_argument('--output-dir', default='.', help="directory for the PDFs")
+    parser.add_argument('--concurrency', type=int, default=4, help="tabs printing at once")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    pdfs = asyncio.run(print_many(args.html_files, args.output_dir, args.concurrency))
+    print(f"\n{len(pdfs)} PDFs in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,88 +4,240 @@ Brrow Documentation Markdown to PDF Converter
 Professional PDF generation with Brrow brand colors and styling
 """
 
-import markdown2
-import re
+import collections
+import hashlib
+import os
+import threading
 from pathlib import Path
-from datetime import datetime
-from weasyprint import HTML, CSS
-
-def extract_toc(markdown_content):
-    """Extract table of contents from markdown headers"""
-    lines = markdown_content.split('\n')
-    toc_items = []
-
-    for line in lines:
-        # Match headers (h1-h3 for TOC)
-        match = re.match(r'^(#{1,3})\s+(.+)$', line)
-        if match:
-            level = len(match.group(1))
-            title = match.group(2)
-            # Create anchor-friendly ID
-            anchor_id = re.sub(r'[^\w\s-]', '', title.lower())
-            anchor_id = re.sub(r'[-\s]+', '-', anchor_id)
-            toc_items.append({
-                'level': level,
-                'title': title,
-                'anchor': anchor_id
-            })
-
-    return toc_items
-
-def add_anchors_to_headers(html_content):
-    """Add ID anchors to headers for TOC linking"""
-    def replace_header(match):
-        tag = match.group(1)
-        content = match.group(2)
-        # Create anchor-friendly ID from content
-        anchor_id = re.sub(r'[^\w\s-]', '', content.lower())
-        anchor_id = re.sub(r'[-\s]+', '-', anchor_id)
-        anchor_id = re.sub(r'<[^>]+>', '', anchor_id)  # Remove HTML tags
-        return f'<{tag} id="{anchor_id}">{content}</{tag}>'
-
-    # Replace h1, h2, h3 tags
-    html_content = re.sub(r'<(h[1-3])>(.*?)</\1>', replace_header, html_content)
-    return html_content
-
-def generate_toc_html(toc_items):
-    """Generate HTML table of contents"""
-    toc_html = '''
-    <div class="toc">
-        <h1>Table of Contents</h1>
-        <ul>
-    '''
 
-    current_level = 0
-    for item in toc_items:
-        level = item['level']
+import css_prune
+from docs_build_cache import BuildCache
+from docs_metrics import PipelineMetrics, quiet
+from generate_pdf import (TOC_DEPTH, CodeHighlighter, bookmark_css, create_cover_page, extract_toc,
+                          generate_toc_html, markdown_to_html, read_css, renderer_version, resolve_build_date)
+from pdf_postprocess import format_report, optimize_pdf
+
+# markdown2 extras used for every conversion (also part of the build cache key)
+MARKDOWN_EXTRAS = [
+    'fenced-code-blocks',
+    'tables',
+    'code-friendly',
+    'cuddled-lists',
+    'header-ids',
+    'task_list',
+    'strike',
+    'target-blank-links',
+    'numbering',
+]
+
+# Parsed stylesheets (full and per-document pruned) kept per renderer
+MAX_PARSED_STYLESHEETS = 32
+# Images and fetched resources kept per renderer
+MAX_CACHED_IMAGES = 256
+
+
+class ImageCache(collections.OrderedDict):
+    """
+    WeasyPrint image/URL cache that keeps the max_entries most recently used
+    items, so a long batch does not hold every image it has ever laid out
+    """
 
-        # Only include h1 and h2 in TOC for cleaner look
-        if level > 2:
-            continue
+    def __init__(self, max_entries=MAX_CACHED_IMAGES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
 
-        indent = '&nbsp;' * (level - 1) * 4
-        toc_html += f'''
-            <li>{indent}<a href="#{item['anchor']}">{item['title']}</a></li>
-        '''
+    def __getitem__(self, key):
+        with self._lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
 
-    toc_html += '''
-        </ul>
-    </div>
-    '''
-    return toc_html
-
-def create_cover_page():
-    """Generate cover page HTML"""
-    current_date = datetime.now().strftime("%B %d, %Y")
-    return f'''
-    <div class="cover-page">
-        <h1>Brrow</h1>
-        <div class="subtitle">Complete System Documentation</div>
-        <div class="date">Generated on {current_date}</div>
-    </div>
-    '''
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+
+
+def size_options(weasyprint):
+    """
+    write_pdf() options that subset fonts and optimize images
+
+    WeasyPrint 59 replaced optimize_size=('fonts', 'images') with
+    optimize_images (fonts are subset by default) and rejects the old name.
+    """
+    if 'optimize_images' in getattr(weasyprint, 'DEFAULT_OPTIONS', {}):
+        return {'optimize_images': True}
+    return {'optimize_size': ('fonts', 'images')}
+
+
+def document_identifier(*texts):
+    """PDF file ID (32 hex digits) derived from the texts a document is laid out from"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update((text or '').encode('utf-8') + b'\0')
+    return digest.hexdigest()[:32].encode('ascii')
+
+
+class WeasyPrintRenderer:
+    """
+    WeasyPrint setup shared by every render in a process
+
+    The stylesheet is read and parsed once, and one FontConfiguration and
+    one bounded image/URL cache (ImageCache) serve every document, so a
+    batch of small reports spends its time on layout rather than CSS
+    parsing and fontconfig scans.
+    Pruned stylesheets (see css_prune) are parsed once per distinct text.
+    When the CSS file's mtime changes, all of it is dropped and rebuilt.
 
-def convert_markdown_to_pdf(markdown_file, output_file, css_file):
+    Args:
+        css_file: Path to CSS stylesheet
+    """
+
+    def __init__(self, css_file):
+        self.css_file = Path(css_file).resolve()
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._css_content = None
+        self._stylesheets = collections.OrderedDict()
+        self._font_config = None
+        self._cache = ImageCache()
+
+    def _reload_if_changed(self):
+        """Re-read the stylesheet and reset parsed state after the file changed (caller holds _lock)"""
+        mtime = self.css_file.stat().st_mtime_ns
+        if mtime == self._mtime:
+            return
+        self._css_content = read_css(self.css_file)
+        self._mtime = mtime
+        # @font-face rules are registered on the font configuration, so it is rebuilt too
+        self._stylesheets.clear()
+        self._font_config = None
+        self._cache = ImageCache()
+        self.stats['stylesheet_loads'] += 1
+
+    def css_content(self):
+        """Current stylesheet text"""
+        with self._lock:
+            self._reload_if_changed()
+            return self._css_content
+
+    def stylesheet(self, css_content=None):
+        """
+        Parsed WeasyPrint CSS for the stylesheet, or for css_content derived
+        from it (e.g. pruned); relative URLs resolve against the CSS file
+        """
+        from weasyprint import CSS
+
+        with self._lock:
+            self._reload_if_changed()
+            text = self._css_content if css_content is None else css_content
+            parsed = self._stylesheets.get(text)
+            if parsed is not None:
+                self._stylesheets.move_to_end(text)
+                self.stats['stylesheet_reuses'] += 1
+                return parsed
+
+            parsed = CSS(string=text, base_url=str(self.css_file), font_config=self._shared_font_config())
+            self._stylesheets[text] = parsed
+            while len(self._stylesheets) > MAX_PARSED_STYLESHEETS:
+                self._stylesheets.popitem(last=False)
+            self.stats['stylesheet_parses'] += 1
+            return parsed
+
+    def font_config(self):
+        """The shared FontConfiguration (created on first use)"""
+        with self._lock:
+            return self._shared_font_config()
+
+    def _shared_font_config(self):
+        """Create the FontConfiguration once (caller holds _lock)"""
+        if self._font_config is None:
+            try:
+                from weasyprint.text.fonts import FontConfiguration
+            except ImportError:  # WeasyPrint < 53
+                from weasyprint.fonts import FontConfiguration
+            self._font_config = FontConfiguration()
+            self.stats['font_configs'] += 1
+        return self._font_config
+
+    def write_pdf(self, html_string, output_file, prune_html=None, extra_css=None, base_url=None, stats=None,
+                  embedded_css=False, url_fetcher=None):
+        """
+        Lay out an HTML document and write the PDF
+
+        Args:
+            html_string: Full HTML document
+            output_file: Path to output PDF file, or None to return the PDF
+            prune_html: HTML chunks to prune the stylesheet against (see
+                css_prune), or None to use the full stylesheet
+            extra_css: Optional CSS text applied after the stylesheet
+            base_url: Base URL for relative images and links in the HTML
+            stats: Optional dict (e.g. a metrics stage) receiving CSS sizes
+            embedded_css: The document carries its own styles (e.g. HTML
+                posted to the render server), so the stylesheet is not applied
+            url_fetcher: WeasyPrint URL fetcher for images and other
+                resources the document loads (default: WeasyPrint's)
+
+        Returns:
+            The PDF as bytes when output_file is None
+        """
+        import weasyprint
+
+        css_content = self.css_content()
+        if embedded_css:
+            stylesheets = []
+        elif prune_html is not None:
+            pruned = css_prune.prune_css(css_content, prune_html, stats)
+            if stats is not None:
+                stats.update(css_bytes=len(css_content), css_pruned_bytes=len(pruned))
+            stylesheets = [self.stylesheet(pruned)]
+        else:
+            stylesheets = [self.stylesheet()]
+        if extra_css:
+            stylesheets.append(self.stylesheet(extra_css))
+
+        # Fonts and images that belong with the stylesheets above
+        with self._lock:
+            font_config = self._shared_font_config()
+            image_cache = self._cache
+
+        # The image/URL cache option was renamed in WeasyPrint 59
+        default_options = getattr(weasyprint, 'DEFAULT_OPTIONS', {})
+        options = {'cache' if 'cache' in default_options else 'image_cache': image_cache}
+        options.update(size_options(weasyprint))
+        # The file ID comes from the input rather than the clock, so with a pinned
+        # build date (dcterms meta tags) unchanged input gives a byte-identical PDF
+        if 'pdf_identifier' in default_options:
+            options['pdf_identifier'] = document_identifier(
+                html_string, '' if embedded_css else css_content, extra_css
+            )
+
+        document = weasyprint.HTML(string=html_string, base_url=base_url, url_fetcher=url_fetcher)
+        pdf = document.write_pdf(output_file, stylesheets=stylesheets, font_config=font_config, **options)
+        self.stats['renders'] += 1
+        return pdf
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_weasyprint_renderer(css_file):
+    """Process-wide WeasyPrintRenderer for a stylesheet (safe to call from any thread)"""
+    key = Path(css_file).resolve()
+    with _renderers_lock:
+        if key not in _renderers:
+            _renderers[key] = WeasyPrintRenderer(key)
+        return _renderers[key]
+
+
+def convert_markdown_to_pdf(markdown_file, output_file, css_file, progress=print, metrics=None, workers=None,
+                            build_date=None, highlighter=None, prune_css=True, renderer=None, toc_depth=TOC_DEPTH,
+                            optimize=False):
     """
     Convert Markdown to PDF with professional styling
 
@@ -93,53 +245,70 @@ def convert_markdown_to_pdf(markdown_file, output_file, css_file):
         markdown_file: Path to input markdown file
         output_file: Path to output PDF file
         css_file: Path to CSS stylesheet
+        progress: Callback receiving progress messages (default: print)
+        metrics: Optional PipelineMetrics that receives one record per stage
+        workers: Lay out chapter shards in this many processes and merge
+            them (each shard starts on a new page)
+        build_date: Date for the cover page and PDF metadata (date or
+            "YYYY-MM-DD"; default: SOURCE_DATE_EPOCH or today)
+        highlighter: CodeHighlighter for fenced code blocks (default: a new
+            in-memory highlighter)
+        prune_css: Lay out with only the CSS rules that can match this
+            document (single-process rendering only)
+        renderer: WeasyPrintRenderer to lay out with (default: the
+            process-wide renderer for css_file)
+        toc_depth: Deepest header level in the TOC and PDF outline
+        optimize: Deduplicate, recompress and linearize the PDF (see
+            pdf_postprocess)
     """
-    print(f"Reading markdown file: {markdown_file}")
+    metrics = metrics if metrics is not None else PipelineMetrics()
+    progress = progress or quiet
+    highlighter = highlighter if highlighter is not None else CodeHighlighter()
+
+    progress(f"Reading markdown file: {markdown_file}")
 
     # Read markdown content
-    with open(markdown_file, 'r', encoding='utf-8') as f:
-        markdown_content = f.read()
-
-    print("Converting markdown to HTML...")
-
-    # Configure markdown2 with extras
-    extras = [
-        'fenced-code-blocks',
-        'tables',
-        'code-friendly',
-        'cuddled-lists',
-        'header-ids',
-        'task_list',
-        'strike',
-        'target-blank-links',
-        'numbering',
-    ]
+    with metrics.stage('read') as stage:
+        with open(markdown_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+        stage['output_bytes'] = len(markdown_content.encode('utf-8'))
 
-    # Convert markdown to HTML
-    html_content = markdown2.markdown(markdown_content, extras=extras)
+    progress("Converting markdown to HTML...")
 
-    print("Generating table of contents...")
+    # Convert markdown to HTML
+    with metrics.stage('markdown', input_bytes=stage['output_bytes']) as stage:
+        highlighter.prime(markdown_content, MARKDOWN_EXTRAS)
+        html_content = markdown_to_html(markdown_content, MARKDOWN_EXTRAS, highlighter)
+        stage['output_bytes'] = len(html_content)
 
-    # Extract TOC from original markdown
-    toc_items = extract_toc(markdown_content)
+    progress("Generating table of contents...")
 
-    # Add anchors to headers
-    html_content = add_anchors_to_headers(html_content)
+    # Extract TOC from original markdown (anchors match the rendered header IDs)
+    with metrics.stage('toc') as stage:
+        toc_items = extract_toc(markdown_content, toc_depth)
+        stage['headings'] = len(toc_items)
 
     # Generate cover page
-    cover_html = create_cover_page()
+    build_date = resolve_build_date(build_date)
+    cover_html = create_cover_page(build_date)
 
     # Generate TOC HTML
-    toc_html = generate_toc_html(toc_items)
+    with metrics.stage('toc_html') as stage:
+        toc_html = generate_toc_html(toc_items, toc_depth)
+        stage['output_bytes'] = len(toc_html)
 
     # Combine into full HTML document
-    full_html = f'''
+    with metrics.stage('assemble') as stage:
+        full_html = f'''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <meta name="dcterms.created" content="{build_date.isoformat()}">
+        <meta name="dcterms.modified" content="{build_date.isoformat()}">
         <title>Brrow Complete System Documentation</title>
+        <style>{bookmark_css(toc_depth)}</style>
     </head>
     <body>
         {cover_html}
@@ -150,35 +319,76 @@ def convert_markdown_to_pdf(markdown_file, output_file, css_file):
     </body>
     </html>
     '''
+        stage['output_bytes'] = len(full_html)
 
-    print("Generating PDF...")
+    progress("Generating PDF...")
 
     # Create PDF with WeasyPrint
-    html_obj = HTML(string=full_html)
-    css_obj = CSS(filename=css_file)
-
-    html_obj.write_pdf(
-        output_file,
-        stylesheets=[css_obj],
-        optimize_size=('fonts', 'images')
-    )
-
-    print(f"PDF generated successfully: {output_file}")
+    with metrics.stage('pdf', input_bytes=len(full_html), backend='weasyprint') as stage:
+        if workers and workers > 1:
+            from pdf_shards import render_sharded
+            stage['pages'] = render_sharded(
+                html_content, cover_html, toc_html, output_file, css_file, workers, build_date=build_date,
+                toc_depth=toc_depth
+            )
+            stage['workers'] = workers
+        else:
+            # Parsed CSS, fonts and images are reused across documents
+            renderer = renderer if renderer is not None else get_weasyprint_renderer(css_file)
+            renderer.write_pdf(
+                full_html, output_file,
+                prune_html=[cover_html, toc_html, html_content] if prune_css else None,
+                stats=stage,
+            )
+
+        # Get file size
+        file_size = Path(output_file).stat().st_size
+        stage['output_bytes'] = file_size
+
+    progress(f"PDF generated successfully: {output_file}")
+
+    if optimize:
+        with metrics.stage('pdf_optimize') as stage:
+            stage.update(optimize_pdf(output_file))
+        file_size = stage['output_bytes']
+        progress(f"Optimized {format_report(Path(output_file).name, stage)}")
 
-    # Get file size
-    file_size = Path(output_file).stat().st_size
     file_size_mb = file_size / (1024 * 1024)
 
-    print(f"File size: {file_size_mb:.2f} MB")
+    progress(f"File size: {file_size_mb:.2f} MB")
 
     return output_file
 
 if __name__ == "__main__":
+    import weasyprint
+
     # File paths
     base_dir = Path("/Users/shalin/Documents/Projects/Xcode/Brrow")
     markdown_file = base_dir / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.md"
     output_file = base_dir / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.pdf"
     css_file = base_dir / "pdf_styles.css"
 
-    # Convert
-    convert_markdown_to_pdf(markdown_file, output_file, css_file)
+    # BRROW_DOCS_WORKERS=N lays out chapter shards in N processes
+    workers = int(os.environ.get('BRROW_DOCS_WORKERS', '1'))
+
+    # Skip rendering when neither the markdown nor the CSS changed
+    cache = BuildCache()
+    cache_key = cache.key_for_files(
+        markdown_file, css_file, MARKDOWN_EXTRAS,
+        backend='weasyprint' if workers <= 1 else 'weasyprint-sharded',
+        renderer_version=f"{renderer_version()}/weasyprint {weasyprint.__version__}",
+        build_date=resolve_build_date().isoformat()
+    )
+
+    if cache.restore(cache_key, pdf=output_file):
+        print(f"Inputs unchanged, restored PDF from build cache: {output_file}")
+    else:
+        metrics = PipelineMetrics(trace_memory=bool(os.environ.get('BRROW_DOCS_METRICS')))
+
+        # Convert
+        convert_markdown_to_pdf(markdown_file, output_file, css_file, metrics=metrics, workers=workers)
+        cache.store(cache_key, pdf=output_file)
+
+        # BRROW_DOCS_METRICS=path.jsonl (JSON lines) or path.json (Chrome trace)
+        if os.environ.get('BRROW_DOCS_METRICS'):
+            metrics.write(os.environ['BRROW_DOCS_METRICS'])
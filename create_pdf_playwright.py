@@ -37,52 +37,272 @@ def install_playwright():
             print(f"✗ Failed to install Playwright: {e}")
             return False
 
-def create_pdf_playwright(html_file, pdf_file):
-    """Create PDF using Playwright"""
-    try:
+PDF_OPTIONS = {
+    'format': 'A4',
+    'print_background': True,
+    'margin': {
+        'top': '2.5cm',
+        'right': '2cm',
+        'bottom': '2.5cm',
+        'left': '2cm'
+    },
+    'prefer_css_page_size': False,
+    'display_header_footer': False,
+}
+
+# Resolves once every web font used by the document has loaded (or failed)
+FONTS_READY_JS = "() => document.fonts.ready.then(() => true)"
+
+def file_url(html_file):
+    """
+    file:// URL a page navigates to for an HTML file
+
+    Navigating to the file (rather than set_content() from about:blank)
+    lets Chromium resolve relative images against the file's directory.
+    """
+    return Path(html_file).resolve().as_uri()
+
+class PlaywrightPdfRenderer:
+    """
+    Reusable PDF renderer that keeps Chromium warm between documents
+
+    Launches `browsers` Chromium instances once and keeps `pages_per_browser`
+    pages open in each, handing them out round-robin. A page (and its browser
+    context) is replaced after `max_renders_per_page` renders to bound memory.
+    Uses the sync Playwright API, so an instance must stay on one thread.
+
+    A document is printed once its load event has fired (every image is
+    loaded) and document.fonts is ready. Pages that finish rendering in
+    script can also set a flag and pass ready_expression (e.g.
+    "() => window.renderComplete === true").
+
+    Usage:
+        with PlaywrightPdfRenderer() as renderer:
+            for html_file, pdf_file in jobs:
+                renderer.render(html_file, pdf_file)
+    """
+
+    def __init__(self, browsers=1, pages_per_browser=1, max_renders_per_page=25, pdf_options=None,
+                 ready_expression=None, ready_timeout_ms=30000):
+        self.browser_count = browsers
+        self.pages_per_browser = pages_per_browser
+        self.max_renders_per_page = max_renders_per_page
+        self.pdf_options = dict(PDF_OPTIONS, **(pdf_options or {}))
+        self.ready_expression = ready_expression
+        self.ready_timeout_ms = ready_timeout_ms
+        self.launch_count = 0
+        self.render_count = 0
+        self._playwright = None
+        self._browsers = []
+        self._slots = []
+        self._next_slot = 0
+
+    def start(self):
+        """Launch the browsers and open the page pool"""
+        if self._playwright is not None:
+            return self
+
         from playwright.sync_api import sync_playwright
 
-        print(f"\nConverting HTML to PDF...")
-        print(f"Input:  {html_file}")
-        print(f"Output: {pdf_file}\n")
+        self._playwright = sync_playwright().start()
+        for _ in range(self.browser_count):
+            browser = self._playwright.chromium.launch(headless=True)
+            self.launch_count += 1
+            self._browsers.append(browser)
+            for _ in range(self.pages_per_browser):
+                self._slots.append(self._open_slot(browser))
+        return self
 
-        with sync_playwright() as p:
-            # Launch browser
-            print("⏳ Launching Chromium...")
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
+    def _open_slot(self, browser):
+        context = browser.new_context()
+        return {
+            'browser': browser,
+            'context': context,
+            'page': context.new_page(),
+            'renders': 0,
+        }
 
-            # Load HTML file
-            print("⏳ Loading HTML...")
-            page.goto(f'file://{os.path.abspath(html_file)}')
+    def _acquire_slot(self):
+        slot = self._slots[self._next_slot]
+        self._next_slot = (self._next_slot + 1) % len(self._slots)
 
-            # Wait for page to be fully loaded
-            page.wait_for_load_state('networkidle')
+        # Recycle pages that have rendered enough documents
+        if slot['renders'] >= self.max_renders_per_page or slot['page'].is_closed():
+            slot['context'].close()
+            slot.update(self._open_slot(slot['browser']))
+        return slot
 
-            # Extra wait for rendering
-            page.wait_for_timeout(2000)
+    def render(self, html_file, pdf_file):
+        """Render one HTML file to PDF on a pooled page"""
+        if self._playwright is None:
+            self.start()
 
-            print("⏳ Generating PDF...")
+        slot = self._acquire_slot()
+        page = slot['page']
 
-            # Generate PDF
-            page.pdf(
-                path=pdf_file,
-                format='A4',
-                print_background=True,
-                margin={
-                    'top': '2.5cm',
-                    'right': '2cm',
-                    'bottom': '2.5cm',
-                    'left': '2cm'
-                },
-                prefer_css_page_size=False,
-                display_header_footer=False,
-            )
+        # Images may be relative files; the load event waits for all of them
+        page.goto(file_url(html_file), wait_until='load', timeout=self.ready_timeout_ms)
+        page.evaluate(FONTS_READY_JS)
+        if self.ready_expression:
+            page.wait_for_function(self.ready_expression, timeout=self.ready_timeout_ms)
 
-            browser.close()
+        page.pdf(path=str(pdf_file), **self.pdf_options)
 
-            print("✅ PDF created successfully!")
-            return True
+        slot['renders'] += 1
+        self.render_count += 1
+        return pdf_file
+
+    def close(self):
+        """Close every page, context and browser"""
+        for slot in self._slots:
+            try:
+                slot['context'].close()
+            except Exception:
+                pass
+        for browser in self._browsers:
+            try:
+                browser.close()
+            except Exception:
+                pass
+        if self._playwright is not None:
+            self._playwright.stop()
+
+        self._slots = []
+        self._browsers = []
+        self._next_slot = 0
+        self._playwright = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class AsyncPlaywrightPdfRenderer:
+    """
+    asyncio counterpart of PlaywrightPdfRenderer built on playwright.async_api
+
+    Keeps one Chromium instance with `pages` pages in an asyncio.Queue, so up
+    to `pages` documents print concurrently without blocking the event loop.
+    Pages are recycled after `max_renders_per_page` renders.
+
+    Usage:
+        async with AsyncPlaywrightPdfRenderer(pages=4) as renderer:
+            await renderer.render(html_file, pdf_file)
+    """
+
+    def __init__(self, pages=2, max_renders_per_page=25, pdf_options=None,
+                 ready_expression=None, ready_timeout_ms=30000):
+        self.page_count = pages
+        self.max_renders_per_page = max_renders_per_page
+        self.pdf_options = dict(PDF_OPTIONS, **(pdf_options or {}))
+        self.ready_expression = ready_expression
+        self.ready_timeout_ms = ready_timeout_ms
+        self.render_count = 0
+        self._playwright = None
+        self._browser = None
+        self._slots = None
+
+    async def start(self):
+        """Launch the browser and open the page pool"""
+        if self._playwright is not None:
+            return self
+
+        import asyncio
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        try:
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._slots = asyncio.Queue()
+            for _ in range(self.page_count):
+                self._slots.put_nowait(await self._open_slot())
+        except BaseException:
+            # Release whatever was launched before the failure
+            await self.close()
+            raise
+        return self
+
+    async def _open_slot(self):
+        context = await self._browser.new_context()
+        return {'context': context, 'page': await context.new_page(), 'renders': 0}
+
+    async def render(self, html_file, pdf_file):
+        """Render one HTML file to PDF on a pooled page"""
+        if self._playwright is None:
+            await self.start()
+
+        slot = await self._slots.get()
+        try:
+            if slot['renders'] >= self.max_renders_per_page or slot['page'].is_closed():
+                await slot['context'].close()
+                slot = await self._open_slot()
+
+            page = slot['page']
+            await page.goto(file_url(html_file), wait_until='load', timeout=self.ready_timeout_ms)
+            await page.evaluate(FONTS_READY_JS)
+            if self.ready_expression:
+                await page.wait_for_function(self.ready_expression, timeout=self.ready_timeout_ms)
+            await page.pdf(path=str(pdf_file), **self.pdf_options)
+
+            slot['renders'] += 1
+            self.render_count += 1
+        finally:
+            self._slots.put_nowait(slot)
+        return pdf_file
+
+    async def close(self):
+        """Close every page, context and the browser (safe after a partial start)"""
+        if self._playwright is None:
+            return
+        while self._slots is not None and not self._slots.empty():
+            slot = self._slots.get_nowait()
+            try:
+                await slot['context'].close()
+            except Exception:
+                pass
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+        await self._playwright.stop()
+        self._playwright = None
+        self._browser = None
+        self._slots = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+def create_pdf_playwright(html_file, pdf_file, renderer=None):
+    """
+    Create PDF using Playwright
+
+    Args:
+        html_file: Path to input HTML file
+        pdf_file: Path to output PDF file
+        renderer: Optional started PlaywrightPdfRenderer to reuse; a one-shot
+            renderer is launched and closed when omitted
+    """
+    try:
+        print(f"\nConverting HTML to PDF...")
+        print(f"Input:  {html_file}")
+        print(f"Output: {pdf_file}\n")
+
+        if renderer is not None:
+            print("⏳ Generating PDF...")
+            renderer.render(html_file, pdf_file)
+        else:
+            print("⏳ Launching Chromium...")
+            with PlaywrightPdfRenderer() as one_shot:
+                print("⏳ Generating PDF...")
+                one_shot.render(html_file, pdf_file)
+
+        print("✅ PDF created successfully!")
+        return True
 
     except Exception as e:
         print(f"✗ Error: {e}")
@@ -121,11 +341,14 @@ def get_pdf_info(pdf_file):
     return info
 
 def main():
-    """Main function"""
+    """Main function; optional arguments: <html_file> <pdf_file>"""
     base_dir = Path("/Users/shalin/Documents/Projects/Xcode/Brrow")
     html_file = base_dir / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.html"
     pdf_file = base_dir / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.pdf"
 
+    if len(sys.argv) == 3:
+        html_file, pdf_file = Path(sys.argv[1]), Path(sys.argv[2])
+
     print("="*70)
     print(" BRROW DOCUMENTATION - PDF GENERATION WITH PLAYWRIGHT")
     print("="*70)
@@ -0,0 +1,273 @@
+"""
+Per-document CSS pruning for the Brrow documentation pipeline
+Drops style rules whose selectors cannot match a rendered document, so the
+browser or WeasyPrint cascades every element against fewer rules
+
+Usage:
+    css = prune_css(read_css("pdf_styles.css"), [html_content, cover_html, toc_html])
+"""
+
+import re
+from functools import lru_cache
+
+# At-rules whose nested rules are pruned like top-level ones; every other
+# at-rule (@page, @font-face, @keyframes...) selects no elements and is kept whole
+NESTED_AT_RULES = ('@media', '@supports', '@document')
+# Declarations that keep a rule even if it looks unmatched (page counters,
+# running strings)
+KEEP_DECLARATIONS_RE = re.compile(r'\b(counter-reset|counter-increment|counter-set|string-set)\s*:')
+
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+# Start tags and their class/id attributes (a regex scan is much faster than
+# html.parser on highlighted code, which is mostly <span class="...">)
+START_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)(\s[^>]*)?>')
+ATTRIBUTE_VALUE_RE = re.compile(r'\b(class|id)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)', re.I)
+PSEUDO_WITH_ARGS_RE = re.compile(r':{1,2}[\w-]+\((?:[^()]|\([^()]*\))*\)')
+PSEUDO_RE = re.compile(r':{1,2}[\w-]+')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+COMBINATOR_RE = re.compile(r'\s*[>+~]\s*|\s+')
+TAG_RE = re.compile(r'^[a-zA-Z][\w-]*')
+CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+ID_RE = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+
+
+class StyleRule:
+    """A selector list and its declaration block"""
+
+    def __init__(self, selectors, body):
+        self.selectors = selectors
+        self.body = body
+
+
+class AtRule:
+    """An at-rule; nested rules are parsed for @media/@supports, else kept verbatim"""
+
+    def __init__(self, prelude, body, rules=None):
+        self.prelude = prelude
+        self.body = body
+        self.rules = rules
+
+
+def _split_top_level(text, separator):
+    """Split on separator outside of (), [] and strings"""
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote and text[index - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _parse_rules(css):
+    """Parse a comment-free stylesheet into StyleRule/AtRule objects"""
+    rules = []
+    index = 0
+    length = len(css)
+
+    while index < length:
+        # Prelude runs to the first '{' or ';' outside strings
+        start = index
+        quote = None
+        while index < length:
+            char = css[index]
+            if quote:
+                if char == quote and css[index - 1] != '\\':
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char in '{;':
+                break
+            index += 1
+
+        prelude = css[start:index].strip()
+        if index >= length:
+            break
+        if css[index] == ';':
+            # Statement at-rule (@import, @charset, @namespace)
+            if prelude:
+                rules.append(AtRule(prelude, None))
+            index += 1
+            continue
+
+        # Block runs to the matching '}'
+        depth = 0
+        body_start = index + 1
+        while index < length:
+            char = css[index]
+            if quote:
+                if char == quote and css[index - 1] != '\\':
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+            index += 1
+        body = css[body_start:index]
+        index += 1
+
+        if prelude.startswith('@'):
+            name = prelude.split(None, 1)[0].lower()
+            nested = _parse_rules(body) if name in NESTED_AT_RULES else None
+            rules.append(AtRule(prelude, body, nested))
+        elif prelude:
+            selectors = [selector.strip() for selector in _split_top_level(prelude, ',') if selector.strip()]
+            rules.append(StyleRule(selectors, body))
+
+    return rules
+
+
+@lru_cache(maxsize=16)
+def parse_stylesheet(css_content):
+    """
+    Parse a stylesheet (cached, so each distinct stylesheet is parsed once)
+
+    Returns:
+        Tuple of StyleRule and AtRule objects
+    """
+    return tuple(_parse_rules(COMMENT_RE.sub('', css_content)))
+
+
+class DocumentIndex:
+    """Tag names, classes and IDs present in an HTML document"""
+
+    def __init__(self):
+        self.tags = {'html', 'head', 'body'}
+        self.classes = set()
+        self.ids = set()
+
+    def feed(self, html):
+        """Add the start tags of an HTML fragment"""
+        for match in START_TAG_RE.finditer(html):
+            self.tags.add(match.group(1).lower())
+            attributes = match.group(2)
+            if not attributes:
+                continue
+            for name, value in ATTRIBUTE_VALUE_RE.findall(attributes):
+                value = value.strip('"\'')
+                if name.lower() == 'class':
+                    self.classes.update(value.split())
+                elif name.lower() == 'id':
+                    self.ids.add(value)
+
+
+def index_html(html_chunks):
+    """Build a DocumentIndex from an HTML string or an iterable of chunks"""
+    index = DocumentIndex()
+    if isinstance(html_chunks, str):
+        html_chunks = [html_chunks]
+    for chunk in html_chunks:
+        index.feed(chunk)
+    return index
+
+
+@lru_cache(maxsize=4096)
+def _selector_requirements(selector):
+    """
+    Tags, classes and IDs every compound of a selector needs, or None if the
+    selector is too unusual to analyse (it is then always kept)
+    """
+    if '\\' in selector:
+        return None
+    # Pseudo-classes, pseudo-elements and attribute tests do not narrow what
+    # we can check; drop them and keep the element part
+    simplified = PSEUDO_WITH_ARGS_RE.sub('', selector)
+    simplified = PSEUDO_RE.sub('', ATTRIBUTE_RE.sub('', simplified))
+
+    requirements = []
+    for compound in COMBINATOR_RE.split(simplified.strip()):
+        if not compound:
+            continue
+        tag = TAG_RE.match(compound)
+        requirements.append((
+            tag.group(0).lower() if tag else None,
+            frozenset(CLASS_RE.findall(compound)),
+            frozenset(ID_RE.findall(compound)),
+        ))
+    return tuple(requirements)
+
+
+def selector_can_match(selector, index):
+    """
+    Whether a selector can match some element of the indexed document
+
+    Conservative: every compound's tag, classes and IDs must be present
+    somewhere in the document; combinators and pseudo-classes are not
+    evaluated, so a True may still match nothing, but a False never matches.
+    """
+    requirements = _selector_requirements(selector)
+    if requirements is None:
+        return True
+    for tag, classes, ids in requirements:
+        if tag is not None and tag not in index.tags:
+            return False
+        if not classes <= index.classes or not ids <= index.ids:
+            return False
+    return True
+
+
+def _prune_rules(rules, index, stats):
+    out = []
+    for rule in rules:
+        if isinstance(rule, AtRule):
+            if rule.body is None:
+                out.append(f"{rule.prelude};")
+            elif rule.rules is not None:
+                nested = _prune_rules(rule.rules, index, stats)
+                if nested:
+                    out.append(f"{rule.prelude} {{\n" + '\n'.join(nested) + "\n}")
+            else:
+                out.append(f"{rule.prelude} {{{rule.body}}}")
+            continue
+
+        stats['rules_total'] += 1
+        if KEEP_DECLARATIONS_RE.search(rule.body):
+            kept = rule.selectors
+        else:
+            kept = [selector for selector in rule.selectors if selector_can_match(selector, index)]
+        if kept:
+            stats['rules_kept'] += 1
+            out.append(f"{', '.join(kept)} {{{rule.body}}}")
+    return out
+
+
+def prune_css(css_content, html_chunks, stats=None):
+    """
+    Minimal stylesheet for one rendered document
+
+    Style rules keep only the selectors that can match the document (rules
+    left with none are dropped); @page, @font-face and other non-selecting
+    at-rules are kept whole, @media/@supports blocks are pruned inside, and
+    rules setting counters or running strings are always kept.
+
+    Args:
+        css_content: Stylesheet text
+        html_chunks: Rendered HTML (string or iterable of strings) the
+            stylesheet will be applied to
+        stats: Optional dict receiving 'rules_total' and 'rules_kept' counts
+
+    Returns:
+        Pruned stylesheet text
+    """
+    index = index_html(html_chunks)
+    counts = {'rules_total': 0, 'rules_kept': 0}
+    pruned = '\n'.join(_prune_rules(parse_stylesheet(css_content), index, counts)) + '\n'
+    if stats is not None:
+        stats.update(counts)
+    return pruned
@@ -0,0 +1,246 @@
+"""
+Content-addressed build cache for the documentation pipeline
+Stores rendered HTML and PDF keyed on everything that affects the output,
+plus per-section HTML fragments for incremental markdown conversion
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# Bump when the HTML template or conversion logic changes in a way that
+# should invalidate previously cached outputs
+RENDERER_VERSION = "6"
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".docs_cache"
+# Environment variable that moves the cache (and backend probe state) out of the source tree
+CACHE_DIR_ENV = "BRROW_DOCS_CACHE_DIR"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+ARTIFACT_NAMES = {
+    'html': 'document.html',
+    'pdf': 'document.pdf',
+}
+
+
+def _copy_atomic(src, dst):
+    """Copy src to dst via a temporary file so readers never see partial output"""
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def default_cache_dir():
+    """Cache directory from BRROW_DOCS_CACHE_DIR, or DEFAULT_CACHE_DIR"""
+    return Path(os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+
+
+class BuildCache:
+    """
+    Persistent cache of pipeline outputs with size-bounded LRU eviction
+
+    Entries live in <cache_dir>/builds/<key[:2]>/<key>/ and hold any of the
+    artifacts in ARTIFACT_NAMES. The entry directory's mtime is refreshed on
+    every hit and used as the recency signal for eviction.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or default_cache_dir()) / "builds"
+        self.max_bytes = max_bytes
+
+    def key(self, markdown_bytes, css_bytes, extras, backend, renderer_version='', build_date='', title=''):
+        """
+        Compute the cache key for one build
+
+        Args:
+            markdown_bytes: Raw markdown source
+            css_bytes: Raw stylesheet
+            extras: markdown2 extras list
+            backend: Name of the PDF backend (or 'html' for HTML-only builds)
+            renderer_version: Version string of the converter/backend libraries
+            build_date: Date stamped into the output ("YYYY-MM-DD")
+            title: Document title stamped into the output
+        """
+        digest = hashlib.sha256()
+        header = json.dumps({
+            'cache_version': RENDERER_VERSION,
+            'extras': list(extras),
+            'backend': backend,
+            'renderer_version': renderer_version,
+            'build_date': build_date,
+            'title': title,
+        }, sort_keys=True)
+        for part in (header.encode('utf-8'), markdown_bytes, css_bytes):
+            # Length-prefix each part so boundaries cannot be shifted
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def key_for_files(self, markdown_file, css_file, extras, backend, renderer_version='', build_date='', title=''):
+        """Compute the cache key from the markdown and CSS files on disk"""
+        markdown_bytes = Path(markdown_file).read_bytes()
+        css_bytes = Path(css_file).read_bytes() if css_file else b''
+        return self.key(markdown_bytes, css_bytes, extras, backend, renderer_version, build_date, title)
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    def restore(self, key, **outputs):
+        """
+        Copy cached artifacts to their output paths
+
+        Args:
+            key: Cache key from key() or key_for_files()
+            **outputs: Artifact name to destination path, e.g. html=..., pdf=...
+
+        Returns:
+            True if every requested artifact was cached and restored
+        """
+        entry = self._entry_dir(key)
+        sources = {}
+        for name in outputs:
+            cached = entry / ARTIFACT_NAMES[name]
+            if not cached.exists():
+                return False
+            sources[name] = cached
+
+        try:
+            for name, destination in outputs.items():
+                _copy_atomic(sources[name], destination)
+            # Mark entry as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            # Evicted by another process after the check above
+            return False
+        return True
+
+    def store(self, key, **artifacts):
+        """
+        Store artifacts produced for key and evict old entries if over budget
+
+        Args:
+            key: Cache key from key() or key_for_files()
+            **artifacts: Artifact name to source path, e.g. html=..., pdf=...
+        """
+        entry = self._entry_dir(key)
+        entry.mkdir(parents=True, exist_ok=True)
+        for name, source in artifacts.items():
+            if source is None:
+                continue
+            _copy_atomic(source, entry / ARTIFACT_NAMES[name])
+        os.utime(entry)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        if not self.cache_dir.exists():
+            return
+
+        entries = []
+        total = 0
+        for shard in self.cache_dir.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+                entries.append((entry.stat().st_mtime, size, entry))
+                total += size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every cached entry"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+class FragmentCache:
+    """
+    Cache of rendered HTML fragments keyed on the hash of their source text
+
+    Fragments live in <cache_dir>/fragments/<key[:2]>/<key>.html and are
+    mirrored in memory for the lifetime of the object. Eviction is not run on
+    every store; call evict() once a render pass has finished.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES // 4):
+        self.cache_dir = Path(cache_dir or default_cache_dir()) / "fragments"
+        self.max_bytes = max_bytes
+        self._memory = {}
+
+    def key(self, text, namespace=''):
+        """Compute the fragment key for source text within a namespace"""
+        digest = hashlib.sha256()
+        for part in (RENDERER_VERSION, namespace, text):
+            part = part.encode('utf-8')
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.html"
+
+    def get(self, key):
+        """Return the cached fragment for key, or None"""
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self._path(key)
+        try:
+            fragment = path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+        os.utime(path)
+        self._memory[key] = fragment
+        return fragment
+
+    def put(self, key, fragment):
+        """Store a rendered fragment"""
+        self._memory[key] = fragment
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(fragment)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Remove least recently used fragments until the cache fits max_bytes"""
+        if not self.cache_dir.exists():
+            return
+
+        files = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.html"):
+            stat = path.stat()
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._memory.pop(path.stem, None)
+            total -= size
+
+    def clear(self):
+        """Remove every cached fragment"""
+        self._memory.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
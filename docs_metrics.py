@@ -0,0 +1,153 @@
+"""
+Per-stage instrumentation for the Brrow documentation pipeline
+Records wall time, CPU time, memory and byte counts for every stage and
+writes them as JSON lines or Chrome trace events (chrome://tracing, Perfetto)
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def max_rss_bytes():
+    """Peak resident set size of this process so far, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def quiet(message):
+    """Progress callback that discards messages (pass as progress=quiet)"""
+
+
+class PipelineMetrics:
+    """
+    Collects one record per pipeline stage
+
+    Args:
+        trace_memory: Track the Python heap peak per stage with tracemalloc
+            (adds noticeable overhead, so off by default)
+        document: Label stored on every record (e.g. the input file name)
+
+    Sizes of files are in bytes; sizes of in-memory text are len() of the
+    string, which equals bytes for ASCII-heavy documents.
+
+    Usage:
+        metrics = PipelineMetrics()
+        with metrics.stage('markdown', input_bytes=len(source)) as stage:
+            html = markdown2.markdown(source)
+            stage['output_bytes'] = len(html)
+        metrics.write_jsonl('metrics.jsonl')
+    """
+
+    def __init__(self, trace_memory=False, document=None):
+        self.trace_memory = trace_memory
+        self.document = document
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, input_bytes=None, **fields):
+        """
+        Time a stage; yields the record so callers can add output_bytes etc.
+
+        The record is kept even if the stage raises, with 'error' set.
+        """
+        record = {'stage': name}
+        if self.document is not None:
+            record['document'] = self.document
+        if input_bytes is not None:
+            record['input_bytes'] = input_bytes
+        record.update(fields)
+
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+
+        # Epoch start time lines up records collected in different processes
+        start_ts = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['start_ts'] = start_ts
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            if self.trace_memory:
+                record['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            record['max_rss_bytes'] = max_rss_bytes()
+            self.records.append(record)
+
+    def total(self, field='wall_s'):
+        """Sum a numeric field over all recorded stages"""
+        return sum(record.get(field) or 0 for record in self.records)
+
+    def write_jsonl(self, destination):
+        """Append records as JSON lines to a path or writable text file"""
+        if hasattr(destination, 'write'):
+            for record in self.records:
+                destination.write(json.dumps(record, sort_keys=True) + '\n')
+            return
+        with open(destination, 'a', encoding='utf-8') as f:
+            self.write_jsonl(f)
+
+    def chrome_trace_events(self, pid=None):
+        """Return the records as Chrome trace "complete" events"""
+        pid = pid if pid is not None else os.getpid()
+        events = []
+        # One trace "thread" per document so batch timelines stack cleanly
+        thread_ids = {}
+        for record in self.records:
+            document = record.get('document')
+            if document not in thread_ids:
+                thread_ids[document] = len(thread_ids)
+                events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': pid,
+                    'tid': thread_ids[document],
+                    'args': {'name': str(document or 'pipeline')},
+                })
+
+            args = {k: v for k, v in record.items() if k not in ('stage', 'start_ts', 'wall_s')}
+            events.append({
+                'name': record['stage'],
+                'cat': 'docs',
+                'ph': 'X',
+                'ts': record['start_ts'] * 1e6,
+                'dur': record['wall_s'] * 1e6,
+                'pid': pid,
+                'tid': thread_ids[document],
+                'args': args,
+            })
+        return events
+
+    def write_chrome_trace(self, path):
+        """Write records in Chrome trace-event format"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.chrome_trace_events()}, f)
+
+    def write(self, path):
+        """Write a Chrome trace for *.json paths, JSON lines otherwise"""
+        if str(path).endswith('.json'):
+            self.write_chrome_trace(path)
+        else:
+            self.write_jsonl(path)
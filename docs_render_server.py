@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Brrow Documentation Render Server
+Long-running local HTTP (or Unix socket) service that keeps markdown2 and
+WeasyPrint warm and renders Markdown/HTML to HTML/PDF on request
+
+Usage:
+    python3 docs_render_server.py --port 8765
+    curl --data-binary @REPORT.md 'http://127.0.0.1:8765/render?format=pdf' -o REPORT.pdf
+    curl http://127.0.0.1:8765/metrics
+
+Endpoints:
+    POST /render?format=html|pdf&input=markdown|html&date=YYYY-MM-DD
+        Body is the source document (UTF-8). input defaults to html for a
+        text/html Content-Type, else markdown; format defaults to pdf.
+    GET /metrics    Queue depth, request counts and render latency (JSON)
+    GET /healthz    "ok"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+from urllib.request import url2pathname
+
+import generate_pdf
+from convert_to_pdf import get_weasyprint_renderer
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DEFAULT_CSS = BASE_DIR / "pdf_styles.css"
+# Only files under this directory may be loaded by a rendered document
+DEFAULT_ASSET_DIR = BASE_DIR
+DEFAULT_PORT = 8765
+
+# Largest accepted request body
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# Bytes written per send when returning a rendered document
+RESPONSE_SLICE_BYTES = 1024 * 1024
+# Recent render latencies kept per output format for /metrics
+LATENCY_WINDOW = 1000
+
+CONTENT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def check_asset_url(url, asset_dir):
+    """
+    Allow data: URLs and file: URLs inside asset_dir; reject anything else
+
+    Request bodies are untrusted, so a document must not make the server
+    read arbitrary local files or fetch from the network.
+
+    Returns:
+        The URL unchanged
+
+    Raises:
+        ValueError: If the URL points outside the asset directory
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'data':
+        return url
+    if parts.scheme == 'file' and parts.netloc in ('', 'localhost'):
+        path = Path(url2pathname(unquote(parts.path))).resolve()
+        if path.is_relative_to(Path(asset_dir).resolve()):
+            return url
+    raise ValueError(f"Refusing to load {url}: outside {asset_dir}")
+
+
+def asset_url_fetcher(asset_dir):
+    """Return a WeasyPrint url_fetcher restricted to asset_dir"""
+    try:
+        from weasyprint.urls import URLFetcher
+    except ImportError:  # older WeasyPrint takes a fetch function
+        from weasyprint import default_url_fetcher
+
+        def fetch(url, *args, **kwargs):
+            return default_url_fetcher(check_asset_url(url, asset_dir), *args, **kwargs)
+
+        return fetch
+
+    class AssetURLFetcher(URLFetcher):
+        def fetch(self, url, headers=None):
+            return super().fetch(check_asset_url(url, asset_dir), headers)
+
+    return AssetURLFetcher(allowed_protocols=('data', 'file'))
+
+
+class RequestCoalescer:
+    """
+    Runs one call per key at a time; concurrent callers with the same key
+    wait for that call and share its result (or exception)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def run(self, key, func, *args):
+        """
+        Call func(*args), or join the identical call already running
+
+        Returns:
+            Tuple of (result, coalesced)
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        future.set_result(result)
+        return result, False
+
+
+class RenderService:
+    """
+    Warm rendering engines shared by every request
+
+    markdown2 and WeasyPrint are loaded once, and PDFs are laid out with
+    the process-wide WeasyPrintRenderer for css_file, so the stylesheet is
+    parsed once (again only when its mtime changes) and its fonts and
+    images are shared across requests. Renders run on a bounded thread pool.
+
+    Only WeasyPrint renders here: every resource a document loads goes
+    through a URL fetcher restricted to asset_dir, which the browser
+    backends cannot enforce.
+
+    Args:
+        css_file: Stylesheet applied to Markdown input
+        workers: Concurrent renders (default: CPU count)
+        asset_dir: Base directory for relative images; documents cannot load
+            files outside it
+    """
+
+    def __init__(self, css_file=DEFAULT_CSS, workers=None, asset_dir=DEFAULT_ASSET_DIR):
+        self.css_file = Path(css_file)
+        self.asset_dir = Path(asset_dir).resolve()
+        self.workers = workers or os.cpu_count() or 1
+        self.started = time.time()
+
+        self.renderer = get_weasyprint_renderer(self.css_file)
+        self.coalescer = RequestCoalescer()
+        self.counters = Counter()
+        self.latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in CONTENT_TYPES}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self._url_fetcher = None
+
+    def start(self):
+        """Import WeasyPrint, parse the stylesheet and load fonts before the first request"""
+        self.renderer.stylesheet()
+        self._asset_url_fetcher()
+        return self
+
+    def _asset_url_fetcher(self):
+        """The URL fetcher restricted to asset_dir (created on first use)"""
+        with self._lock:
+            if self._url_fetcher is None:
+                self._url_fetcher = asset_url_fetcher(self.asset_dir)
+            return self._url_fetcher
+
+    def render(self, source, input_format='markdown', output_format='pdf', build_date=None):
+        """
+        Render a document, sharing the work with identical in-flight requests
+
+        Args:
+            source: Markdown or HTML text
+            input_format: 'markdown' or 'html'
+            output_format: 'html' or 'pdf' (HTML input can only become PDF)
+            build_date: Date for the cover page and PDF metadata
+
+        Returns:
+            Tuple of (document bytes, coalesced)
+        """
+        if input_format not in ('markdown', 'html'):
+            raise ValueError(f"Unknown input format: {input_format}")
+        if output_format not in CONTENT_TYPES:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if input_format == 'html' and output_format == 'html':
+            raise ValueError("HTML input can only be rendered to PDF")
+
+        build_date = generate_pdf.resolve_build_date(build_date)
+        css_content = self.renderer.css_content()
+        key = hashlib.sha256('\0'.join([
+            input_format, output_format, build_date.isoformat(), css_content, source
+        ]).encode('utf-8')).hexdigest()
+
+        start = time.perf_counter()
+        self._count('requests')
+        try:
+            data, coalesced = self.coalescer.run(
+                key, self._render_queued, source, input_format, output_format, build_date
+            )
+        except Exception:
+            self._count('errors')
+            raise
+        with self._lock:
+            self.latencies[output_format].append(time.perf_counter() - start)
+        return data, coalesced
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _render_queued(self, *args):
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._render, *args).result()
+
+    def _render(self, source, input_format, output_format, build_date):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            if input_format == 'html':
+                # Posted HTML carries its own styles
+                return self._render_pdf(source, embedded_css=True)
+
+            css_content = self.renderer.css_content()
+            html_content = generate_pdf.markdown_to_html(source)
+            cover_html = generate_pdf.create_cover_page(build_date)
+            toc_html = generate_pdf.generate_toc_html(generate_pdf.extract_toc(source))
+
+            if output_format == 'html':
+                chunks = generate_pdf.iter_html_document(
+                    html_content, css_content, cover_html, toc_html, build_date=build_date
+                )
+                return ''.join(chunks).encode('utf-8')
+
+            # The renderer applies its parsed stylesheet instead of a <style> block
+            document = ''.join(generate_pdf.iter_html_document(
+                html_content, '', cover_html, toc_html, build_date=build_date
+            ))
+            return self._render_pdf(document)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _render_pdf(self, html_string, embedded_css=False):
+        """Render an HTML string to PDF bytes with the shared WeasyPrintRenderer"""
+        return self.renderer.write_pdf(
+            html_string, None, base_url=str(self.asset_dir), embedded_css=embedded_css,
+            url_fetcher=self._asset_url_fetcher()
+        )
+
+    def metrics(self):
+        """Snapshot of queue depth, counters and latency percentiles"""
+        with self._lock:
+            queued, active = self._queued, self._active
+            counters = dict(self.counters)
+            windows = {name: sorted(samples) for name, samples in self.latencies.items()}
+
+        latency = {}
+        for name, samples in windows.items():
+            if not samples:
+                continue
+            latency[name] = {
+                'count': len(samples),
+                'p50': statistics.median(samples),
+                'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                'max': samples[-1],
+            }
+
+        return {
+            'workers': self.workers,
+            'uptime_seconds': time.time() - self.started,
+            'queue_depth': queued,
+            'active_renders': active,
+            'requests': counters.get('requests', 0),
+            'errors': counters.get('errors', 0),
+            'coalesced': self.coalescer.coalesced,
+            'stylesheet_loads': self.renderer.stats['stylesheet_loads'],
+            'latency_seconds': latency,
+        }
+
+    def close(self):
+        """Stop the render threads"""
+        self._executor.shutdown(wait=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end for the RenderService on self.server.service"""
+
+    server_version = "BrrowDocsRender/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if not getattr(self.server, 'quiet', False):
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        view = memoryview(body)
+        for start in range(0, len(view), RESPONSE_SLICE_BYTES):
+            self.wfile.write(view[start:start + RESPONSE_SLICE_BYTES])
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self._send(200, json.dumps(self.server.service.metrics(), indent=2), 'application/json')
+        elif path == '/healthz':
+            self._send(200, "ok\n")
+        else:
+            self._send(404, "Not found\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/render':
+            self._send(404, "Not found\n")
+            return
+
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._send(411, "Content-Length required\n")
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be skipped, so the connection cannot be reused
+            self.close_connection = True
+            self._send(400, "Invalid Content-Length\n")
+            return
+        if length > MAX_REQUEST_BYTES:
+            self._send(413, f"Request body larger than {MAX_REQUEST_BYTES} bytes\n")
+            return
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        content_type = self.headers.get('Content-Type', '')
+        input_format = params.get('input') or ('html' if content_type.startswith('text/html') else 'markdown')
+        output_format = params.get('format', 'pdf')
+
+        try:
+            source = self.rfile.read(length).decode('utf-8')
+            data, coalesced = self.server.service.render(
+                source, input_format, output_format, build_date=params.get('date')
+            )
+        except (UnicodeDecodeError, ValueError) as e:
+            self._send(400, f"{type(e).__name__}: {e}\n")
+            return
+        except Exception as e:
+            self._send(500, f"{type(e).__name__}: {e}\n")
+            return
+
+        self._send(200, data, CONTENT_TYPES[output_format],
+                   headers={'X-Render-Coalesced': 'true' if coalesced else 'false'})
+
+
+class RenderHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server on a TCP port"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, RenderRequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+class RenderUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server on a Unix domain socket"""
+
+    daemon_threads = True
+
+    def __init__(self, path, service, quiet=False):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, RenderRequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def main(argv=None):
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Serve Markdown/HTML to HTML/PDF renders with warm engines")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to bind (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port (default: %(default)s)")
+    parser.add_argument('--socket', default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--css', default=str(DEFAULT_CSS), help="stylesheet path")
+    parser.add_argument('--assets', default=str(DEFAULT_ASSET_DIR),
+                        help="only directory documents may load images from (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="concurrent renders (default: CPU count)")
+    parser.add_argument('--quiet', action='store_true', help="do not log requests")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.css, args.workers, asset_dir=args.assets)
+    print("Starting WeasyPrint...")
+    service.start()
+
+    if args.socket:
+        server = RenderUnixServer(args.socket, service, quiet=args.quiet)
+        print(f"✓ Serving on unix:{args.socket}")
+    else:
+        server = RenderHTTPServer((args.host, args.port), service, quiet=args.quiet)
+        print(f"✓ Serving on http://{args.host}:{server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
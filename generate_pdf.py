@@ -4,84 +4,725 @@ Brrow Documentation Markdown to PDF Converter
 Using markdown2 + HTML + print to PDF approach
 """
 
+import collections
+import io
 import markdown2
 import re
 import subprocess
 import os
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime, timezone
+from html import escape
 
-def extract_toc(markdown_content):
-    """Extract table of contents from markdown headers"""
-    lines = markdown_content.split('\n')
-    toc_items = []
+import css_prune
+from docs_build_cache import BuildCache, FragmentCache
+from docs_metrics import PipelineMetrics, quiet
+from pdf_backends import BackendRegistry, chrome_print_command, get_backend
+from pdf_postprocess import format_report, optimize_pdf
 
+# markdown2 extras used for every conversion (also part of the build cache key)
+MARKDOWN_EXTRAS = [
+    'fenced-code-blocks',
+    'tables',
+    'code-friendly',
+    'cuddled-lists',
+    'header-ids',
+    'task_list',
+    'strike',
+    'target-blank-links',
+]
+
+# Characters encoded per write when streaming HTML to disk
+WRITE_SLICE_CHARS = 1024 * 1024
+# Markdown converted per markdown2 call in streaming mode
+STREAM_BLOCK_CHARS = 1024 * 1024
+# Inputs larger than this are converted in streaming mode by default
+STREAMING_THRESHOLD_BYTES = 32 * 1024 * 1024
+# Deepest header level listed in the TOC and the PDF outline
+TOC_DEPTH = 2
+# Highlighted code blocks a CodeHighlighter keeps in memory (least recently used are dropped)
+HIGHLIGHT_MEMORY_BLOCKS = 1024
+# markdown2 internals CodeHighlighter.prime() relies on to find fenced blocks
+MARKDOWN2_FENCE_INTERNALS = ('_ws_only_line_re', '_detab', '_uniform_outdent')
+# Cover subtitle and <title> of the system documentation
+DEFAULT_SUBTITLE = "Complete System Documentation"
+DEFAULT_TITLE = f"Brrow {DEFAULT_SUBTITLE}"
+
+FENCE_RE = re.compile(r'^[ \t]*(`{3,}|~{3,})')
+# Same header rules as markdown2 (ATX "# Title #" and setext underlines)
+ATX_HEADER_RE = re.compile(r'^(#{1,6})[ \t]*(.+?)[ \t]*(?<!\\)#*$')
+SETEXT_UNDERLINE_RE = re.compile(r'^(=+|-+)[ \t]*$')
+# Raw HTML block openers (markdown2 passes these blocks through untouched)
+HTML_BLOCK_TAGS = ('address|article|aside|blockquote|body|details|dialog|div|dl|fieldset|figcaption|figure|'
+                   'footer|form|h[1-6]|head|header|hr|html|iframe|ins|del|main|math|menu|nav|noscript|ol|p|'
+                   'pre|script|section|style|summary|table|ul')
+HTML_BLOCK_OPEN_RE = re.compile(r'^<(%s)\b' % HTML_BLOCK_TAGS, re.I)
+# markdown2 fences are backticks only, with at most a bare language name
+MARKDOWN2_FENCE_RE = re.compile(r'^([ \t]*`{3,})[ \t]*([\w+-]+)?[ \t]*$')
+
+def slugify(text):
+    """Anchor ID for header text (markdown2's own slug, so TOC links match header-ids)"""
+    return markdown2._slugify(text)
+
+def unique_slug(text, counts, prefix=None):
+    """
+    Slugify text, suffixing repeats "-2", "-3", ... like markdown2 does
+
+    Args:
+        text: Header text
+        counts: Dict of slug -> times seen, updated in place
+        prefix: Optional header-ids prefix
+    """
+    slug = slugify(text)
+    if prefix and isinstance(prefix, str):
+        slug = prefix + '-' + slug
+    counts[slug] = counts.get(slug, 0) + 1
+    if not slug or counts[slug] > 1:
+        slug = f'{slug}-{counts[slug]}'
+    return slug
+
+def renderer_version():
+    """markdown2 and Pygments versions, for cache keys of rendered output"""
+    try:
+        import pygments
+        pygments_version = pygments.__version__
+    except ImportError:
+        pygments_version = 'none'
+    return f"markdown2 {markdown2.__version__}/pygments {pygments_version}"
+
+class CodeHighlighter:
+    """
+    Pygments highlighting for fenced code blocks, cached by content
+
+    Highlighted blocks are stored in a FragmentCache keyed on (lexer,
+    formatter options incl. style, Pygments version, code), so identical
+    snippets across reports and rebuilds are tokenized once. Lexers and the
+    formatter are created once per highlighter instead of once per block.
+    Output is identical to markdown2's own highlighting. The in-memory memo
+    holds the HIGHLIGHT_MEMORY_BLOCKS most recently used blocks.
+
+    Args:
+        cache: FragmentCache for highlighted blocks (None: in-memory only)
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lexers = {}
+        self._formatters = {}
+
+    def __getstate__(self):
+        # Sent to worker processes without the per-process memo
+        return {'cache': self.cache}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache'])
+
+    def lexer(self, name):
+        """Pygments lexer for a fence language, or None (like markdown2)"""
+        if name not in self._lexers:
+            try:
+                from pygments import lexers, util
+            except ImportError:
+                self._lexers[name] = None
+            else:
+                try:
+                    self._lexers[name] = lexers.get_lexer_by_name(name)
+                except util.ClassNotFound:
+                    self._lexers[name] = None
+        return self._lexers[name]
+
+    def _formatter(self, formatter_opts):
+        import pygments.formatters
+
+        opts = dict(formatter_opts)
+        opts.setdefault('cssclass', 'codehilite')
+        options_key = repr(sorted(opts.items()))
+        if options_key not in self._formatters:
+
+            # Same wrapping as markdown2's formatter (pygments >= 2.12)
+            class HtmlCodeFormatter(pygments.formatters.HtmlFormatter):
+                def _wrap_code(self, inner):
+                    yield 0, "<code>"
+                    yield from inner
+                    yield 0, "</code>"
+
+                def _add_newline(self, inner):
+                    yield 0, "\n"
+                    yield from inner
+                    yield 0, "\n"
+
+                def wrap(self, source, outfile=None):
+                    return self._add_newline(self._wrap_pre(self._wrap_code(source)))
+
+            self._formatters[options_key] = HtmlCodeFormatter(**opts)
+        return self._formatters[options_key]
+
+    def _key(self, codeblock, lexer, formatter_opts):
+        import pygments
+
+        namespace = f"highlight/{pygments.__version__}/{type(lexer).__name__}/{sorted(formatter_opts.items())!r}"
+        if self.cache is not None:
+            return self.cache.key(codeblock, namespace)
+        return (namespace, codeblock)
+
+    def highlight(self, codeblock, lexer, formatter_opts=None):
+        """Highlighted HTML for one code block"""
+        return self.highlight_many([(codeblock, lexer)], formatter_opts)[0]
+
+    def highlight_many(self, blocks, formatter_opts=None):
+        """
+        Highlight a batch of blocks in one pass
+
+        Cached blocks are looked up first; the misses are tokenized with
+        the shared formatter and stored.
+
+        Args:
+            blocks: List of (codeblock, lexer) pairs
+            formatter_opts: HtmlFormatter options (e.g. {'style': 'monokai'})
+
+        Returns:
+            List of highlighted HTML strings, in order
+        """
+        import pygments
+
+        formatter_opts = formatter_opts or {}
+        results = []
+        for codeblock, lexer in blocks:
+            key = self._key(codeblock, lexer, formatter_opts)
+            html = self._memory.get(key)
+            if html is not None:
+                self._memory.move_to_end(key)
+            elif self.cache is not None:
+                html = self.cache.get(key)
+            if html is None:
+                html = pygments.highlight(codeblock, lexer, self._formatter(formatter_opts))
+                if self.cache is not None:
+                    self.cache.put(key, html)
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._memory[key] = html
+            if len(self._memory) > HIGHLIGHT_MEMORY_BLOCKS:
+                self._memory.popitem(last=False)
+            results.append(html)
+        return results
+
+    def prime(self, markdown_content, extras=MARKDOWN_EXTRAS):
+        """
+        Highlight every fenced block of a document in one batch
+
+        Blocks are found the way markdown2's fenced-code-blocks extra finds
+        them, so the conversion that follows only reads the cache. If this
+        markdown2 lacks the internals used for that (MARKDOWN2_FENCE_INTERNALS),
+        nothing is primed and blocks are highlighted one by one as converted.
+
+        Returns:
+            Number of blocks found
+        """
+        if 'fenced-code-blocks' not in extras or '```' not in markdown_content:
+            return 0
+        fenced_code_blocks = getattr(markdown2, 'FencedCodeBlocks', None)
+        if (not all(hasattr(markdown2.Markdown, name) for name in MARKDOWN2_FENCE_INTERNALS)
+                or not hasattr(fenced_code_blocks, 'fenced_code_block_re')):
+            return 0
+        md = markdown2.Markdown()
+        text = markdown_content.replace("\r\n", "\n").replace("\r", "\n") + "\n\n"
+        text = md._ws_only_line_re.sub("", md._detab(text))
+
+        blocks = []
+        for match in fenced_code_blocks.fenced_code_block_re.finditer(text):
+            lexer = self.lexer(match.group(2)) if match.group(2) else None
+            if lexer is None:
+                continue
+            leading_indent = ' ' * (len(match.group(1)) - len(match.group(1).lstrip()))
+            _, codeblock = md._uniform_outdent(match.group(3)[:-1], max_outdent=leading_indent)
+            for old, new in (("&amp;", "&"), ("&lt;", "<"), ("&gt;", ">")):
+                codeblock = codeblock.replace(old, new)
+            blocks.append((codeblock, lexer))
+
+        formatter_opts = extras.get('fenced-code-blocks') if isinstance(extras, dict) else None
+        self.highlight_many(blocks, formatter_opts)
+        return len(blocks)
+
+class DocsMarkdown(markdown2.Markdown):
+    """
+    markdown2 converter whose header IDs come from unique_slug(), with
+    fenced code blocks highlighted through an optional CodeHighlighter
+    """
+
+    def __init__(self, *args, highlighter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.highlighter = highlighter
+
+    def header_id_from_text(self, text, prefix, n=None):
+        return unique_slug(text, self._count_from_header_id, prefix)
+
+    def _color_with_pygments(self, codeblock, lexer, **formatter_opts):
+        if self.highlighter is None:
+            return super()._color_with_pygments(codeblock, lexer, **formatter_opts)
+        return self.highlighter.highlight(codeblock, lexer, formatter_opts)
+
+def markdown_to_html(markdown_content, extras=MARKDOWN_EXTRAS, highlighter=None):
+    """
+    Convert markdown to HTML; headers get IDs matching scan_headings()
+
+    Args:
+        highlighter: Optional CodeHighlighter that caches code highlighting
+    """
+    return DocsMarkdown(extras=extras, highlighter=highlighter).convert(markdown_content)
+
+def _numbered_lines(lines):
+    """Yield (character offset, text without line ending) for each line"""
+    offset = 0
     for line in lines:
-        # Match headers (h1-h3 for TOC)
-        match = re.match(r'^(#{1,3})\s+(.+)$', line)
+        text = line[:-1] if line.endswith('\n') else line
+        yield offset, text.rstrip('\r')
+        offset += len(text) + 1
+
+def _scan_header_lines(numbered):
+    """Yield (level, title, offset) for header lines among (offset, text) pairs"""
+    numbered = iter(numbered)
+    line = next(numbered, None)
+
+    while line is not None:
+        offset, text = line
+        line = next(numbered, None)
+
+        fence_match = MARKDOWN2_FENCE_RE.match(text)
+        if fence_match:
+            # Hold the fenced lines: markdown2 only treats them as code once
+            # the fence closes
+            fenced = []
+            while line is not None and not line[1].rstrip(' \t').endswith(fence_match.group(1)):
+                fenced.append(line)
+                line = next(numbered, None)
+            if line is not None:
+                line = next(numbered, None)
+            else:
+                # Never closed, so it was text after all
+                yield from _scan_header_lines(fenced)
+            continue
+
+        if not text:
+            continue
+
+        underline = SETEXT_UNDERLINE_RE.match(line[1]) if line is not None else None
+        if underline:
+            line = next(numbered, None)
+            # A lone "-" under text is not a header
+            if underline.group(1) != '-':
+                yield (1 if underline.group(1)[0] == '=' else 2), text.strip(), offset
+            continue
+
+        match = ATX_HEADER_RE.match(text)
         if match:
-            level = len(match.group(1))
-            title = match.group(2)
-            # Create anchor-friendly ID
-            anchor_id = re.sub(r'[^\w\s-]', '', title.lower())
-            anchor_id = re.sub(r'[-\s]+', '-', anchor_id)
-            toc_items.append({
-                'level': level,
-                'title': title,
-                'anchor': anchor_id
-            })
-
-    return toc_items
-
-def add_anchors_to_headers(html_content):
-    """Add ID anchors to headers for TOC linking"""
-    def replace_header(match):
-        tag = match.group(1)
-        content = match.group(2)
-        # Create anchor-friendly ID from content
-        anchor_id = re.sub(r'[^\w\s-]', '', content.lower())
-        anchor_id = re.sub(r'[-\s]+', '-', anchor_id)
-        anchor_id = re.sub(r'<[^>]+>', '', anchor_id)  # Remove HTML tags
-        return f'<{tag} id="{anchor_id}">{content}</{tag}>'
-
-    # Replace h1, h2, h3 tags
-    html_content = re.sub(r'<(h[1-3])>(.*?)</\1>', replace_header, html_content)
-    return html_content
-
-def generate_toc_html(toc_items):
-    """Generate HTML table of contents"""
-    toc_html = '''
+            yield len(match.group(1)), match.group(2), offset
+
+def iter_headings(lines):
+    """
+    Lazily yield the heading table from an iterable of markdown lines
+
+    Follows markdown2's header and fence rules (setext underlines win over
+    ATX, headers inside fenced code are ignored) and its slug suffixes, so
+    every anchor matches the ID header-ids renders. Lines may keep their
+    line endings, so an open text file can be passed directly.
+
+    Yields:
+        Dicts with level, title, anchor and offset (character offset of the
+        header line), in document order
+    """
+    counts = {}
+    for level, title, offset in _scan_header_lines(_numbered_lines(lines)):
+        yield {
+            'level': level,
+            'title': title,
+            'anchor': unique_slug(title, counts),
+            'offset': offset,
+        }
+
+def scan_headings(markdown_content):
+    """Build the heading table for a markdown string (see iter_headings)"""
+    return list(iter_headings(markdown_content.split('\n')))
+
+def document_title(lines, fallback):
+    """Text of the first h1 among markdown lines, or fallback (e.g. the file name)"""
+    for heading in iter_headings(lines):
+        if heading['level'] == 1:
+            return heading['title']
+    return fallback
+
+def extract_toc(markdown_content, max_level=3):
+    """
+    Extract table of contents entries (h1-h3 by default) from markdown headers
+
+    Args:
+        markdown_content: Markdown string, or an iterable of lines such as
+            an open file
+        max_level: Deepest header level to include
+    """
+    lines = markdown_content.split('\n') if isinstance(markdown_content, str) else markdown_content
+    return [item for item in iter_headings(lines) if item['level'] <= max_level]
+
+LINK_DEF_RE = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S')
+HEADER_ID_RE = re.compile(r'<(h[1-6]) id="([^"]*)">')
+
+def split_sections(markdown_content, max_level=2):
+    """
+    Split markdown into sections that start at h1..h<max_level> headers
+
+    Splits happen only at headers that follow a blank line; headers inside
+    fenced code blocks and raw HTML blocks are ignored, and setext headers
+    ("Title" over "=====") split before their title line. Joining the
+    returned sections gives back the original text.
+    """
+    return list(iter_sections(markdown_content.splitlines(keepends=True), max_level))
+
+def iter_sections(lines, max_level=2):
+    """Lazily yield split_sections() sections from lines that keep their endings"""
+    header_re = re.compile(r'^#{1,%d}\s' % max_level)
+    underline_re = re.compile(r'^(=+|-+)[ \t]*$' if max_level >= 2 else r'^(=+)[ \t]*$')
+    current = []
+    has_content = False
+    fence = None
+    html_close = None
+
+    for line in lines:
+        stripped = line.rstrip('\r\n')
+        if html_close is not None:
+            # Inside a raw HTML block until its closing tag ends a line
+            if stripped.rstrip().lower().endswith(html_close):
+                html_close = None
+            current.append(line)
+            continue
+
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None:
+            html_match = HTML_BLOCK_OPEN_RE.match(line)
+            if html_match:
+                close = f'</{html_match.group(1).lower()}>'
+                if not stripped.rstrip().lower().endswith(close):
+                    html_close = close
+            elif header_re.match(line) and has_content and not current[-1].strip():
+                # Only after a blank line: otherwise lists and quotes may
+                # absorb the header as a lazy continuation line
+                yield ''.join(current)
+                current = []
+                has_content = False
+            elif underline_re.match(stripped) and stripped != '-' and len(current) > 1 \
+                    and current[-1].strip() and not current[-2].strip() and any(l.strip() for l in current[:-1]):
+                # Setext header: its title line starts the new section
+                yield ''.join(current[:-1])
+                current = current[-1:]
+        current.append(line)
+        # Leading blank lines stay with the first section that has content
+        has_content = has_content or bool(stripped.strip())
+
+    if current:
+        yield ''.join(current)
+
+def extract_link_definitions(markdown_content):
+    """
+    Collect reference-style link definitions outside fenced code blocks
+
+    Args:
+        markdown_content: Markdown string, or an iterable of lines such as
+            an open file
+    """
+    lines = markdown_content.splitlines() if isinstance(markdown_content, str) else markdown_content
+    definitions = []
+    fence = None
+
+    for line in lines:
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None and LINK_DEF_RE.match(line):
+            definitions.append(line.rstrip('\r\n'))
+
+    return '\n'.join(definitions)
+
+def restitch_header_ids(fragment, counts):
+    """
+    Renumber header ID suffixes in one fragment against document-wide counts
+
+    The fragment was converted on its own, so markdown2 only de-duplicated
+    IDs within it. Suffixes are recomputed with the same "-2", "-3" scheme
+    markdown2 uses; counts (base slug -> times seen) is updated in place and
+    carried over to the next fragment.
+    """
+    local_counts = {}
+
+    def replace_id(match):
+        tag, header_id = match.group(1), match.group(2)
+
+        # Recover the base slug if markdown2 suffixed a duplicate locally;
+        # an empty slug (punctuation-only title) is numbered from "-1"
+        base_id = header_id
+        suffix = re.match(r'^(.*)-(\d+)$', header_id)
+        if suffix:
+            seen = local_counts.get(suffix.group(1), 0)
+            if seen == int(suffix.group(2)) - 1 and (seen or not suffix.group(1)):
+                base_id = suffix.group(1)
+        local_counts[base_id] = local_counts.get(base_id, 0) + 1
+
+        counts[base_id] = counts.get(base_id, 0) + 1
+        if not base_id or counts[base_id] > 1:
+            header_id = f'{base_id}-{counts[base_id]}'
+        else:
+            header_id = base_id
+        return f'<{tag} id="{header_id}">'
+
+    return HEADER_ID_RE.sub(replace_id, fragment)
+
+def stitch_fragments(fragments):
+    """
+    Join independently rendered HTML fragments with globally unique header IDs
+
+    The result matches a whole-document render.
+    """
+    counts = {}
+    # markdown2 separates top-level blocks with a blank line
+    return '\n'.join(restitch_header_ids(fragment, counts) for fragment in fragments)
+
+def render_markdown_incremental(markdown_content, cache, extras=MARKDOWN_EXTRAS, highlighter=None):
+    """
+    Convert markdown to HTML section by section, reusing cached fragments
+
+    Sections are split at h1/h2 boundaries and keyed on their text, so an
+    edit only re-converts the sections it touches (and only highlights the
+    code blocks in those sections, through the optional CodeHighlighter).
+
+    Returns:
+        Tuple of (html_content, converted_count, total_count)
+    """
+    namespace = f"{renderer_version()}|{','.join(extras)}"
+    link_definitions = extract_link_definitions(markdown_content)
+
+    fragments = []
+    converted = 0
+    sections = split_sections(markdown_content)
+
+    for section in sections:
+        # Link definitions may live in other sections; append them so
+        # references still resolve (they produce no output of their own)
+        source = section + '\n\n' + link_definitions if link_definitions else section
+        key = cache.key(source, namespace)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = markdown_to_html(source, extras, highlighter)
+            cache.put(key, fragment)
+            converted += 1
+        fragments.append(fragment)
+
+    if converted:
+        cache.evict()
+
+    return stitch_fragments(fragments), converted, len(sections)
+
+def group_sections(sections, chunks):
+    """Join consecutive sections into about `chunks` pieces of similar size"""
+    target = sum(len(section) for section in sections) / chunks
+    grouped = []
+    current = []
+    size = 0
+    for section in sections:
+        current.append(section)
+        size += len(section)
+        if size >= target:
+            grouped.append(''.join(current))
+            current = []
+            size = 0
+    if current:
+        grouped.append(''.join(current))
+    return grouped
+
+def render_markdown_parallel(markdown_content, workers=None, extras=MARKDOWN_EXTRAS, executor=None,
+                             highlighter=None):
+    """
+    Convert markdown to HTML in a process pool, split at h1 sections
+
+    Sections never split inside fenced code. Header IDs are renumbered
+    across chunks by stitch_fragments(), so the result is byte-identical to
+    markdown_to_html(markdown_content, extras).
+
+    Args:
+        markdown_content: Markdown source
+        workers: Worker processes (default: CPU count)
+        extras: markdown2 extras
+        executor: Optional ProcessPoolExecutor to reuse
+        highlighter: Optional CodeHighlighter (each worker gets a copy
+            sharing its persistent cache)
+
+    Returns:
+        HTML string
+    """
+    workers = workers or os.cpu_count() or 1
+    sections = split_sections(markdown_content, max_level=1)
+
+    # Footnote numbering and the footnote list span the whole document
+    if workers < 2 or len(sections) < 2 or 'footnotes' in extras:
+        return markdown_to_html(markdown_content, extras, highlighter)
+
+    # A few chunks per worker keeps the pool busy when sections differ in size
+    chunks = group_sections(sections, workers * 4)
+
+    # Link definitions may live in other chunks; append them so references
+    # still resolve (they produce no output of their own)
+    link_definitions = extract_link_definitions(markdown_content)
+    if link_definitions:
+        chunks = [chunk + '\n\n' + link_definitions for chunk in chunks]
+
+    args = (chunks, [extras] * len(chunks), [highlighter] * len(chunks))
+    if executor is not None:
+        fragments = list(executor.map(markdown_to_html, *args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            fragments = list(pool.map(markdown_to_html, *args))
+
+    return stitch_fragments(fragments)
+
+def generate_toc_html(toc_items, depth=TOC_DEPTH):
+    """
+    Generate the HTML table of contents as nested lists
+
+    Page numbers are filled in at layout time by the target-counter() rule
+    for .toc links in pdf_styles.css, so no second render is needed.
+
+    Args:
+        toc_items: Headings from extract_toc()
+        depth: Deepest header level to list
+    """
+    parts = ['''
     <div class="toc">
         <h1>Table of Contents</h1>
-        <ul>
-    '''
+        <ul>''']
+    # [level, has child list] of each <li> still open
+    open_items = []
 
-    current_level = 0
     for item in toc_items:
         level = item['level']
-
-        # Only include h1 and h2 in TOC for cleaner look
-        if level > 2:
+        if level > depth:
             continue
 
-        indent = '&nbsp;' * (level - 1) * 4
-        toc_html += f'''
-            <li>{indent}<a href="#{item['anchor']}">{item['title']}</a></li>
-        '''
+        # Close entries at the same or a deeper level
+        while open_items and open_items[-1][0] >= level:
+            _, has_children = open_items.pop()
+            if has_children:
+                parts.append('</ul>')
+            parts.append('</li>')
+        # Nest under the enclosing entry
+        if open_items and not open_items[-1][1]:
+            parts.append('<ul>')
+            open_items[-1][1] = True
+
+        indent = '    ' * (len(open_items) + 3)
+        parts.append(f'''
+{indent}<li class="toc-level-{level}"><a href="#{item['anchor']}">{item['title']}</a>''')
+        open_items.append([level, False])
 
-    toc_html += '''
+    while open_items:
+        _, has_children = open_items.pop()
+        if has_children:
+            parts.append('</ul>')
+        parts.append('</li>')
+
+    parts.append('''
         </ul>
     </div>
-    '''
-    return toc_html
+    ''')
+    return ''.join(parts)
+
+def bookmark_css(depth=TOC_DEPTH):
+    """
+    CSS limiting the PDF outline (WeasyPrint bookmarks) to the TOC depth
+
+    WeasyPrint bookmarks every h1-h6 by default; headings deeper than depth
+    are left out so the outline matches the printed TOC.
+    """
+    deeper = ', '.join(f'h{level}' for level in range(depth + 1, 7))
+    return f'{deeper} {{ bookmark-level: none; }}' if deeper else ''
+
+def pinned_build_date(build_date=None):
+    """
+    Build date pinned for a reproducible build, or None
+
+    Args:
+        build_date: date/datetime or "YYYY-MM-DD"; when None, the
+            SOURCE_DATE_EPOCH environment variable (seconds, UTC) is used
+
+    Returns:
+        datetime.date, or None when neither is set
+    """
+    if build_date is None:
+        epoch = os.environ.get('SOURCE_DATE_EPOCH')
+        if not epoch:
+            return None
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc).date()
+    if isinstance(build_date, datetime):
+        return build_date.date()
+    if isinstance(build_date, date):
+        return build_date
+    return date.fromisoformat(build_date)
+
+def resolve_build_date(build_date=None):
+    """Date stamped into the cover page and PDF metadata (pinned date or today)"""
+    return pinned_build_date(build_date) or date.today()
+
+def pdf_date(build_date=None):
+    """Build date as a PDF date string (midnight UTC)"""
+    return resolve_build_date(build_date).strftime("D:%Y%m%d000000Z")
+
+def make_pdf_reproducible(pdf_file, build_date=None):
+    """
+    Rewrite a PDF so unchanged input gives a byte-identical file
+
+    Browser backends stamp the current time and a random document ID; this
+    replaces the creation/modification dates with the build date, drops
+    the XMP packet (which repeats both), and derives the ID from the content.
+
+    Args:
+        pdf_file: PDF to rewrite in place
+        build_date: date/datetime or "YYYY-MM-DD" (default: SOURCE_DATE_EPOCH or today)
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    # Drop the random ID before cloning, so the writer starts without one
+    reader = PdfReader(pdf_file)
+    reader.trailer.pop('/ID', None)
+    writer = PdfWriter(clone_from=reader)
+    stamp = pdf_date(build_date)
+    writer.add_metadata({'/CreationDate': stamp, '/ModDate': stamp})
+    if '/Metadata' in writer.root_object:
+        del writer.root_object['/Metadata']
+
+    # Without a previous ID both halves are the hash of the document
+    writer.generate_file_identifiers()
+
+    with open(pdf_file, 'wb') as f:
+        writer.write(f)
+    return pdf_file
 
-def create_cover_page():
-    """Generate cover page HTML"""
-    current_date = datetime.now().strftime("%B %d, %Y")
+def create_cover_page(build_date=None, subtitle=DEFAULT_SUBTITLE):
+    """Generate cover page HTML (dated with the pinned build date or today)"""
+    current_date = resolve_build_date(build_date).strftime("%B %d, %Y")
     return f'''
     <div class="cover-page">
         <h1>Brrow</h1>
-        <div class="subtitle">Complete System Documentation</div>
+        <div class="subtitle">{escape(subtitle, quote=False)}</div>
         <div class="date">Generated on {current_date}</div>
     </div>
     '''
@@ -91,121 +732,315 @@ def read_css(css_file):
     with open(css_file, 'r', encoding='utf-8') as f:
         return f.read()
 
-def convert_markdown_to_html(markdown_file, output_html, css_file):
+def iter_html_document(html_content, css_content, cover_html, toc_html,
+                       title=DEFAULT_TITLE, build_date=None, toc_depth=TOC_DEPTH):
+    """
+    Yield the full HTML document as chunks, in order
+
+    The body (a string, or an iterable of strings for streaming) is yielded
+    as-is, so writing the chunks never holds a second copy of the document
+    in memory. The build date goes into dcterms meta tags, which WeasyPrint
+    writes as the PDF creation/modification dates, and toc_depth limits the
+    PDF outline (see bookmark_css).
+    """
+    created = resolve_build_date(build_date).isoformat()
+    yield f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="dcterms.created" content="{created}">
+    <meta name="dcterms.modified" content="{created}">
+    <title>{escape(title, quote=False)}</title>
+    <style>
+    '''
+    yield css_content
+    yield f'''
+    </style>
+    <style>{bookmark_css(toc_depth)}</style>
+</head>
+<body>
+    '''
+    yield cover_html
+    yield '''
+    '''
+    yield toc_html
+    yield '''
+    <div class="content">
+        '''
+    if isinstance(html_content, str):
+        yield html_content
+    else:
+        yield from html_content
+    yield '''
+    </div>
+</body>
+</html>
+'''
+
+def strip_embedded_css(html_string):
+    """
+    Remove the stylesheet iter_html_document() embeds, keeping the rest
+
+    For laying out a written document with an already parsed copy of the
+    stylesheet instead of re-parsing the inline one.
+    """
+    start = html_string.find('<style>')
+    end = html_string.find('</style>', start)
+    if start < 0 or end < 0 or end > html_string.find('</head>'):
+        return html_string
+    return html_string[:start] + html_string[end + len('</style>'):]
+
+def write_chunks(chunks, destination, encoding='utf-8'):
+    """
+    Write text chunks to a path or an open writable
+
+    Args:
+        chunks: Iterable of str
+        destination: File path, text file, or binary writable (file opened
+            with 'wb', socket.makefile('wb'), BytesIO, ...)
+        encoding: Encoding used for paths and binary writables
+
+    Returns:
+        Number of encoded bytes written
+    """
+    if not hasattr(destination, 'write'):
+        with open(destination, 'wb') as f:
+            return write_chunks(chunks, f, encoding)
+
+    binary = isinstance(destination, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(destination, 'mode', '')
+    written = 0
+    for chunk in chunks:
+        # Encode large chunks (the body) in slices to avoid a full bytes copy
+        for start in range(0, len(chunk), WRITE_SLICE_CHARS):
+            piece = chunk[start:start + WRITE_SLICE_CHARS]
+            data = piece.encode(encoding)
+            written += len(data)
+            destination.write(data if binary else piece)
+    return written
+
+def convert_markdown_to_html(markdown_file, output_html, css_file, fragment_cache=None,
+                             progress=print, metrics=None, workers=None, build_date=None, highlighter=None,
+                             prune_css=False, toc_depth=TOC_DEPTH, title=None):
     """
     Convert Markdown to HTML with professional styling
 
     Args:
         markdown_file: Path to input markdown file
-        output_html: Path to output HTML file
+        output_html: Path to output HTML file, or an open writable (text or
+            binary) the document is streamed to
         css_file: Path to CSS stylesheet
+        fragment_cache: Optional FragmentCache; when given only changed
+            sections are re-converted
+        progress: Callback receiving progress messages (default: print)
+        metrics: Optional PipelineMetrics that receives one record per stage
+        workers: Convert h1 sections in this many processes (ignored when
+            fragment_cache is given)
+        build_date: Date for the cover page and PDF metadata (date or
+            "YYYY-MM-DD"; default: SOURCE_DATE_EPOCH or today)
+        highlighter: CodeHighlighter for fenced code blocks; pass one with
+            a FragmentCache to reuse highlighting across runs (default: a
+            new in-memory highlighter)
+        prune_css: Embed only the CSS rules that can match this document
+            (see css_prune)
+        toc_depth: Deepest header level in the TOC and PDF outline
+        title: Document title for <title> and the cover subtitle (default:
+            the system documentation title)
     """
-    print(f"Reading markdown file: {markdown_file}")
-
-    # Read markdown content
-    with open(markdown_file, 'r', encoding='utf-8') as f:
-        markdown_content = f.read()
+    metrics = metrics if metrics is not None else PipelineMetrics()
+    progress = progress or quiet
+    highlighter = highlighter if highlighter is not None else CodeHighlighter()
 
-    print("Converting markdown to HTML...")
+    progress(f"Reading markdown file: {markdown_file}")
 
-    # Configure markdown2 with extras
-    extras = [
-        'fenced-code-blocks',
-        'tables',
-        'code-friendly',
-        'cuddled-lists',
-        'header-ids',
-        'task_list',
-        'strike',
-        'target-blank-links',
-    ]
+    # Read markdown content
+    with metrics.stage('read') as stage:
+        with open(markdown_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+        stage['output_bytes'] = len(markdown_content.encode('utf-8'))
 
-    # Convert markdown to HTML
-    html_content = markdown2.markdown(markdown_content, extras=extras)
+    progress("Converting markdown to HTML...")
 
-    print("Generating table of contents...")
+    # Convert markdown to HTML (the highlighter may be shared with other documents,
+    # so only this document's share of its hit/miss counts is reported)
+    hits, misses = highlighter.hits, highlighter.misses
+    with metrics.stage('markdown', input_bytes=stage['output_bytes']) as stage:
+        if fragment_cache is not None:
+            html_content, converted, total = render_markdown_incremental(
+                markdown_content, fragment_cache, highlighter=highlighter
+            )
+            stage.update(sections_converted=converted, sections_total=total)
+            progress(f"Re-converted {converted} of {total} sections")
+        elif workers and workers > 1:
+            html_content = render_markdown_parallel(markdown_content, workers, highlighter=highlighter)
+            stage['workers'] = workers
+        else:
+            # Highlight every code block in one batch, then convert
+            highlighter.prime(markdown_content)
+            html_content = markdown_to_html(markdown_content, highlighter=highlighter)
+        stage.update(code_blocks_highlighted=highlighter.misses - misses, code_blocks_cached=highlighter.hits - hits)
+        stage['output_bytes'] = len(html_content)
 
-    # Extract TOC from original markdown
-    toc_items = extract_toc(markdown_content)
+    progress("Generating table of contents...")
 
-    # Add anchors to headers
-    html_content = add_anchors_to_headers(html_content)
+    # Extract TOC from original markdown (anchors match the rendered header IDs)
+    with metrics.stage('toc') as stage:
+        toc_items = extract_toc(markdown_content, toc_depth)
+        stage['headings'] = len(toc_items)
 
     # Generate cover page
-    cover_html = create_cover_page()
+    build_date = resolve_build_date(build_date)
+    cover_html = create_cover_page(build_date, title or DEFAULT_SUBTITLE)
 
     # Generate TOC HTML
-    toc_html = generate_toc_html(toc_items)
+    with metrics.stage('toc_html') as stage:
+        toc_html = generate_toc_html(toc_items, toc_depth)
+        stage['output_bytes'] = len(toc_html)
 
     # Read CSS
-    css_content = read_css(css_file)
+    with metrics.stage('css') as stage:
+        css_content = read_css(css_file)
+        stage['output_bytes'] = len(css_content)
 
-    # Combine into full HTML document
-    full_html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Brrow Complete System Documentation</title>
-    <style>
-    {css_content}
-    </style>
-</head>
-<body>
-    {cover_html}
-    {toc_html}
-    <div class="content">
-        {html_content}
-    </div>
-</body>
-</html>
-'''
+    # Drop rules no element of this document can match
+    if prune_css:
+        with metrics.stage('css_prune', input_bytes=len(css_content)) as stage:
+            css_content = css_prune.prune_css(css_content, [cover_html, toc_html, html_content], stage)
+            stage['output_bytes'] = len(css_content)
 
-    print("Writing HTML file...")
+    progress("Writing HTML file...")
 
-    # Write HTML file
-    with open(output_html, 'w', encoding='utf-8') as f:
-        f.write(full_html)
+    # Stream the full HTML document straight to the output
+    with metrics.stage('write', input_bytes=len(html_content)) as stage:
+        chunks = iter_html_document(html_content, css_content, cover_html, toc_html, title or DEFAULT_TITLE,
+                                    build_date=build_date, toc_depth=toc_depth)
+        file_size = write_chunks(chunks, output_html)
+        stage['output_bytes'] = file_size
 
-    print(f"HTML generated successfully: {output_html}")
+    progress(f"HTML generated successfully: {output_html}")
 
-    # Get file size
-    file_size = Path(output_html).stat().st_size
     file_size_kb = file_size / 1024
 
-    print(f"File size: {file_size_kb:.2f} KB")
+    progress(f"File size: {file_size_kb:.2f} KB")
+
+    return output_html
+
+def iter_markdown_blocks(lines, block_chars=STREAM_BLOCK_CHARS):
+    """
+    Group markdown lines into blocks of about block_chars for conversion
+
+    Blocks end on h1/h2 section boundaries, so fenced code, tables and lists
+    are never cut in half. A single section larger than block_chars becomes
+    its own block.
+    """
+    batch = []
+    size = 0
+    for section in iter_sections(lines):
+        batch.append(section)
+        size += len(section)
+        if size >= block_chars:
+            yield ''.join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield ''.join(batch)
+
+def convert_markdown_to_html_streaming(markdown_file, output_html, css_file, block_chars=STREAM_BLOCK_CHARS,
+                                       progress=print, metrics=None, build_date=None, highlighter=None,
+                                       toc_depth=TOC_DEPTH, title=None):
+    """
+    Convert Markdown to HTML within a fixed memory budget
+
+    The input is read line by line, never as a whole: one pass collects the
+    TOC and link definitions, a second converts it block by block and writes
+    each block's HTML as soon as it is rendered. Memory is bounded by
+    block_chars (or the largest h1/h2 section), not by the input size, and
+    the output matches convert_markdown_to_html().
+
+    Args:
+        markdown_file: Path to input markdown file
+        output_html: Path to output HTML file, or an open writable (text or
+            binary) the document is streamed to
+        css_file: Path to CSS stylesheet
+        block_chars: Markdown characters converted per markdown2 call
+        progress: Callback receiving progress messages (default: print)
+        metrics: Optional PipelineMetrics that receives one record per stage
+        build_date: Date for the cover page and PDF metadata (date or
+            "YYYY-MM-DD"; default: SOURCE_DATE_EPOCH or today)
+        highlighter: Optional CodeHighlighter for fenced code blocks
+        toc_depth: Deepest header level in the TOC and PDF outline
+        title: Document title for <title> and the cover subtitle (default:
+            the system documentation title)
+    """
+    metrics = metrics if metrics is not None else PipelineMetrics()
+    progress = progress or quiet
+    input_bytes = os.path.getsize(markdown_file)
+
+    progress(f"Streaming markdown file: {markdown_file}")
+
+    # First pass: headings and link definitions
+    with metrics.stage('toc', input_bytes=input_bytes) as stage:
+        with open(markdown_file, 'r', encoding='utf-8') as f:
+            toc_items = extract_toc(f, toc_depth)
+        with open(markdown_file, 'r', encoding='utf-8') as f:
+            link_definitions = extract_link_definitions(f)
+        stage['headings'] = len(toc_items)
+
+    build_date = resolve_build_date(build_date)
+    cover_html = create_cover_page(build_date, title or DEFAULT_SUBTITLE)
+
+    with metrics.stage('toc_html') as stage:
+        toc_html = generate_toc_html(toc_items, toc_depth)
+        stage['output_bytes'] = len(toc_html)
+
+    with metrics.stage('css') as stage:
+        css_content = read_css(css_file)
+        stage['output_bytes'] = len(css_content)
+
+    def iter_body(f, stage):
+        counts = {}
+        for index, block in enumerate(iter_markdown_blocks(f, block_chars)):
+            # Link definitions may live in other blocks; append them so
+            # references still resolve (they produce no output of their own)
+            source = block + '\n\n' + link_definitions if link_definitions else block
+            fragment = restitch_header_ids(markdown_to_html(source, highlighter=highlighter), counts)
+            stage['blocks'] = index + 1
+            if index:
+                # markdown2 separates top-level blocks with a blank line
+                yield '\n'
+            yield fragment
+
+    progress("Converting and writing HTML block by block...")
+
+    # Second pass: convert and write each block as it is rendered
+    with metrics.stage('stream', input_bytes=input_bytes) as stage:
+        with open(markdown_file, 'r', encoding='utf-8') as f:
+            chunks = iter_html_document(iter_body(f, stage), css_content, cover_html, toc_html,
+                                        title or DEFAULT_TITLE, build_date=build_date, toc_depth=toc_depth)
+            file_size = write_chunks(chunks, output_html)
+        stage['output_bytes'] = file_size
+
+    progress(f"HTML generated successfully: {output_html}")
+    progress(f"File size: {file_size / 1024:.2f} KB")
 
     return output_html
 
+def find_chrome():
+    """Return the path of an installed Chrome/Chromium, or None"""
+    return get_backend('chrome').find_binary()
+
 def convert_html_to_pdf_chrome(html_file, pdf_file):
     """Convert HTML to PDF using Chrome headless"""
     print("\nConverting HTML to PDF using Chrome...")
 
-    chrome_paths = [
-        '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
-        '/Applications/Chromium.app/Contents/MacOS/Chromium',
-        '/Applications/Google Chrome Canary.app/Contents/MacOS/Google Chrome Canary',
-    ]
-
-    chrome_path = None
-    for path in chrome_paths:
-        if os.path.exists(path):
-            chrome_path = path
-            break
+    chrome_path = find_chrome()
 
     if not chrome_path:
         print("Chrome not found. Trying Safari/WebKit...")
         return convert_html_to_pdf_webkit(html_file, pdf_file)
 
     # Convert using Chrome headless
-    cmd = [
-        chrome_path,
-        '--headless',
-        '--disable-gpu',
-        '--no-pdf-header-footer',
-        '--print-to-pdf=' + str(pdf_file),
-        'file://' + str(html_file)
-    ]
+    cmd = chrome_print_command(chrome_path, html_file, pdf_file)
 
     try:
         subprocess.run(cmd, check=True, capture_output=True, timeout=60)
@@ -215,6 +1050,59 @@ def convert_html_to_pdf_chrome(html_file, pdf_file):
         print(f"Error using Chrome: {e}")
         return convert_html_to_pdf_webkit(html_file, pdf_file)
 
+def convert_html_to_pdf(html_file, pdf_file, registry=None, hedge=False, hedge_delay=None, metrics=None,
+                        build_date=None, optimize=False, progress=print):
+    """
+    Convert HTML to PDF with the best available backend
+
+    Backends (Chrome/Chromium, WeasyPrint, wkhtmltopdf, Playwright,
+    cupsfilter) are probed once and cached, then tried in order of past
+    success rate and median latency.
+
+    Args:
+        html_file: Path to input HTML file
+        pdf_file: Path to output PDF file
+        registry: Optional BackendRegistry to reuse
+        hedge: Race the runner-up backend if the best one is slow
+        hedge_delay: Seconds before hedging (default: best backend's p95)
+        metrics: Optional PipelineMetrics that receives a 'pdf' stage record
+        build_date: When given (or SOURCE_DATE_EPOCH is set) the PDF is
+            rewritten with fixed dates and a content-derived ID
+        optimize: Deduplicate, recompress and linearize the PDF (see
+            pdf_postprocess)
+        progress: Callback receiving progress messages (default: print);
+            also used for backend failures when no registry is given
+    """
+    progress = progress or quiet
+    registry = registry or BackendRegistry(progress=progress)
+    metrics = metrics if metrics is not None else PipelineMetrics()
+    progress("\nConverting HTML to PDF...")
+
+    with metrics.stage('pdf', input_bytes=os.path.getsize(html_file)) as stage:
+        if hedge:
+            backend = registry.render_hedged(html_file, pdf_file, hedge_delay=hedge_delay)
+        else:
+            backend = registry.render(html_file, pdf_file)
+        stage['backend'] = backend
+        if backend:
+            if pinned_build_date(build_date):
+                make_pdf_reproducible(pdf_file, build_date)
+            stage['output_bytes'] = os.path.getsize(pdf_file)
+    if backend is None:
+        progress("No PDF backend succeeded")
+        progress("\nManual conversion required:")
+        progress(f"1. Open: {html_file}")
+        progress(f"2. Print to PDF: {pdf_file}")
+        return None
+
+    progress(f"PDF generated successfully with {backend}: {pdf_file}")
+
+    if optimize:
+        with metrics.stage('pdf_optimize') as stage:
+            stage.update(optimize_pdf(pdf_file))
+        progress(f"Optimized {format_report(Path(pdf_file).name, stage)}")
+    return pdf_file
+
 def convert_html_to_pdf_webkit(html_file, pdf_file):
     """Convert HTML to PDF using WebKit (Safari) via AppleScript"""
     print("\nConverting HTML to PDF using Safari/WebKit...")
@@ -257,11 +1145,42 @@ if __name__ == "__main__":
     output_pdf = base_dir / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.pdf"
     css_file = base_dir / "pdf_styles.css"
 
-    # Convert markdown to HTML
-    html_path = convert_markdown_to_html(markdown_file, output_html, css_file)
+    # Skip the whole pipeline when neither the markdown nor the CSS changed
+    cache = BuildCache()
+    cache_key = cache.key_for_files(
+        markdown_file, css_file, MARKDOWN_EXTRAS,
+        backend='auto', renderer_version=renderer_version(),
+        build_date=resolve_build_date().isoformat()
+    )
+
+    if cache.restore(cache_key, html=output_html, pdf=output_pdf):
+        print("Inputs unchanged, restored HTML and PDF from build cache")
+        html_path, pdf_path = output_html, output_pdf
+    else:
+        metrics = PipelineMetrics(trace_memory=bool(os.environ.get('BRROW_DOCS_METRICS')))
+
+        # Convert markdown to HTML (very large inputs are streamed block by block)
+        fragment_cache = FragmentCache()
+        highlighter = CodeHighlighter(fragment_cache)
+        if markdown_file.stat().st_size > STREAMING_THRESHOLD_BYTES:
+            html_path = convert_markdown_to_html_streaming(
+                markdown_file, output_html, css_file, metrics=metrics, highlighter=highlighter
+            )
+        else:
+            html_path = convert_markdown_to_html(
+                markdown_file, output_html, css_file, fragment_cache=fragment_cache, metrics=metrics,
+                highlighter=highlighter, prune_css=True
+            )
+
+        # Convert HTML to PDF
+        pdf_path = convert_html_to_pdf(html_path, output_pdf, metrics=metrics)
+
+        if pdf_path:
+            cache.store(cache_key, html=html_path, pdf=pdf_path)
 
-    # Convert HTML to PDF
-    pdf_path = convert_html_to_pdf_chrome(html_path, output_pdf)
+        # BRROW_DOCS_METRICS=path.jsonl (JSON lines) or path.json (Chrome trace)
+        if os.environ.get('BRROW_DOCS_METRICS'):
+            metrics.write(os.environ['BRROW_DOCS_METRICS'])
 
     if pdf_path:
         # Get PDF file size
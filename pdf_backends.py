@@ -0,0 +1,463 @@
+"""
+PDF backend registry for the Brrow documentation pipeline
+Probes installed HTML-to-PDF engines, caches the probes on disk and orders
+backends by their recorded success rate and latency
+"""
+
+import contextlib
+import importlib.util
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: state updates are not locked
+    fcntl = None
+
+from docs_build_cache import default_cache_dir
+
+CHROME_PATHS = [
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+    '/Applications/Chromium.app/Contents/MacOS/Chromium',
+    '/Applications/Google Chrome Canary.app/Contents/MacOS/Google Chrome Canary',
+    'google-chrome',
+    'google-chrome-stable',
+    'chromium',
+    'chromium-browser',
+]
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Probe and latency state, kept in the build cache directory (see default_cache_dir())
+STATE_FILE_NAME = "backends.json"
+DEFAULT_TIMEOUT = 60
+DEFAULT_HEDGE_DELAY = 10
+PROBE_TIMEOUT = 30
+# Seconds before a failed probe is retried (a working probe is kept until
+# the binary changes)
+NEGATIVE_PROBE_TTL = 3600
+LATENCY_HISTORY = 50
+
+SMOKE_HTML = '''<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="UTF-8"><title>probe</title></head>
+<body><h1>Brrow</h1><p>Backend probe</p></body>
+</html>
+'''
+
+
+def chrome_print_command(chrome_path, html_file, pdf_file):
+    """Build the headless Chrome --print-to-pdf command line"""
+    cmd = [
+        chrome_path,
+        '--headless',
+        '--disable-gpu',
+        '--no-pdf-header-footer',
+        '--print-to-pdf=' + str(pdf_file),
+        'file://' + str(html_file)
+    ]
+    # Chrome refuses to start its sandbox as root (e.g. in CI containers)
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        cmd.insert(1, '--no-sandbox')
+    return cmd
+
+
+def wkhtmltopdf_command(binary, html_file, pdf_file):
+    """Build the wkhtmltopdf command line"""
+    return [binary, '--quiet', '--enable-local-file-access', str(html_file), str(pdf_file)]
+
+
+def weasyprint_command(binary, html_file, pdf_file):
+    """Build the weasyprint CLI command line"""
+    return [binary, str(html_file), str(pdf_file)]
+
+
+def cupsfilter_command(binary, html_file, pdf_file):
+    """Build the cupsfilter command line (writes the PDF to stdout)"""
+    return [binary, str(html_file)]
+
+
+def playwright_command(python, html_file, pdf_file):
+    """Build the command that prints via create_pdf_playwright.py in a subprocess"""
+    return [python, str(BASE_DIR / "create_pdf_playwright.py"), str(html_file), str(pdf_file)]
+
+
+def is_valid_pdf(pdf_file):
+    """Check that a file exists, is non-empty and starts with a PDF header"""
+    try:
+        with open(pdf_file, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    except OSError:
+        return False
+
+
+def kill_process_tree(process):
+    """Kill a render process and any helpers it spawned (e.g. Chrome renderers)"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.wait()
+
+
+class Backend:
+    """
+    An external HTML-to-PDF engine
+
+    Args:
+        name: Registry name
+        candidates: Absolute paths or executable names to look for, in order
+        command: Function (binary, html_file, pdf_file) -> argv
+        version_args: Arguments that print the version, or None
+        pdf_on_stdout: True if the engine writes the PDF to stdout
+        requires_module: Python module that must be importable for the
+            backend to count as installed
+    """
+
+    def __init__(self, name, candidates, command, version_args=('--version',), pdf_on_stdout=False,
+                 requires_module=None):
+        self.name = name
+        self.candidates = candidates
+        self.command = command
+        self.version_args = version_args
+        self.pdf_on_stdout = pdf_on_stdout
+        self.requires_module = requires_module
+
+    def find_binary(self):
+        """Return the first installed candidate, or None"""
+        if self.requires_module and importlib.util.find_spec(self.requires_module) is None:
+            return None
+        for candidate in self.candidates:
+            if os.path.isabs(candidate):
+                if os.path.exists(candidate):
+                    return candidate
+            else:
+                found = shutil.which(candidate)
+                if found:
+                    return found
+        return None
+
+    def version(self, binary):
+        """Return the engine's version string, or None"""
+        if not self.version_args:
+            return None
+        try:
+            result = subprocess.run(
+                [binary, *self.version_args], capture_output=True, text=True, timeout=10
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return (result.stdout or result.stderr).strip() or None
+
+    def start(self, binary, html_file, pdf_file):
+        """Start rendering html_file to pdf_file and return the Popen handle"""
+        cmd = self.command(binary, html_file, pdf_file)
+        # stderr goes to a file rather than a pipe so a chatty engine can
+        # never block on a full pipe while we wait for it
+        stderr_log = tempfile.TemporaryFile()
+        # Own process group so a hung render can be killed with its children
+        options = {'stderr': stderr_log, 'start_new_session': hasattr(os, 'killpg')}
+        try:
+            if self.pdf_on_stdout:
+                with open(pdf_file, 'wb') as f:
+                    process = subprocess.Popen(cmd, stdout=f, **options)
+            else:
+                process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, **options)
+        except BaseException:
+            stderr_log.close()
+            raise
+        process.stderr_log = stderr_log
+        return process
+
+    def finish(self, process, pdf_file):
+        """Check an exited render process; raises if it did not produce a PDF"""
+        with process.stderr_log as stderr_log:
+            stderr_log.seek(0)
+            stderr = stderr_log.read().decode(errors='replace').strip()
+        if process.returncode != 0:
+            raise RuntimeError(f"{self.name} exited with {process.returncode}: {stderr[-500:]}")
+        if not is_valid_pdf(pdf_file):
+            raise RuntimeError(f"{self.name} did not produce a valid PDF")
+        return pdf_file
+
+    def run(self, binary, html_file, pdf_file, timeout=DEFAULT_TIMEOUT):
+        """Render html_file to pdf_file; raises on failure or timeout"""
+        process = self.start(binary, html_file, pdf_file)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process)
+            process.stderr_log.close()
+            raise
+        return self.finish(process, pdf_file)
+
+
+BACKENDS = [
+    Backend('chrome', CHROME_PATHS, chrome_print_command),
+    Backend('weasyprint', ['weasyprint'], weasyprint_command),
+    Backend('wkhtmltopdf', ['wkhtmltopdf'], wkhtmltopdf_command),
+    Backend('playwright', [sys.executable], playwright_command,
+            version_args=None, requires_module='playwright'),
+    Backend('cupsfilter', ['/usr/sbin/cupsfilter', 'cupsfilter'], cupsfilter_command,
+            version_args=None, pdf_on_stdout=True),
+]
+
+
+def get_backend(name):
+    """Look up a Backend by name"""
+    for backend in BACKENDS:
+        if backend.name == name:
+            return backend
+    raise KeyError(f"Unknown PDF backend: {name}")
+
+
+class BackendRegistry:
+    """
+    Probes PDF backends and orders them by past performance
+
+    Probe results (binary path, version, smoke-render time) are stored in
+    state_file and reused until the binary's mtime changes (failed probes
+    also expire after NEGATIVE_PROBE_TTL), so normal runs only stat the
+    binaries. Every render records success and latency; the backends are
+    then tried in order of success rate and median latency.
+
+    Batch workers share state_file: each update re-reads it under an
+    exclusive lock, so concurrent processes never drop each other's records.
+    Render failures are reported through progress (default: print).
+    state_file defaults to STATE_FILE_NAME in the build cache directory.
+    """
+
+    def __init__(self, state_file=None, backends=None, progress=print):
+        self.state_file = Path(state_file or default_cache_dir() / STATE_FILE_NAME)
+        self.backends = backends if backends is not None else BACKENDS
+        self.progress = progress
+        self._state = None
+
+    def _read(self):
+        try:
+            state = json.loads(self.state_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('probes', {})
+        state.setdefault('stats', {})
+        return state
+
+    def _load(self):
+        if self._state is None:
+            self._state = self._read()
+        return self._state
+
+    @contextlib.contextmanager
+    def _update(self):
+        """Read the latest state under an exclusive lock, yield it for changes, then save it"""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_file.with_name(self.state_file.name + '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._read()
+            yield state
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_file.parent, prefix=".backends.")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.state_file)
+        self._state = state
+
+    def _smoke_render(self, backend, binary):
+        with tempfile.TemporaryDirectory(prefix="brrow-probe-") as tmp:
+            html_file = Path(tmp) / "probe.html"
+            pdf_file = Path(tmp) / "probe.pdf"
+            html_file.write_text(SMOKE_HTML, encoding='utf-8')
+            start = time.perf_counter()
+            try:
+                backend.run(binary, html_file, pdf_file, timeout=PROBE_TIMEOUT)
+            except Exception as e:
+                return None, f"{type(e).__name__}: {e}"
+            return time.perf_counter() - start, None
+
+    def probe(self, backend, force=False):
+        """
+        Return the probe record for a backend, probing only if needed
+
+        Returns:
+            Dict with binary, mtime, version, smoke_seconds, ok and error,
+            or None if the backend is not installed
+        """
+        state = self._load()
+        binary = backend.find_binary()
+        if not binary:
+            if backend.name in state['probes']:
+                with self._update() as state:
+                    state['probes'].pop(backend.name, None)
+            return None
+
+        mtime = os.stat(binary).st_mtime
+        cached = state['probes'].get(backend.name)
+        if (not force and cached and cached['binary'] == binary and cached['mtime'] == mtime
+                and (cached['ok'] or time.time() - cached.get('probed_at', 0) < NEGATIVE_PROBE_TTL)):
+            return cached
+
+        smoke_seconds, error = self._smoke_render(backend, binary)
+        record = {
+            'binary': binary,
+            'mtime': mtime,
+            'version': backend.version(binary),
+            'smoke_seconds': smoke_seconds,
+            'ok': error is None,
+            'error': error,
+            'probed_at': time.time(),
+        }
+        with self._update() as state:
+            state['probes'][backend.name] = record
+        return record
+
+    def record(self, name, ok, seconds):
+        """Record the outcome of one render"""
+        with self._update() as state:
+            stats = state['stats'].setdefault(name, {'successes': 0, 'failures': 0, 'latencies': []})
+            if ok:
+                stats['successes'] += 1
+                stats['latencies'] = (stats['latencies'] + [seconds])[-LATENCY_HISTORY:]
+            else:
+                stats['failures'] += 1
+
+    def _score(self, name, probe):
+        stats = self._load()['stats'].get(name, {})
+        successes = stats.get('successes', 0)
+        failures = stats.get('failures', 0)
+        # Laplace smoothing keeps untried backends in the middle of the pack
+        success_rate = (successes + 1) / (successes + failures + 2)
+        latencies = stats.get('latencies') or [probe.get('smoke_seconds') or DEFAULT_TIMEOUT]
+        return (-success_rate, statistics.median(latencies))
+
+    def ordered(self):
+        """Return installed, working backends, best first, as (backend, probe) pairs"""
+        available = []
+        for backend in self.backends:
+            probe = self.probe(backend)
+            if probe and probe['ok']:
+                available.append((backend, probe))
+        available.sort(key=lambda item: self._score(item[0].name, item[1]))
+        return available
+
+    def median_latency(self, name):
+        """Median recorded latency for a backend, or None if it has no history"""
+        latencies = self._load()['stats'].get(name, {}).get('latencies')
+        return statistics.median(latencies) if latencies else None
+
+    def latency_percentile(self, name, fraction):
+        """Recorded latency percentile for a backend, or None with too little history"""
+        latencies = self._load()['stats'].get(name, {}).get('latencies') or []
+        if len(latencies) < 2:
+            return None
+        return statistics.quantiles(latencies, n=100, method='inclusive')[round(fraction * 100) - 1]
+
+    def render(self, html_file, pdf_file, timeout=DEFAULT_TIMEOUT):
+        """
+        Render with the best available backend, falling back in order
+
+        Returns:
+            Name of the backend that produced the PDF, or None if all failed
+        """
+        html_file = os.path.abspath(html_file)
+        for backend, probe in self.ordered():
+            start = time.perf_counter()
+            try:
+                backend.run(probe['binary'], html_file, pdf_file, timeout=timeout)
+            except Exception as e:
+                self.record(backend.name, False, time.perf_counter() - start)
+                self.progress(f"✗ {backend.name} failed: {type(e).__name__}: {e}")
+                continue
+            self.record(backend.name, True, time.perf_counter() - start)
+            return backend.name
+        return None
+
+    def render_hedged(self, html_file, pdf_file, hedge_delay=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Render with the best backend, racing the runner-up if it is slow
+
+        The primary backend starts immediately. If it has not produced a PDF
+        after hedge_delay seconds (default: its recorded p95 latency), the
+        next backend starts in parallel. The first valid PDF wins and the
+        other process is killed. If the primary fails outright, the
+        secondary starts at once. Backends still running at the timeout
+        are killed and recorded as failures.
+
+        Returns:
+            Name of the winning backend, or None if no backend succeeded
+        """
+        html_file = os.path.abspath(html_file)
+        candidates = self.ordered()
+        if not candidates:
+            return None
+
+        primary = candidates[0][0]
+        if hedge_delay is None:
+            hedge_delay = self.latency_percentile(primary.name, 0.95) or DEFAULT_HEDGE_DELAY
+
+        pdf_file = Path(pdf_file)
+        tmp_dir = tempfile.mkdtemp(prefix=".hedge-", dir=pdf_file.parent)
+        running = []
+        pending = list(candidates)
+        deadline = time.monotonic() + timeout
+        next_start = time.monotonic()
+
+        try:
+            while running or pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    for backend, _, _, started in running:
+                        self.record(backend.name, False, now - started)
+                    self.progress(f"✗ Hedged render timed out after {timeout}s")
+                    return None
+
+                # Start the next backend when the hedge delay elapses or
+                # nothing is left running
+                if pending and (now >= next_start or not running):
+                    backend, probe = pending.pop(0)
+                    output = Path(tmp_dir) / f"{backend.name}.pdf"
+                    try:
+                        process = backend.start(probe['binary'], html_file, output)
+                    except OSError as e:
+                        self.record(backend.name, False, 0)
+                        self.progress(f"✗ {backend.name} failed to start: {e}")
+                        continue
+                    running.append((backend, process, output, now))
+                    next_start = now + hedge_delay
+
+                for entry in list(running):
+                    backend, process, output, started = entry
+                    if process.poll() is None:
+                        continue
+                    running.remove(entry)
+                    elapsed = time.monotonic() - started
+                    try:
+                        backend.finish(process, output)
+                    except Exception as e:
+                        self.record(backend.name, False, elapsed)
+                        self.progress(f"✗ {backend.name} failed: {e}")
+                        next_start = time.monotonic()
+                        continue
+
+                    self.record(backend.name, True, elapsed)
+                    os.replace(output, pdf_file)
+                    return backend.name
+
+                time.sleep(0.05)
+            return None
+        finally:
+            # Kill the losers
+            for backend, process, _, _ in running:
+                kill_process_tree(process)
+                process.stderr_log.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
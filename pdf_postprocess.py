@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+PDF post-processing for the Brrow documentation pipeline
+Rewrites rendered PDFs with deduplicated objects, recompressed streams, object
+streams and linearization (fast web view), and reports the bytes saved
+
+Usage:
+    python3 pdf_postprocess.py REPORT.pdf [MORE.pdf ...] [--no-linearize]
+    report = optimize_pdf("REPORT.pdf")
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Rewriters in order of preference: pikepdf (bundles libqpdf), the qpdf CLI,
+# then pypdf alone (no object streams or linearization)
+ENGINES = ('pikepdf', 'qpdf', 'pypdf')
+
+
+def available_engines():
+    """Rewriters usable in this environment, in order of preference"""
+    engines = []
+    for engine in ENGINES:
+        if engine == 'qpdf':
+            if shutil.which('qpdf'):
+                engines.append(engine)
+            continue
+        try:
+            __import__(engine)
+        except ImportError:
+            continue
+        engines.append(engine)
+    return engines
+
+
+def deduplicate(data):
+    """
+    Merge identical objects (fonts, images, content streams) with pypdf
+
+    Also compresses uncompressed page content streams. Returns the input
+    unchanged when pypdf is not installed.
+
+    Args:
+        data: PDF bytes
+
+    Returns:
+        Tuple of (PDF bytes, whether deduplication ran)
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return data, False
+
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+    writer.compress_identical_objects()
+    for page in writer.pages:
+        if '/Contents' in page:
+            page.compress_content_streams()
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), True
+
+
+def _rewrite_pikepdf(data, output_file, linearize):
+    import pikepdf
+
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        pdf.save(
+            output_file,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            compress_streams=True,
+            recompress_flate=True,
+            linearize=linearize,
+            deterministic_id=True,
+        )
+
+
+def _rewrite_qpdf(data, output_file, linearize):
+    with tempfile.NamedTemporaryFile(suffix='.pdf', dir=Path(output_file).parent, delete=False) as f:
+        f.write(data)
+        input_file = f.name
+    try:
+        cmd = ['qpdf', '--object-streams=generate', '--compress-streams=y', '--recompress-flate',
+               '--deterministic-id']
+        if linearize:
+            cmd.append('--linearize')
+        process = subprocess.run(cmd + [input_file, str(output_file)], capture_output=True, text=True)
+        # Exit code 3 means success with warnings
+        if process.returncode not in (0, 3):
+            raise RuntimeError(f"qpdf failed: {process.stderr.strip()}")
+    finally:
+        os.unlink(input_file)
+
+
+def optimize_pdf(pdf_file, output_file=None, linearize=True, engine=None):
+    """
+    Rewrite a PDF smaller and linearized
+
+    Identical objects are merged (pypdf), then the file is rewritten with
+    recompressed streams, object streams and, if requested, linearization
+    so viewers can show page 1 before the download finishes. IDs are
+    derived from the content, so reproducible inputs stay reproducible.
+
+    Args:
+        pdf_file: Path to the PDF
+        output_file: Where to write the result (default: replace pdf_file)
+        linearize: Linearize for fast web view (pikepdf and qpdf only)
+        engine: 'pikepdf', 'qpdf' or 'pypdf' (default: best available)
+
+    Returns:
+        Dict with engine, deduplicated, linearized, input_bytes,
+        output_bytes and seconds
+    """
+    start = time.perf_counter()
+    pdf_file = Path(pdf_file)
+    output_file = Path(output_file) if output_file else pdf_file
+
+    if engine is None:
+        engines = available_engines()
+        if not engines:
+            raise RuntimeError("No PDF rewriter available; install pikepdf, qpdf or pypdf")
+        engine = engines[0]
+    elif engine not in ENGINES:
+        raise ValueError(f"Unknown PDF rewriter: {engine}")
+
+    data = pdf_file.read_bytes()
+    deduplicated_data, deduplicated = deduplicate(data)
+
+    # Write next to the output and rename, so a failure leaves the original intact
+    fd, temp_file = tempfile.mkstemp(suffix='.pdf', prefix='.optimize-', dir=output_file.parent)
+    os.close(fd)
+    try:
+        if engine == 'pikepdf':
+            _rewrite_pikepdf(deduplicated_data, temp_file, linearize)
+        elif engine == 'qpdf':
+            _rewrite_qpdf(deduplicated_data, temp_file, linearize)
+        else:
+            Path(temp_file).write_bytes(deduplicated_data)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+
+    return {
+        'engine': engine,
+        'deduplicated': deduplicated,
+        'linearized': linearize and engine != 'pypdf',
+        'input_bytes': len(data),
+        'output_bytes': output_file.stat().st_size,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def format_report(name, report):
+    """One-line before/after summary of an optimize_pdf() report"""
+    before = report['input_bytes']
+    after = report['output_bytes']
+    change = (after - before) / before * 100 if before else 0.0
+    details = report['engine'] + (", linearized" if report['linearized'] else "")
+    return (f"{name}: {before / 1024:.1f} KB → {after / 1024:.1f} KB ({change:+.1f}%) "
+            f"in {report['seconds']:.2f}s [{details}]")
+
+
+def main(argv=None):
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Compress, deduplicate and linearize rendered PDFs")
+    parser.add_argument('pdfs', nargs='+', help="PDF files to optimize in place")
+    parser.add_argument('-o', '--output', default=None, help="output path (single input only)")
+    parser.add_argument('--engine', choices=ENGINES, default=None, help="rewriter (default: best available)")
+    parser.add_argument('--no-linearize', action='store_true', help="skip linearization (fast web view)")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.pdfs) > 1:
+        parser.error("--output needs a single input PDF")
+
+    failed = 0
+    total_before = total_after = 0
+    for pdf in args.pdfs:
+        try:
+            report = optimize_pdf(pdf, args.output, linearize=not args.no_linearize, engine=args.engine)
+        except Exception as e:
+            print(f"✗ {pdf}: {type(e).__name__}: {e}")
+            failed += 1
+            continue
+        total_before += report['input_bytes']
+        total_after += report['output_bytes']
+        print(f"✓ {format_report(Path(pdf).name, report)}")
+
+    if len(args.pdfs) > 1 and total_before:
+        print(f"Total: {total_before / 1024:.1f} KB → {total_after / 1024:.1f} KB "
+              f"({(total_after - total_before) / total_before * 100:+.1f}%)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+Sharded parallel PDF rendering for the Brrow documentation pipeline
+Lays out chapter shards in parallel WeasyPrint processes and merges them into
+one PDF with continuous page numbers, working internal links and one outline
+
+Usage:
+    render_sharded(html_content, cover_html, toc_html, "DOCS.pdf", "pdf_styles.css", workers=8)
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from generate_pdf import TOC_DEPTH, group_sections, iter_html_document, pdf_date, read_css
+
+# Links to anchors in other shards point here while a shard is laid out and
+# are turned back into internal links when the shards are merged
+SHARD_LINK_PREFIX = "https://brrow-docs.invalid/anchor/"
+
+# Page number layer: blank pages that show only the stylesheet's margin boxes
+PAGE_NUMBER_CSS = '''
+html, body { background: none; }
+@page { @top-center { content: none; } }
+.page-number-layer { page-break-before: always; }
+'''
+
+# TOC entries show the page number filled in by number_toc() (target-counter
+# cannot see chapters laid out in other shards)
+TOC_NUMBERS_CSS = ".toc a::after { content: leader('.') attr(data-page); }\n"
+# Page number the front shard is first laid out with, before chapters are placed
+TOC_PLACEHOLDER_PAGE = "000"
+# Front shard layouts tried until its page count stops changing
+TOC_PASSES = 3
+
+# Shards begin on a new page, so in sharded output every chapter does
+# (single-process layouts keep the stylesheet's own pagination)
+CHAPTER_BREAK_CSS = ".content > h1 { page-break-before: always; }\n"
+
+# markdown2 writes top-level headers at the start of a line
+CHAPTER_RE = re.compile(r'^<h1 id="', re.M)
+CONTAINER_TAG_RE = re.compile(r'<(/?)(?:blockquote|details|div|dl|ol|table|ul)\b', re.I)
+TOP_CENTER_CONTENT_RE = re.compile(r'@top-center\s*\{[^}]*?\bcontent\s*:\s*([^;}]+)')
+ID_RE = re.compile(r'\sid="([^"]+)"')
+LOCAL_HREF_RE = re.compile(r'href="#([^"]+)"')
+TOC_LINK_RE = re.compile(r'<a href="#([^"]+)"')
+
+
+def split_chapters(html_content):
+    """
+    Split rendered HTML before every top-level h1, where sharded layouts
+    start a new page (see CHAPTER_BREAK_CSS; h1s nested in lists or
+    blockquotes do not)
+    """
+    cuts = [0]
+    depth = 0
+    position = 0
+    for match in CHAPTER_RE.finditer(html_content):
+        for tag in CONTAINER_TAG_RE.finditer(html_content, position, match.start()):
+            depth += -1 if tag.group(1) else 1
+        position = match.start()
+        if depth == 0 and match.start():
+            cuts.append(match.start())
+    cuts.append(len(html_content))
+    return [html_content[start:end] for start, end in zip(cuts, cuts[1:]) if start < end]
+
+
+def running_header(css_content):
+    """The @top-center content value of the stylesheet's @page rule, or None"""
+    match = TOP_CENTER_CONTENT_RE.search(css_content)
+    return match.group(1).strip() if match else None
+
+
+def link_across_shards(html_content):
+    """Point links to anchors outside this HTML at SHARD_LINK_PREFIX URLs"""
+    local_ids = set(ID_RE.findall(html_content))
+
+    def replace_href(match):
+        anchor = match.group(1)
+        if anchor in local_ids:
+            return match.group(0)
+        return f'href="{SHARD_LINK_PREFIX}{anchor}"'
+
+    return LOCAL_HREF_RE.sub(replace_href, html_content)
+
+
+def number_toc(toc_html, pages=None):
+    """
+    Give every TOC link a data-page attribute with its target's page number
+
+    Args:
+        toc_html: TOC HTML from generate_toc_html()
+        pages: Dict of anchor -> page number, or None for TOC_PLACEHOLDER_PAGE
+    """
+    def replace_link(match):
+        page = TOC_PLACEHOLDER_PAGE if pages is None else pages.get(match.group(1), '')
+        return f'{match.group(0)} data-page="{page}"'
+
+    return TOC_LINK_RE.sub(replace_link, toc_html)
+
+
+def shard_css(first_shard, header=None):
+    """
+    Extra stylesheet for one shard
+
+    Page numbers are hidden (they restart in every shard and are overlaid
+    after merging), TOC page numbers come from number_toc() in the first
+    shard, every chapter starts a page (CHAPTER_BREAK_CSS) as it does at a
+    shard boundary, and continuation shards keep the running header (the
+    stylesheet's @top-center content, see running_header()) on their first
+    page.
+    """
+    css = '''
+@page { @bottom-right { content: none; } }
+@page :first { @bottom-right { content: none; } }
+''' + CHAPTER_BREAK_CSS
+    if first_shard:
+        css += TOC_NUMBERS_CSS
+    elif header:
+        css += '@page :first { @top-center { content: %s; } }\n' % header
+    return css
+
+
+def _shard_document(cover_html, toc_html, body, build_date, toc_depth, header, first_shard):
+    """(html_string, extra_css) for one shard"""
+    html_string = ''.join(
+        iter_html_document(body, '', cover_html, toc_html, build_date=build_date, toc_depth=toc_depth)
+    )
+    return link_across_shards(html_string), shard_css(first_shard, header)
+
+
+def front_shard(cover_html, toc_html, pages=None, build_date=None, toc_depth=TOC_DEPTH, header=None):
+    """The cover and TOC shard, with TOC page numbers from pages (see number_toc())"""
+    return _shard_document(cover_html, number_toc(toc_html, pages), '', build_date, toc_depth, header, True)
+
+
+def build_shards(html_content, cover_html, toc_html, shards, build_date=None, toc_depth=TOC_DEPTH, header=None):
+    """
+    Split a rendered document into shard HTML documents
+
+    The cover page and TOC form the first shard (with placeholder TOC page
+    numbers, see front_shard()); the chapters are grouped into shards of
+    similar size. Every shard starts on a new page, as every chapter does in
+    a single-process render.
+
+    Returns:
+        List of (html_string, extra_css) pairs in document order
+    """
+    chapters = split_chapters(html_content)
+    groups = group_sections(chapters, shards) if chapters else []
+
+    return [front_shard(cover_html, toc_html, None, build_date, toc_depth, header)] + [
+        _shard_document('', '', group, build_date, toc_depth, header, False) for group in groups
+    ]
+
+
+def render_shard_weasyprint(html_string, css_file, extra_css, pdf_file, base_url=None):
+    """Lay out one shard with WeasyPrint (runs in a worker process)"""
+    # A reused executor keeps each worker's parsed CSS and fonts across shards
+    from convert_to_pdf import get_weasyprint_renderer
+
+    get_weasyprint_renderer(css_file).write_pdf(html_string, pdf_file, extra_css=extra_css, base_url=base_url)
+    return pdf_file
+
+
+def render_page_numbers(pages, css_file, pdf_file):
+    """
+    Lay out a page number layer for a merged document (runs in a worker process)
+
+    The layer has one blank page per document page with only the stylesheet's
+    @bottom-right box, so numbers use the document's font, size and position
+    (and the cover stays unnumbered through @page :first).
+    """
+    from convert_to_pdf import get_weasyprint_renderer
+
+    body = '<div class="page-number-layer"></div>' * pages
+    html_string = f'<!DOCTYPE html><html><head><meta charset="UTF-8"></head><body>{body}</body></html>'
+    get_weasyprint_renderer(css_file).write_pdf(html_string, pdf_file, extra_css=PAGE_NUMBER_CSS)
+    return pdf_file
+
+
+def count_pages(pdf_file):
+    """Number of pages in a PDF"""
+    from pypdf import PdfReader
+
+    return len(PdfReader(pdf_file).pages)
+
+
+def anchor_pages(shard_pdfs, first_page=1):
+    """
+    Page number of every named destination in consecutive shard PDFs
+
+    Args:
+        shard_pdfs: Shard PDF paths in document order
+        first_page: Page number of the first shard's first page
+
+    Returns:
+        Dict of anchor -> page number (first occurrence wins)
+    """
+    from pypdf import PdfReader
+
+    pages = {}
+    for shard_pdf in shard_pdfs:
+        reader = PdfReader(shard_pdf)
+        for name, destination in reader.named_destinations.items():
+            page = reader.get_destination_page_number(destination)
+            if page is not None and page >= 0:
+                pages.setdefault(str(name), first_page + page)
+        first_page += len(reader.pages)
+    return pages
+
+
+def _number(value):
+    """Float for a PDF number, or None for null/missing"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _xyz(left, top):
+    from pypdf.generic import Fit
+
+    return Fit.xyz(left=_number(left), top=_number(top))
+
+
+def _link_target(annotation, page_index_by_id):
+    """
+    Internal target of a link annotation
+
+    Returns:
+        Anchor name (str), (page index, left, top) for explicit
+        destinations, or None for external links
+    """
+    from pypdf.generic import NameObject
+
+    action = annotation.get('/A')
+    action = action.get_object() if action is not None else None
+    if action is not None:
+        if action.get('/S') == '/URI':
+            uri = str(action.get('/URI', ''))
+            return uri[len(SHARD_LINK_PREFIX):] if uri.startswith(SHARD_LINK_PREFIX) else None
+        if action.get('/S') != '/GoTo':
+            return None
+        destination = action.get('/D')
+    else:
+        destination = annotation.get('/Dest')
+
+    if destination is None:
+        return None
+    destination = destination.get_object()
+    if isinstance(destination, NameObject):
+        return str(destination)[1:]
+    if isinstance(destination, str):
+        return str(destination)
+    if isinstance(destination, list) and destination:
+        page_ref = destination[0]
+        page_index = page_index_by_id.get(getattr(page_ref, 'idnum', None))
+        if page_index is None:
+            return None
+        left = destination[2] if len(destination) > 2 else None
+        top = destination[3] if len(destination) > 3 else None
+        return (page_index, left, top)
+    return None
+
+
+def _copy_outline(writer, reader, items, page_offset, parent=None):
+    """Copy a reader outline (nested lists follow their parent) into writer"""
+    last = None
+    for item in items:
+        if isinstance(item, list):
+            if last is not None:
+                _copy_outline(writer, reader, item, page_offset, last)
+            continue
+        page = reader.get_destination_page_number(item)
+        if page is None or page < 0:
+            continue
+        last = writer.add_outline_item(
+            item.title, page_offset + page, parent=parent, fit=_xyz(item.left, item.top), is_open=False
+        )
+
+
+def merge_shards(shard_pdfs, output_pdf, page_numbers_pdf=None, build_date=None):
+    """
+    Merge shard PDFs into one document
+
+    Cross-shard links (SHARD_LINK_PREFIX URLs) and intra-shard links are
+    rewritten as links to the merged pages, the shard outlines are joined
+    into one bookmark tree, and page numbers continue across shards (from a
+    render_page_numbers() layer). The output depends only on its inputs and
+    the build date, so unchanged input merges to identical bytes.
+
+    Args:
+        shard_pdfs: Shard PDF paths in document order
+        output_pdf: Path of the merged PDF
+        page_numbers_pdf: Page number layer with one page per merged page,
+            drawn over the merged pages (default: no page numbers)
+        build_date: Date for the PDF metadata (default: SOURCE_DATE_EPOCH or today)
+
+    Returns:
+        Number of pages in the merged PDF
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.annotations import Link
+    from pypdf.generic import ArrayObject, NameObject
+
+    writer = PdfWriter()
+    anchors = {}
+    links = []
+
+    for shard_pdf in shard_pdfs:
+        reader = PdfReader(shard_pdf)
+        page_offset = len(writer.pages)
+        page_index_by_id = {
+            page.indirect_reference.idnum: index for index, page in enumerate(reader.pages)
+        }
+
+        for name, destination in reader.named_destinations.items():
+            page = reader.get_destination_page_number(destination)
+            if page is not None and page >= 0:
+                anchors.setdefault(str(name), (page_offset + page, destination.left, destination.top))
+
+        for index, page in enumerate(reader.pages):
+            # Internal links are re-created after merging; keep only external ones
+            kept = ArrayObject()
+            for annotation_ref in page.get('/Annots') or []:
+                annotation = annotation_ref.get_object()
+                target = _link_target(annotation, page_index_by_id) if annotation.get('/Subtype') == '/Link' else None
+                if target is None:
+                    kept.append(annotation_ref)
+                    continue
+                if isinstance(target, tuple):
+                    target = (page_offset + target[0], target[1], target[2])
+                links.append((page_offset + index, list(annotation['/Rect']), target))
+            if '/Annots' in page:
+                if kept:
+                    page[NameObject('/Annots')] = kept
+                else:
+                    del page['/Annots']
+            writer.add_page(page)
+
+        _copy_outline(writer, reader, reader.outline, page_offset)
+
+    for page_index, rect, target in links:
+        if isinstance(target, str):
+            target = anchors.get(target)
+            if target is None:
+                continue
+        target_page, left, top = target
+        writer.add_annotation(
+            page_index,
+            Link(rect=rect, border=[0, 0, 0], target_page_index=target_page, fit=_xyz(left, top)),
+        )
+
+    if page_numbers_pdf is not None:
+        layer = PdfReader(page_numbers_pdf)
+        if len(layer.pages) != len(writer.pages):
+            raise ValueError(f"Page number layer has {len(layer.pages)} pages, document has {len(writer.pages)}")
+        for page, numbers in zip(writer.pages, layer.pages):
+            page.merge_page(numbers)
+
+    if writer.outline:
+        writer.page_mode = '/UseOutlines'
+    writer.add_metadata({'/CreationDate': pdf_date(build_date), '/ModDate': pdf_date(build_date)})
+
+    with open(output_pdf, 'wb') as f:
+        writer.write(f)
+    return len(writer.pages)
+
+
+def render_sharded(html_content, cover_html, toc_html, output_pdf, css_file, workers=None,
+                   base_url=None, executor=None, build_date=None, toc_depth=TOC_DEPTH):
+    """
+    Render a document as parallel shards and merge them into output_pdf
+
+    Once the chapters are laid out, the cover and TOC shard is laid out
+    again with the page number of every TOC entry filled in (repeated if
+    that changes its own length), then the page number layer is rendered.
+
+    Args:
+        html_content: Rendered markdown body (header IDs must be unique)
+        cover_html: Cover page HTML (first shard)
+        toc_html: Table of contents HTML (first shard)
+        output_pdf: Path of the merged PDF
+        css_file: Stylesheet applied to every shard
+        workers: Layout processes and chapter shards (default: CPU count)
+        base_url: Base URL for relative images and links
+        executor: Optional ProcessPoolExecutor to reuse
+        build_date: Date for the PDF metadata (default: SOURCE_DATE_EPOCH or today)
+        toc_depth: Deepest header level in the PDF outline
+
+    Returns:
+        Number of pages in the merged PDF
+    """
+    workers = workers or os.cpu_count() or 1
+    header = running_header(read_css(css_file))
+    shards = build_shards(html_content, cover_html, toc_html, workers, build_date, toc_depth, header)
+
+    work_dir = tempfile.mkdtemp(prefix=".shards-", dir=Path(output_pdf).resolve().parent)
+    try:
+        shard_pdfs = [str(Path(work_dir) / f"shard-{index:03d}.pdf") for index in range(len(shards))]
+        page_numbers_pdf = str(Path(work_dir) / "page-numbers.pdf")
+        jobs = [
+            (html_string, str(css_file), extra_css, pdf_file, base_url)
+            for (html_string, extra_css), pdf_file in zip(shards, shard_pdfs)
+        ]
+
+        def render(pool):
+            list(pool.map(render_shard_weasyprint, *zip(*jobs)))
+            front_pages = count_pages(shard_pdfs[0])
+            chapter_pages = sum(count_pages(pdf_file) for pdf_file in shard_pdfs[1:])
+
+            # Fill in the TOC page numbers now that the chapters are placed
+            for _ in range(TOC_PASSES if toc_html else 0):
+                pages = anchor_pages(shard_pdfs[1:], front_pages + 1)
+                html_string, extra_css = front_shard(cover_html, toc_html, pages, build_date, toc_depth, header)
+                pool.submit(
+                    render_shard_weasyprint, html_string, str(css_file), extra_css, shard_pdfs[0], base_url
+                ).result()
+                laid_out_pages = count_pages(shard_pdfs[0])
+                if laid_out_pages == front_pages:
+                    break
+                front_pages = laid_out_pages
+
+            pool.submit(render_page_numbers, front_pages + chapter_pages, str(css_file), page_numbers_pdf).result()
+
+        # Largest shards first so the pool finishes evenly
+        jobs.sort(key=lambda job: len(job[0]), reverse=True)
+        if executor is not None:
+            render(executor)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                render(pool)
+
+        return merge_shards(shard_pdfs, output_pdf, page_numbers_pdf, build_date=build_date)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
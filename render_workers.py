@@ -0,0 +1,372 @@
+"""
+Isolated render workers for the Brrow documentation pipeline
+Runs each render in a worker process with a memory cap, a per-job timeout,
+bounded retries with backoff and periodic worker recycling
+
+Usage:
+    with RenderWorkerPool(workers=4, memory_limit=2 * 1024**3, timeout=120) as pool:
+        future = pool.submit(convert_one, "REPORT.md", "docs_output", "pdf_styles.css", "weasyprint")
+        result = future.result()
+"""
+
+import collections
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_JOBS_PER_WORKER = 20
+
+# Failures that will not go away on a retry (bad input, programming errors)
+NON_RETRYABLE = (ValueError, TypeError, KeyError, FileNotFoundError)
+# A job that timed out is likely to time out again; retry it at most this often
+TIMEOUT_RETRIES = 1
+# Workers never fork the parent (which may hold threads, open browsers or
+# large caches); forkserver where available, spawn elsewhere
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class RenderJobError(Exception):
+    """A render job could not be completed"""
+
+
+class JobTimeout(RenderJobError):
+    """The job ran longer than the pool's timeout and its worker was killed"""
+
+
+class WorkerCrashed(RenderJobError):
+    """The worker process died while running the job (e.g. killed or segfault)"""
+
+
+class RemoteTraceback(Exception):
+    """Traceback text of an exception raised in a worker (set as __cause__)"""
+
+    def __init__(self, tb):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _limit_memory(memory_limit):
+    """Cap the worker's address space; allocations beyond it raise MemoryError"""
+    if not memory_limit or resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def _marshal_exception(exc):
+    """Return exc if it pickles, otherwise a RuntimeError describing it"""
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        return RuntimeError(f"{type(exc).__name__}: {exc}")
+
+
+def _worker_main(conn, memory_limit):
+    """Worker loop: receive (func, args, kwargs), send back the outcome"""
+    # Own process group, so a timeout also kills anything the job spawned
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    _limit_memory(memory_limit)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        func, args, kwargs = job
+        try:
+            outcome = ('ok', func(*args, **kwargs), None)
+        except BaseException as e:
+            outcome = ('error', _marshal_exception(e), traceback.format_exc())
+
+        try:
+            conn.send(outcome)
+        except Exception as e:
+            # The result itself could not be pickled
+            conn.send(('error', RuntimeError(f"Unpicklable result: {e}"), traceback.format_exc()))
+
+
+class _Job:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.deadline = None
+        self.jobs_done = 0
+
+    def kill(self):
+        """Kill the worker and everything in its process group"""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        """Ask an idle worker to exit"""
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class RenderWorkerPool:
+    """
+    Job queue backed by isolated, recyclable worker processes
+
+    Each job runs in a worker with an address-space cap (RLIMIT_AS), so a
+    runaway document raises MemoryError in its worker instead of exhausting
+    the machine. A job that exceeds the timeout gets its worker killed; a
+    worker that dies takes only its current job with it. Failed jobs are
+    retried with exponential backoff (except NON_RETRYABLE errors; timeouts
+    at most TIMEOUT_RETRIES times), and workers are replaced after
+    max_jobs_per_worker jobs or a MemoryError so memory growth does not
+    accumulate over a long batch. Workers start from START_METHOD, so job
+    functions must be importable by module name.
+
+    Args:
+        workers: Worker processes (default: CPU count)
+        memory_limit: Address-space cap per worker in bytes, or None. It is
+            inherited by subprocesses, so leave it off for Chrome backends,
+            which reserve far more address space than they use
+        timeout: Seconds per attempt before the worker is killed
+        retries: Extra attempts after a failure
+        backoff: Delay before the first retry; doubles on each retry
+        max_jobs_per_worker: Recycle a worker after this many jobs
+    """
+
+    def __init__(self, workers=None, memory_limit=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER):
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.stats = collections.Counter()
+
+        self._context = multiprocessing.get_context(START_METHOD)
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._shutdown = False
+        self._woken = False
+        self._thread = None
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) to run in a worker
+
+        func, its arguments and its result must be picklable.
+
+        Returns:
+            concurrent.futures.Future with the result, or the job's exception
+            (JobTimeout, WorkerCrashed, or the worker's exception with a
+            RemoteTraceback as __cause__)
+        """
+        job = _Job(func, args, kwargs)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit to a closed RenderWorkerPool")
+            self._pending.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="render-worker-pool", daemon=True)
+                self._thread.start()
+            self._wake()
+        return job.future
+
+    def _wake(self):
+        """
+        Wake the pool thread (caller holds _lock, so the pipe is still open)
+
+        At most one wakeup is in flight, so a burst of submits cannot fill
+        the pipe while the lock is held.
+        """
+        if not self._woken:
+            self._woken = True
+            self._wakeup_writer.send(None)
+
+    def map(self, func, *iterables):
+        """Submit func over iterables; return results in order (raises the first failure)"""
+        futures = [self.submit(func, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Finish queued jobs, then stop the workers (safe to call more than once)"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                # No job was ever submitted, so no thread will close the pipe
+                self._shutdown = True
+                self._wakeup_reader.close()
+                self._wakeup_writer.close()
+                return
+            if not self._shutdown:
+                self._shutdown = True
+                self._wake()
+        thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _fail_or_retry(self, job, exc, retryable=True):
+        """Requeue a failed job with backoff, or resolve its future with exc"""
+        if retryable and job.attempts <= self.retries:
+            self.stats['retries'] += 1
+            job.not_before = time.monotonic() + self.backoff * 2 ** (job.attempts - 1)
+            self._pending.append(job)
+        else:
+            self.stats['failed'] += 1
+            job.future.set_exception(exc)
+
+    def _next_ready_job(self, now):
+        """Pop the first queued job whose backoff has elapsed"""
+        for _ in range(len(self._pending)):
+            job = self._pending.popleft()
+            if job.future.cancelled():
+                continue
+            if job.not_before > now:
+                self._pending.append(job)
+                continue
+            if job.attempts == 0 and not job.future.set_running_or_notify_cancel():
+                continue
+            return job
+        return None
+
+    def _run(self):
+        idle = []
+        busy = []
+
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                # Hand ready jobs to idle (or new) workers
+                while len(busy) < self.workers:
+                    job = self._next_ready_job(now)
+                    if job is None:
+                        break
+                    worker = idle.pop() if idle else _Worker(self._context, self.memory_limit)
+                    job.attempts += 1
+                    worker.job = job
+                    worker.deadline = now + self.timeout if self.timeout else None
+                    try:
+                        worker.conn.send((job.func, job.args, job.kwargs))
+                    except Exception as e:
+                        # The job itself could not be pickled
+                        worker.job = None
+                        idle.append(worker)
+                        self.stats['failed'] += 1
+                        job.future.set_exception(e)
+                        continue
+                    busy.append(worker)
+
+                if self._shutdown and not busy and not self._pending:
+                    break
+
+            # Sleep until a result arrives, a worker dies, a job is submitted,
+            # or the next deadline/backoff expires
+            deadlines = [worker.deadline for worker in busy if worker.deadline]
+            deadlines += [job.not_before for job in self._pending if job.not_before > now]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+            ready = wait(
+                [self._wakeup_reader] + [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy],
+                timeout=wait_for,
+            )
+
+            if self._wakeup_reader in ready:
+                while self._wakeup_reader.poll():
+                    self._wakeup_reader.recv()
+                # Jobs submitted from here on are seen at the top of the loop
+                with self._lock:
+                    self._woken = False
+
+            now = time.monotonic()
+            for worker in list(busy):
+                job = worker.job
+                if worker.conn in ready:
+                    try:
+                        status, value, tb = worker.conn.recv()
+                    except (EOFError, OSError):
+                        status = None
+                    if status is not None:
+                        busy.remove(worker)
+                        worker.job = None
+                        worker.jobs_done += 1
+                        if status == 'ok':
+                            self.stats['succeeded'] += 1
+                            job.future.set_result(value)
+                        else:
+                            value.__cause__ = RemoteTraceback(tb)
+                            self._fail_or_retry(job, value, not isinstance(value, NON_RETRYABLE))
+                        # Recycle workers that are worn out or hit the memory cap
+                        if worker.jobs_done >= self.max_jobs_per_worker or isinstance(value, MemoryError):
+                            self.stats['recycled'] += 1
+                            worker.stop()
+                        else:
+                            idle.append(worker)
+                        continue
+
+                if not worker.process.is_alive():
+                    busy.remove(worker)
+                    worker.kill()
+                    self.stats['crashed'] += 1
+                    self._fail_or_retry(job, WorkerCrashed(
+                        f"worker exited with code {worker.process.exitcode} on attempt {job.attempts}"
+                    ))
+                elif worker.deadline and now >= worker.deadline:
+                    busy.remove(worker)
+                    worker.kill()
+                    self.stats['timeouts'] += 1
+                    self._fail_or_retry(job, JobTimeout(
+                        f"job exceeded {self.timeout}s on attempt {job.attempts}"
+                    ), job.attempts <= TIMEOUT_RETRIES)
+
+        for worker in idle:
+            worker.stop()
+        with self._lock:
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
@@ -0,0 +1,1381 @@
+"""
+Tests for the Brrow documentation pipeline
+Run with: python3 -m pytest test_docs_pipeline.py
+"""
+
+import io
+import os
+from pathlib import Path
+
+import pytest
+
+import generate_pdf
+from docs_metrics import quiet
+
+BASE_DIR = Path(__file__).resolve().parent
+SYSTEM_DOCUMENTATION = BASE_DIR / "BRROW_COMPLETE_SYSTEM_DOCUMENTATION.md"
+CSS_FILE = BASE_DIR / "pdf_styles.css"
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache_dir(monkeypatch, tmp_path):
+    """Keep default build caches and backend state out of the source tree"""
+    monkeypatch.setenv('BRROW_DOCS_CACHE_DIR', str(tmp_path / "docs_cache"))
+
+SAMPLE_MARKDOWN = """# Overview
+
+See the [API][api] and [setup](#setup).
+
+## Setup
+
+```bash
+# not a header
+echo "setup"
+```
+
+# Payments
+
+## Setup
+
+| Field | Type |
+|-------|------|
+| id    | String |
+
+# Payments
+
+## Setup
+
+- [x] Webhooks
+- [ ] Refunds
+
+[api]: https://example.com/api
+"""
+
+
+def test_parallel_matches_serial_for_system_documentation():
+    source = SYSTEM_DOCUMENTATION.read_text(encoding='utf-8')
+
+    assert generate_pdf.render_markdown_parallel(source, workers=4) == generate_pdf.markdown_to_html(source)
+
+
+def test_parallel_renumbers_duplicate_ids_across_sections():
+    parallel = generate_pdf.render_markdown_parallel(SAMPLE_MARKDOWN, workers=3)
+
+    assert parallel == generate_pdf.markdown_to_html(SAMPLE_MARKDOWN)
+    assert 'id="setup-3"' in parallel
+    assert 'id="payments-2"' in parallel
+    assert 'href="https://example.com/api"' in parallel
+
+
+def test_parallel_html_document_matches_serial():
+    serial = io.StringIO()
+    parallel = io.StringIO()
+
+    generate_pdf.convert_markdown_to_html(SYSTEM_DOCUMENTATION, serial, CSS_FILE, progress=quiet)
+    generate_pdf.convert_markdown_to_html(SYSTEM_DOCUMENTATION, parallel, CSS_FILE, progress=quiet, workers=2)
+
+    assert parallel.getvalue() == serial.getvalue()
+
+
+def _write_shard(path, pages, anchors=(), links=(), bookmarks=()):
+    from pypdf import PdfWriter
+    from pypdf.generic import (ArrayObject, Destination, DictionaryObject, Fit, FloatObject, NameObject,
+                               TextStringObject)
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(595.28, 841.89)
+    for name, page in anchors:
+        writer.add_named_destination_object(
+            Destination(TextStringObject(name), writer.pages[page].indirect_reference, Fit.xyz(0, 800))
+        )
+    for page, uri in links:
+        writer.add_annotation(page, DictionaryObject({
+            NameObject('/Type'): NameObject('/Annot'),
+            NameObject('/Subtype'): NameObject('/Link'),
+            NameObject('/Rect'): ArrayObject([FloatObject(v) for v in (50, 700, 200, 720)]),
+            NameObject('/A'): DictionaryObject({
+                NameObject('/S'): NameObject('/URI'),
+                NameObject('/URI'): TextStringObject(uri),
+            }),
+        }))
+    for title, page in bookmarks:
+        writer.add_outline_item(title, page)
+    writer.write(path)
+
+
+def _write_page_numbers(path, pages):
+    """A page number layer like render_page_numbers() lays out (cover unnumbered)"""
+    from pypdf import PageObject, PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    for index in range(pages):
+        page = PageObject.create_blank_page(width=595.28, height=841.89)
+        if index:
+            content = DecodedStreamObject()
+            content.set_data(f'BT /F1 10 Tf 500 35 Td (Page {index + 1}) Tj ET'.encode('latin-1'))
+            page[NameObject('/Resources')] = DictionaryObject({NameObject('/Font'): DictionaryObject({
+                NameObject('/F1'): DictionaryObject({
+                    NameObject('/Type'): NameObject('/Font'),
+                    NameObject('/Subtype'): NameObject('/Type1'),
+                    NameObject('/BaseFont'): NameObject('/Helvetica'),
+                }),
+            })})
+            page[NameObject('/Contents')] = content
+        writer.add_page(page)
+    writer.write(path)
+
+
+def test_merge_shards_links_outline_and_page_numbers(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    import pdf_shards
+
+    shards = [tmp_path / "shard-0.pdf", tmp_path / "shard-1.pdf"]
+    _write_shard(shards[0], 2, links=[(1, pdf_shards.SHARD_LINK_PREFIX + 'setup'), (1, 'https://example.com')],
+                 bookmarks=[('Table of Contents', 1)])
+    _write_shard(shards[1], 3, anchors=[('setup', 2)], bookmarks=[('Setup', 2)])
+    _write_page_numbers(tmp_path / "numbers.pdf", 5)
+
+    assert pdf_shards.merge_shards(shards, tmp_path / "merged.pdf", tmp_path / "numbers.pdf") == 5
+
+    reader = pypdf.PdfReader(tmp_path / "merged.pdf")
+    annotations = [annotation.get_object() for annotation in reader.pages[1]['/Annots']]
+    assert [annotation['/A']['/URI'] for annotation in annotations if '/A' in annotation] == ['https://example.com']
+    internal = [annotation for annotation in annotations if '/Dest' in annotation]
+    assert reader.get_page_number(internal[0]['/Dest'][0].get_object()) == 4
+    assert [(item.title, reader.get_destination_page_number(item)) for item in reader.outline] == [
+        ('Table of Contents', 1), ('Setup', 4)
+    ]
+    assert [page.extract_text() for page in reader.pages] == ['', 'Page 2', 'Page 3', 'Page 4', 'Page 5']
+
+    _write_page_numbers(tmp_path / "short.pdf", 4)
+    with pytest.raises(ValueError):
+        pdf_shards.merge_shards(shards, tmp_path / "merged.pdf", tmp_path / "short.pdf")
+
+
+def test_shards_split_where_the_stylesheet_breaks_pages():
+    import pdf_shards
+
+    css = CSS_FILE.read_text(encoding='utf-8')
+    # Only sharded layouts break at every chapter; the shared stylesheet is unchanged
+    assert '.content > h1' not in css
+    assert pdf_shards.CHAPTER_BREAK_CSS in pdf_shards.shard_css(False)
+    html = generate_pdf.markdown_to_html("intro\n\n# A\n\n> # Quoted\n\n- item\n\n    # In a list\n\n# B\n")
+    chapters = pdf_shards.split_chapters(html)
+
+    assert ''.join(chapters) == html
+    assert [chapter.split('\n', 1)[0] for chapter in chapters] == [
+        '<p>intro</p>', '<h1 id="a">A</h1>', '<h1 id="b">B</h1>']
+
+    # Continuation shards repeat the stylesheet's own running header
+    header = pdf_shards.running_header(css)
+    assert header == '"Brrow Complete System Documentation"'
+    assert '@top-center { content: %s; }' % header in pdf_shards.shard_css(False, header)
+    assert '@top-center' not in pdf_shards.shard_css(True, header)
+
+
+def test_sharded_render_fills_in_toc_page_numbers(monkeypatch, tmp_path):
+    pytest.importorskip('pypdf')
+    import re
+    from concurrent.futures import ThreadPoolExecutor
+    import pdf_shards
+
+    markdown_content = "# A\n\ntext\n\n## A1\n\nmore\n\n# B\n\ntext\n\n# C\n\ntext\n"
+    html_content = generate_pdf.markdown_to_html(markdown_content)
+    toc_html = generate_pdf.generate_toc_html(generate_pdf.extract_toc(markdown_content))
+    front_documents = []
+
+    def render_shard(html_string, css_file, extra_css, pdf_file, base_url=None):
+        # Two front pages; one page per heading elsewhere
+        if 'class="toc"' in html_string:
+            front_documents.append((html_string, extra_css))
+            _write_shard(pdf_file, 2)
+        else:
+            ids = re.findall(r'<h[1-6] id="([^"]+)"', html_string)
+            _write_shard(pdf_file, len(ids), anchors=[(anchor, page) for page, anchor in enumerate(ids)])
+        return pdf_file
+
+    monkeypatch.setattr(pdf_shards, 'render_shard_weasyprint', render_shard)
+    monkeypatch.setattr(pdf_shards, 'render_page_numbers',
+                        lambda pages, css_file, pdf_file: _write_page_numbers(pdf_file, pages))
+    with ThreadPoolExecutor(2) as executor:
+        pages = pdf_shards.render_sharded(html_content, generate_pdf.create_cover_page(), toc_html,
+                                          tmp_path / "sharded.pdf", CSS_FILE, workers=2, executor=executor)
+
+    assert pages == 6
+    (placeholder, css), (numbered, _) = front_documents
+    assert pdf_shards.TOC_NUMBERS_CSS in css and '.toc a::after { content: none; }' not in css
+    assert 'data-page="000"' in placeholder
+    assert re.findall(r'anchor/(\w+)" data-page="(\d+)"', numbered) == [
+        ('a', '3'), ('a1', '4'), ('b', '5'), ('c', '6')]
+
+
+def test_pinned_build_date_gives_byte_identical_html(monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    outputs = []
+    for convert in (generate_pdf.convert_markdown_to_html, generate_pdf.convert_markdown_to_html,
+                    generate_pdf.convert_markdown_to_html_streaming):
+        output = io.BytesIO()
+        convert(SYSTEM_DOCUMENTATION, output, CSS_FILE, progress=quiet)
+        outputs.append(output.getvalue())
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert b'Generated on November 14, 2023' in outputs[0]
+    assert b'<meta name="dcterms.created" content="2023-11-14">' in outputs[0]
+
+
+def test_make_pdf_reproducible_fixes_dates_and_id(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+
+    pdfs = []
+    for index in range(2):
+        writer = pypdf.PdfWriter()
+        writer.add_blank_page(595.28, 841.89)
+        writer.add_metadata({'/CreationDate': f"D:2024010112000{index}Z"})
+        writer.generate_file_identifiers()
+        pdfs.append(tmp_path / f"render-{index}.pdf")
+        writer.write(pdfs[-1])
+    assert pypdf.PdfReader(pdfs[0]).trailer['/ID'] != pypdf.PdfReader(pdfs[1]).trailer['/ID']
+
+    for pdf in pdfs:
+        generate_pdf.make_pdf_reproducible(pdf, "2023-11-14")
+
+    assert pdfs[0].read_bytes() == pdfs[1].read_bytes()
+    reader = pypdf.PdfReader(pdfs[0])
+    assert reader.metadata['/CreationDate'] == 'D:20231114000000Z'
+    assert reader.trailer['/ID'][0] == reader.trailer['/ID'][1]
+
+
+def test_merge_shards_is_byte_identical_across_runs(tmp_path):
+    pytest.importorskip('pypdf')
+    import pdf_shards
+
+    shards = [tmp_path / "shard-0.pdf", tmp_path / "shard-1.pdf"]
+    _write_shard(shards[0], 1, links=[(0, pdf_shards.SHARD_LINK_PREFIX + 'setup')])
+    _write_shard(shards[1], 2, anchors=[('setup', 1)], bookmarks=[('Setup', 1)])
+
+    pdf_shards.merge_shards(shards, tmp_path / "first.pdf", build_date="2023-11-14")
+    pdf_shards.merge_shards(shards, tmp_path / "second.pdf", build_date="2023-11-14")
+
+    assert (tmp_path / "first.pdf").read_bytes() == (tmp_path / "second.pdf").read_bytes()
+
+
+def _sleep_forever():
+    import time
+    time.sleep(3600)
+
+
+def _allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def _crash_once(marker):
+    marker = Path(marker)
+    if not marker.exists():
+        marker.write_text('crashed')
+        os._exit(1)
+    return 'recovered'
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def test_render_workers_isolate_timeouts_memory_and_crashes(tmp_path):
+    import render_workers
+
+    with render_workers.RenderWorkerPool(workers=2, memory_limit=512 * 1024 * 1024, timeout=1, retries=1,
+                                         backoff=0.01) as pool:
+        hung = pool.submit(_sleep_forever)
+        runaway = pool.submit(_allocate, 1024)
+        flaky = pool.submit(_crash_once, tmp_path / "marker")
+        small = pool.submit(_allocate, 16)
+
+        with pytest.raises(render_workers.JobTimeout):
+            hung.result()
+        with pytest.raises(MemoryError) as excinfo:
+            runaway.result()
+        assert isinstance(excinfo.value.__cause__, render_workers.RemoteTraceback)
+        assert flaky.result() == 'recovered'
+        assert small.result() == 16 * 1024 * 1024
+
+    assert pool.stats['timeouts'] == 2
+    assert pool.stats['crashed'] == 1
+
+
+def test_render_workers_recycle_after_max_jobs():
+    import render_workers
+
+    with render_workers.RenderWorkerPool(workers=1, max_jobs_per_worker=2) as pool:
+        pids = [pool.submit(_worker_pid).result() for _ in range(4)]
+
+    assert pids[0] == pids[1] != pids[2] == pids[3]
+
+
+def test_request_coalescer_shares_one_call():
+    import threading
+    from docs_render_server import RequestCoalescer
+
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def render(source):
+        calls.append(source)
+        release.wait(5)
+        return source.upper()
+
+    threads = [threading.Thread(target=lambda: results.append(coalescer.run('key', render, 'doc')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while coalescer.coalesced < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['doc']
+    assert sorted(results) == [('DOC', False)] + [('DOC', True)] * 3
+
+
+def test_render_server_returns_html_pdf_and_metrics(monkeypatch, tmp_path):
+    import json
+    import threading
+    import urllib.request
+    import convert_to_pdf
+    from docs_render_server import RenderHTTPServer, RenderService
+
+    calls = _stub_weasyprint(monkeypatch)
+    monkeypatch.setattr(convert_to_pdf, '_renderers', {})
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    service = RenderService(CSS_FILE, workers=2).start()
+    server = RenderHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        request = urllib.request.Request(f"{base}/render?format=html", data=SAMPLE_MARKDOWN.encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            assert response.headers['Content-Type'] == 'text/html; charset=utf-8'
+
+        expected = io.BytesIO()
+        markdown_file = tmp_path / "sample.md"
+        markdown_file.write_text(SAMPLE_MARKDOWN, encoding='utf-8')
+        generate_pdf.convert_markdown_to_html(markdown_file, expected, CSS_FILE, progress=quiet)
+        assert body == expected.getvalue()
+
+        # PDFs are laid out by the shared renderer with its parsed stylesheet
+        request = urllib.request.Request(f"{base}/render?format=pdf", data=SAMPLE_MARKDOWN.encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            assert response.read().startswith(b'%PDF-stub')
+            assert response.headers['Content-Type'] == 'application/pdf'
+        options = calls['renders'][-1]
+        assert options['stylesheets'] == [calls['css'][0]] and 'optimize_size' not in options
+        assert options['url_fetcher'] is service._asset_url_fetcher()
+        assert 'id="payments"' in options['html'] and '.content' not in options['html']
+
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            metrics = json.load(response)
+        assert metrics['requests'] == 2
+        assert metrics['queue_depth'] == 0
+        assert metrics['stylesheet_loads'] == 1
+        assert metrics['latency_seconds']['html']['count'] == 1
+        assert metrics['latency_seconds']['pdf']['count'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_render_server_rejects_bad_length_and_foreign_assets(monkeypatch, tmp_path):
+    import http.client
+    import threading
+    from docs_render_server import RenderHTTPServer, RenderService, asset_url_fetcher, check_asset_url
+
+    assets = tmp_path / "assets"
+    (assets / "img").mkdir(parents=True)
+    logo = assets / "img" / "logo.png"
+    assert check_asset_url(logo.as_uri(), assets) == logo.as_uri()
+    assert check_asset_url('data:image/png;base64,AAAA', assets)
+    for url in [(tmp_path / "secret.txt").as_uri(), logo.as_uri().replace('/img/', '/img/../../'),
+                'https://example.com/logo.png', 'file://otherhost/etc/passwd']:
+        with pytest.raises(ValueError):
+            check_asset_url(url, assets)
+
+    # The WeasyPrint fetcher checks every URL before fetching it
+    calls = _stub_weasyprint(monkeypatch)
+    fetcher = asset_url_fetcher(assets)
+    assert fetcher.fetch(logo.as_uri()) == logo.as_uri()
+    with pytest.raises(ValueError):
+        fetcher.fetch((tmp_path / "secret.txt").as_uri())
+    assert calls['fetches'] == [logo.as_uri()]
+    assert set(fetcher.allowed_protocols) == {'data', 'file'}
+
+    service = RenderService(CSS_FILE, workers=1, asset_dir=assets)
+    server = RenderHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for length in ['abc', '-5']:
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+            connection.putrequest('POST', '/render?format=html')
+            connection.putheader('Content-Length', length)
+            connection.endheaders()
+            assert connection.getresponse().status == 400
+            connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+@pytest.mark.parametrize('argv', [['--help'], ['html', '--help'], ['pdf', '--help'], ['build', '--help']])
+def test_cli_help_skips_heavy_imports(argv):
+    import brrow_docs
+
+    total_ms, modules = brrow_docs.measure_startup(argv)
+
+    assert modules
+    assert not [name for name in modules if name.split('.')[0] in brrow_docs.HEAVY_MODULES]
+    assert total_ms <= brrow_docs.STARTUP_BUDGET_MS
+
+
+def test_cli_startup_survives_closed_pipe():
+    import subprocess
+    import sys
+
+    read_end, write_end = os.pipe()
+    os.close(read_end)
+    try:
+        process = subprocess.run([sys.executable, str(Path(__file__).parent / "brrow_docs.py"), 'startup'],
+                                 stdout=write_end, stderr=subprocess.PIPE, text=True)
+    finally:
+        os.close(write_end)
+
+    assert process.returncode == 1
+    assert 'Traceback' not in process.stderr and 'BrokenPipeError' not in process.stderr
+
+
+def test_cli_build_failure_exits_non_zero(tmp_path, capsys):
+    import brrow_docs
+
+    status = brrow_docs.main(['build', str(tmp_path / "MISSING.md"), '--backend', 'none'])
+
+    assert status == 1
+    assert "✗ Build failed" in capsys.readouterr().out
+
+
+def test_cached_highlighting_matches_markdown2(tmp_path):
+    pytest.importorskip('pygments')
+    from docs_build_cache import FragmentCache
+
+    source = SYSTEM_DOCUMENTATION.read_text(encoding='utf-8')
+    first = generate_pdf.CodeHighlighter(FragmentCache(tmp_path))
+    blocks = first.prime(source)
+
+    assert blocks > 100
+    assert generate_pdf.markdown_to_html(source, highlighter=first) == generate_pdf.markdown_to_html(source)
+    assert first.misses < blocks
+
+    # A later run tokenizes nothing
+    second = generate_pdf.CodeHighlighter(FragmentCache(tmp_path))
+    second.prime(source)
+    generate_pdf.markdown_to_html(source, highlighter=second)
+    assert second.misses == 0
+
+
+def test_shared_highlighter_reports_counts_per_document(tmp_path):
+    pytest.importorskip('pygments')
+    from docs_metrics import PipelineMetrics
+
+    highlighter = generate_pdf.CodeHighlighter()
+    (tmp_path / "a.md").write_text("# A\n\n```python\na = 1\n```\n\n```python\nb = 2\n```\n", encoding='utf-8')
+    (tmp_path / "b.md").write_text("# B\n\n```python\na = 1\n```\n\n```python\nc = 3\n```\n", encoding='utf-8')
+    counts = []
+    for name in ['a', 'b']:
+        metrics = PipelineMetrics()
+        generate_pdf.convert_markdown_to_html(tmp_path / f"{name}.md", io.StringIO(), CSS_FILE, progress=quiet,
+                                              metrics=metrics, highlighter=highlighter)
+        stage = next(record for record in metrics.records if record['stage'] == 'markdown')
+        counts.append((stage['code_blocks_highlighted'], stage['code_blocks_cached']))
+
+    # The second document tokenizes only its new block, not the first document's too
+    assert counts[0][0] == 2
+    assert counts[1][0] == 1 and counts[1][1] >= 1
+    assert highlighter.misses == 3
+
+
+def test_highlighter_falls_back_without_markdown2_internals_and_bounds_memory(monkeypatch):
+    pytest.importorskip('pygments')
+
+    source = "# Code\n\n" + "".join(f"```python\nvalue = {n}\n```\n\n" for n in range(4))
+    # A markdown2 release that renamed one of the private helpers
+    monkeypatch.setattr(generate_pdf, 'MARKDOWN2_FENCE_INTERNALS', ('_detab', '_renamed_outdent'))
+    monkeypatch.setattr(generate_pdf, 'HIGHLIGHT_MEMORY_BLOCKS', 2)
+    highlighter = generate_pdf.CodeHighlighter()
+
+    assert highlighter.prime(source) == 0
+    assert generate_pdf.markdown_to_html(source, highlighter=highlighter) == generate_pdf.markdown_to_html(source)
+    assert highlighter.misses == 4
+    assert len(highlighter._memory) == 2
+
+
+def _stub_weasyprint(monkeypatch):
+    """Install a recording stand-in for weasyprint (the real one needs pango)"""
+    import sys
+    import types
+
+    calls = {'css': [], 'font_configs': [], 'renders': [], 'fetches': []}
+
+    class CSS:
+        def __init__(self, string, base_url=None, font_config=None):
+            self.string = string
+            self.font_config = font_config
+            calls['css'].append(self)
+
+    class FontConfiguration:
+        def __init__(self):
+            calls['font_configs'].append(self)
+
+    class HTML:
+        def __init__(self, string, base_url=None, url_fetcher=None):
+            self.string = string
+            self.url_fetcher = url_fetcher
+
+        def write_pdf(self, target=None, **options):
+            calls['renders'].append(dict(options, html=self.string, url_fetcher=self.url_fetcher))
+            pdf = b'%PDF-stub ' + (options.get('pdf_identifier') or b'')
+            if target is None:
+                return pdf
+            Path(target).write_bytes(pdf)
+
+    class URLFetcher:
+        def __init__(self, allowed_protocols=None, **kwargs):
+            self.allowed_protocols = allowed_protocols
+
+        def fetch(self, url, headers=None):
+            calls['fetches'].append(url)
+            return url
+
+    weasyprint = types.ModuleType('weasyprint')
+    weasyprint.CSS, weasyprint.HTML = CSS, HTML
+    weasyprint.DEFAULT_OPTIONS = {'cache': None, 'optimize_images': False, 'pdf_identifier': None}
+    text = types.ModuleType('weasyprint.text')
+    fonts = types.ModuleType('weasyprint.text.fonts')
+    fonts.FontConfiguration = FontConfiguration
+    urls = types.ModuleType('weasyprint.urls')
+    urls.URLFetcher = URLFetcher
+    weasyprint.text, text.fonts, weasyprint.urls = text, fonts, urls
+    for name, module in [('weasyprint', weasyprint), ('weasyprint.text', text), ('weasyprint.text.fonts', fonts),
+                         ('weasyprint.urls', urls)]:
+        monkeypatch.setitem(sys.modules, name, module)
+    return calls
+
+
+def test_weasyprint_renderer_reuses_css_and_fonts_until_stylesheet_changes(monkeypatch, tmp_path):
+    import convert_to_pdf
+
+    calls = _stub_weasyprint(monkeypatch)
+    css_file = tmp_path / "styles.css"
+    css_file.write_text("body { color: black; }", encoding='utf-8')
+    renderer = convert_to_pdf.WeasyPrintRenderer(css_file)
+
+    for n in range(3):
+        renderer.write_pdf("<p>x</p>", tmp_path / f"{n}.pdf")
+    assert len(calls['css']) == 1 and len(calls['font_configs']) == 1
+    assert [options['stylesheets'] for options in calls['renders']] == [[calls['css'][0]]] * 3
+    assert {id(options['font_config']) for options in calls['renders']} == {id(calls['font_configs'][0])}
+    assert calls['css'][0].font_config is calls['font_configs'][0]
+    assert isinstance(calls['renders'][0]['cache'], convert_to_pdf.ImageCache)
+    assert calls['renders'][0]['optimize_images'] and 'optimize_size' not in calls['renders'][0]
+
+    # A new mtime drops the parsed CSS, the fonts and the image cache
+    css_file.write_text("body { color: navy; }", encoding='utf-8')
+    os.utime(css_file, ns=(0, css_file.stat().st_mtime_ns + 10**9))
+    renderer.write_pdf("<p>x</p>", tmp_path / "changed.pdf")
+    assert len(calls['css']) == 2 and len(calls['font_configs']) == 2
+    assert calls['css'][1].string == "body { color: navy; }"
+    assert calls['renders'][-1]['font_config'] is calls['font_configs'][1]
+    assert calls['renders'][-1]['cache'] is not calls['renders'][0]['cache']
+    assert renderer.stats['stylesheet_loads'] == 2 and renderer.stats['renders'] == 4
+
+
+def test_batch_weasyprint_lays_out_with_the_shared_parsed_stylesheet(monkeypatch, tmp_path):
+    import batch_convert
+    import convert_to_pdf
+
+    calls = _stub_weasyprint(monkeypatch)
+    monkeypatch.setattr(convert_to_pdf, '_renderers', {})
+    for name in ['a', 'b']:
+        (tmp_path / f"{name}.md").write_text(f"# Report {name}\n\n```python\nprint('{name}')\n```\n", encoding='utf-8')
+        batch_convert.convert_one(tmp_path / f"{name}.md", tmp_path / "out", CSS_FILE, 'weasyprint',
+                                  build_date='2024-01-02', cache_dir=tmp_path / "cache")
+
+    assert len(calls['css']) == 1 and calls['css'][0].string == CSS_FILE.read_text(encoding='utf-8')
+    assert [options['stylesheets'] for options in calls['renders']] == [[calls['css'][0]]] * 2
+    for name, options in zip(['a', 'b'], calls['renders']):
+        html = (tmp_path / "out" / f"{name}.html").read_text(encoding='utf-8')
+        assert options['html'] == generate_pdf.strip_embedded_css(html) != html
+        assert '<style>' in options['html'] and f'Report {name}' in options['html']
+
+
+def test_weasyprint_pdf_is_byte_identical_with_pinned_build_date(monkeypatch, tmp_path):
+    import convert_to_pdf
+
+    calls = _stub_weasyprint(monkeypatch)
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    pdfs = []
+    for index, source in enumerate([SAMPLE_MARKDOWN, SAMPLE_MARKDOWN, SAMPLE_MARKDOWN + "\nEdited\n"]):
+        # A fresh renderer each time, like separate runs
+        monkeypatch.setattr(convert_to_pdf, '_renderers', {})
+        (tmp_path / "doc.md").write_text(source, encoding='utf-8')
+        pdfs.append(tmp_path / f"{index}.pdf")
+        convert_to_pdf.convert_markdown_to_pdf(tmp_path / "doc.md", pdfs[-1], CSS_FILE, progress=quiet)
+
+    assert pdfs[0].read_bytes() == pdfs[1].read_bytes() != pdfs[2].read_bytes()
+    assert len(calls['renders'][0]['pdf_identifier']) == 32
+    assert '<meta name="dcterms.created" content="2023-11-14">' in calls['renders'][0]['html']
+    assert '<meta name="dcterms.modified" content="2023-11-14">' in calls['renders'][0]['html']
+
+
+def test_image_cache_drops_least_recently_used():
+    from convert_to_pdf import ImageCache
+
+    cache = ImageCache(max_entries=2)
+    cache['a'], cache['b'] = 1, 2
+    assert cache['a'] == 1
+    cache['c'] = 3
+
+    assert list(cache) == ['a', 'c']
+
+
+def test_css_prune_keeps_page_rules_and_matching_selectors():
+    import css_prune
+
+    css = """
+    @page { size: A4; @bottom-center { content: counter(page); } }
+    body { counter-reset: figure; }
+    h1, h6 { color: red; }
+    table td, .missing > p { padding: 0; }
+    a[href^="http"]::after, code:not(.inline) { content: ""; }
+    @media print { table { border: 0; } pre { margin: 0; } }
+    """
+    stats = {}
+    pruned = css_prune.prune_css(css, ['<h1 id="intro">Intro</h1>', '<p><a href="x">x</a> <pre>y</pre></p>'], stats)
+
+    assert '@page { size: A4; @bottom-center { content: counter(page); } }' in pruned
+    assert 'counter-reset: figure' in pruned
+    assert 'h1 {' in pruned and 'h6' not in pruned
+    assert 'table' not in pruned and '.missing' not in pruned
+    assert 'a[href^="http"]::after {' in pruned
+    assert '@media print {\npre { margin: 0; }\n}' in pruned
+    assert stats == {'rules_total': 6, 'rules_kept': 4}
+
+
+def test_css_prune_keeps_toc_page_and_running_string_rules_for_full_document():
+    import css_prune
+
+    source = SYSTEM_DOCUMENTATION.read_text(encoding='utf-8')
+    html_chunks = [
+        generate_pdf.markdown_to_html(source),
+        generate_pdf.create_cover_page(),
+        generate_pdf.generate_toc_html(generate_pdf.extract_toc(source)),
+    ]
+    # pdf_styles.css has no running strings of its own
+    css = generate_pdf.read_css(CSS_FILE) + "\n.running-title { string-set: chapter content(); }\n"
+    stats = {}
+    pruned = css_prune.prune_css(css, html_chunks, stats)
+
+    for kept in ['@page {', '@page :first {', '.toc {', '.toc a {', '.toc a::after {',
+                 'content: leader(\'.\') target-counter(attr(href), page);',
+                 '.running-title { string-set: chapter content(); }']:
+        assert kept in pruned
+    assert stats['rules_kept'] < stats['rules_total']
+
+
+def test_css_prune_negation_and_escaped_selectors():
+    import css_prune
+
+    css = """
+    p:not(.lead) { margin: 0; }
+    .missing:not(.lead) { color: red; }
+    .md\\:wide { width: 100%; }
+    """
+    pruned = css_prune.prune_css(css, '<p class="intro">x</p><div class="md:wide">y</div>')
+
+    assert 'p:not(.lead) {' in pruned
+    assert '.missing' not in pruned
+    assert '.md\\:wide {' in pruned
+
+
+def test_pruned_css_is_embedded_in_serial_and_parallel_html():
+    serial = io.StringIO()
+    parallel = io.StringIO()
+
+    generate_pdf.convert_markdown_to_html(SYSTEM_DOCUMENTATION, serial, CSS_FILE, progress=quiet, prune_css=True)
+    generate_pdf.convert_markdown_to_html(SYSTEM_DOCUMENTATION, parallel, CSS_FILE, progress=quiet, workers=2,
+                                          prune_css=True)
+
+    assert parallel.getvalue() == serial.getvalue()
+    assert '@page' in serial.getvalue()
+    assert '.codehilite .hll' not in serial.getvalue()
+
+
+def test_weasyprint_renderer_reloads_changed_stylesheet(tmp_path):
+    import convert_to_pdf
+
+    css_file = tmp_path / "styles.css"
+    css_file.write_text("h1 { color: red; }", encoding='utf-8')
+    renderer = convert_to_pdf.get_weasyprint_renderer(css_file)
+
+    assert renderer.css_content() == "h1 { color: red; }"
+    assert renderer.css_content() == "h1 { color: red; }"
+    assert convert_to_pdf.get_weasyprint_renderer(str(css_file)) is renderer
+
+    css_file.write_text("h1 { color: blue; }", encoding='utf-8')
+    os.utime(css_file, ns=(0, css_file.stat().st_mtime_ns + 1))
+    assert renderer.css_content() == "h1 { color: blue; }"
+    assert renderer.stats['stylesheet_loads'] == 2
+
+
+def test_toc_is_nested_to_configured_depth():
+    import re
+    import css_prune
+
+    toc_items = generate_pdf.extract_toc(SAMPLE_MARKDOWN + "\n### Retries\n", max_level=6)
+    shallow = generate_pdf.generate_toc_html(toc_items)
+    deep = generate_pdf.generate_toc_html(toc_items, depth=3)
+
+    assert 'toc-level-3' not in shallow and '&nbsp;' not in shallow
+    assert re.search(r'<a href="#payments">Payments</a><ul>\s*<li class="toc-level-2"><a href="#setup-2">', shallow)
+    assert re.search(r'<a href="#setup-3">Setup</a><ul>\s*<li class="toc-level-3"><a href="#retries">', deep)
+    assert deep.count('<ul>') == deep.count('</ul>') and deep.count('<li ') == deep.count('</li>')
+    assert generate_pdf.bookmark_css(3) == 'h4, h5, h6 { bookmark-level: none; }'
+
+    pruned = css_prune.prune_css(CSS_FILE.read_text(encoding='utf-8'), shallow)
+    assert "target-counter(attr(href), page)" in pruned
+
+
+def test_optimize_pdf_dedupes_and_linearizes(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    pikepdf = pytest.importorskip('pikepdf')
+    from pypdf.generic import DecodedStreamObject, NameObject
+    import pdf_postprocess
+
+    # Every page carries its own copy of the same uncompressed content
+    writer = pypdf.PdfWriter()
+    for _ in range(5):
+        page = writer.add_blank_page(595.28, 841.89)
+        content = DecodedStreamObject()
+        content.set_data(b"BT /F1 12 Tf 72 720 Td (Brrow) Tj ET\n" * 500)
+        page[NameObject('/Contents')] = writer._add_object(content)
+    writer.write(tmp_path / "render.pdf")
+
+    reports = []
+    for name in ("first.pdf", "second.pdf"):
+        reports.append(pdf_postprocess.optimize_pdf(tmp_path / "render.pdf", tmp_path / name))
+
+    assert reports[0]['engine'] == 'pikepdf' and reports[0]['linearized']
+    assert reports[0]['output_bytes'] < reports[0]['input_bytes'] / 10
+    assert (tmp_path / "first.pdf").read_bytes() == (tmp_path / "second.pdf").read_bytes()
+    with pikepdf.open(tmp_path / "first.pdf") as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 5
+        assert len({page.Contents.objgen for page in pdf.pages}) == 1
+
+
+def test_build_cache_default_dir_and_restore_after_concurrent_eviction(monkeypatch, tmp_path):
+    import shutil
+    import docs_build_cache
+    import pdf_backends
+
+    assert docs_build_cache.BuildCache().cache_dir == tmp_path / "docs_cache" / "builds"
+    assert pdf_backends.BackendRegistry().state_file == tmp_path / "docs_cache" / "backends.json"
+
+    cache = docs_build_cache.BuildCache()
+    html = tmp_path / "doc.html"
+    html.write_text("<h1>Doc</h1>", encoding='utf-8')
+    cache.store('ab' * 32, html=html)
+
+    # Another process evicts the entry between the existence check and the copy
+    copy_atomic = docs_build_cache._copy_atomic
+
+    def evict_then_copy(src, dst):
+        shutil.rmtree(Path(src).parent)
+        return copy_atomic(src, dst)
+
+    monkeypatch.setattr(docs_build_cache, '_copy_atomic', evict_then_copy)
+    assert cache.restore('ab' * 32, html=tmp_path / "out.html") is False
+
+
+def test_build_cache_hits_misses_on_change_and_evicts(tmp_path):
+    from docs_build_cache import BuildCache
+
+    cache = BuildCache(tmp_path / "cache", max_bytes=20)
+    markdown_file = tmp_path / "doc.md"
+    css_file = tmp_path / "doc.css"
+    markdown_file.write_text("# Doc\n", encoding='utf-8')
+    css_file.write_text("h1 { color: red; }", encoding='utf-8')
+    html = tmp_path / "doc.html"
+    html.write_text("<h1>Doc</h1>", encoding='utf-8')
+
+    key = cache.key_for_files(markdown_file, css_file, ['tables'], 'html')
+    assert not cache.restore(key, html=tmp_path / "out.html")
+    cache.store(key, html=html)
+    assert cache.restore(key, html=tmp_path / "out.html")
+    assert (tmp_path / "out.html").read_text(encoding='utf-8') == "<h1>Doc</h1>"
+
+    # Any input that affects the output changes the key
+    css_file.write_text("h1 { color: blue; }", encoding='utf-8')
+    assert cache.key_for_files(markdown_file, css_file, ['tables'], 'html') != key
+    css_file.write_text("h1 { color: red; }", encoding='utf-8')
+    markdown_file.write_text("# Doc 2\n", encoding='utf-8')
+    assert cache.key_for_files(markdown_file, css_file, ['tables'], 'html') != key
+    assert cache.key_for_files(css_file, css_file, ['tables'], 'pdf') != cache.key_for_files(
+        css_file, css_file, ['tables'], 'html')
+
+    # Over budget: the least recently used entry goes first
+    other = cache.key(b"other", b"", [], 'html')
+    os.utime(cache._entry_dir(key), (0, 0))
+    cache.store(other, html=html)
+    assert not cache.restore(key, html=tmp_path / "out.html")
+    assert cache.restore(other, html=tmp_path / "out.html")
+
+
+def test_fragment_cache_persists_and_evicts(tmp_path):
+    from docs_build_cache import FragmentCache
+
+    cache = FragmentCache(tmp_path, max_bytes=30)
+    first = cache.key("# A\n", 'section')
+    second = cache.key("# B\n", 'section')
+    assert first != cache.key("# A\n", 'other')
+
+    cache.put(first, "<h1>A</h1>")
+    assert FragmentCache(tmp_path).get(first) == "<h1>A</h1>"
+
+    os.utime(cache._path(first), (0, 0))
+    cache.put(second, "<h1>B</h1><p>bbbbbb</p>")
+    cache.evict()
+    assert FragmentCache(tmp_path).get(first) is None
+    assert cache.get(second) == "<h1>B</h1><p>bbbbbb</p>"
+
+
+@pytest.mark.parametrize('source', [
+    "<div>\n\n## Inside\n\n</div>\n\n# A\n\ntext\n",
+    "# !!!\n\nfoo\n\n# !!!\n\nbar\n",
+    "\n\n# A\n- item\n# B\n\nTitle\n=====\n\nbody\n",
+])
+def test_incremental_matches_serial_for_tricky_sections(tmp_path, source):
+    from docs_build_cache import FragmentCache
+
+    serial = generate_pdf.markdown_to_html(source)
+    html, _, _ = generate_pdf.render_markdown_incremental(source, FragmentCache(tmp_path))
+
+    assert ''.join(generate_pdf.split_sections(source)) == source
+    assert html == serial
+
+
+def test_incremental_reconverts_only_the_edited_section(tmp_path):
+    from docs_build_cache import FragmentCache
+
+    cache = FragmentCache(tmp_path)
+    html, converted, total = generate_pdf.render_markdown_incremental(SAMPLE_MARKDOWN, cache)
+    assert total == len(generate_pdf.split_sections(SAMPLE_MARKDOWN))
+
+    edited = SAMPLE_MARKDOWN.replace("- [ ] Refunds", "- [ ] Refunds\n- [ ] Disputes")
+    html, converted, _ = generate_pdf.render_markdown_incremental(edited, cache)
+    assert converted == 1
+    assert html == generate_pdf.markdown_to_html(edited)
+    assert 'id="payments-2"' in html and 'id="setup-3"' in html
+
+
+def test_batch_mirrors_folders_and_titles_each_report(tmp_path, capsys):
+    import batch_convert
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "report.md").write_text("Intro\n\n# Alpha & Co\n\ntext\n", encoding='utf-8')
+    (tmp_path / "b" / "report.md").write_text("## Only a subsection\n", encoding='utf-8')
+    (tmp_path / "b" / "setup_guide.md").write_text("## Only a subsection\n", encoding='utf-8')
+    files = batch_convert.discover_markdown_files(tmp_path, ['**/*.md'])
+
+    cache_dir = tmp_path / "cache"
+    results, failures = batch_convert.run_batch(files, tmp_path / "out", CSS_FILE, backend='none', workers=1,
+                                                build_date='2024-01-02', cache_dir=cache_dir)
+
+    assert not failures and len(results) == 3
+    assert not any(result['cached'] for result in results)
+    assert (cache_dir / "builds").is_dir()
+    alpha = (tmp_path / "out" / "a" / "report.html").read_text(encoding='utf-8')
+    assert '<title>Alpha &amp; Co</title>' in alpha
+    assert '<div class="subtitle">Alpha &amp; Co</div>' in alpha
+    assert '<title>report</title>' in (tmp_path / "out" / "b" / "report.html").read_text(encoding='utf-8')
+    # Same content, different file name: not served from the other file's cache entry
+    assert '<title>setup guide</title>' in (tmp_path / "out" / "b" / "setup_guide.html").read_text(encoding='utf-8')
+
+
+def test_async_render_many_is_quiet_and_isolates_failures(tmp_path, capfd, monkeypatch):
+    import asyncio
+
+    import async_render
+    import pdf_backends
+
+    monkeypatch.setattr(pdf_backends.get_backend('chrome'), 'find_binary', lambda: None)
+    (tmp_path / "a.md").write_text("# A\n\ntext\n", encoding='utf-8')
+    jobs = [(tmp_path / "missing.md", tmp_path / "missing.pdf"), (tmp_path / "a.md", tmp_path / "a.pdf")]
+
+    results = asyncio.run(async_render.render_many(jobs, backend='chrome', concurrency=1, convert_workers=1))
+
+    assert [result['markdown'] for result in results] == [str(tmp_path / "missing.md"), str(tmp_path / "a.md")]
+    assert results[0]['error'].startswith("FileNotFoundError")
+    assert results[1]['error'] == "RuntimeError: Chrome not found"
+    assert (tmp_path / "a.html").exists()
+    assert capfd.readouterr().out == ''
+
+
+def test_async_playwright_renderer_closes_after_failed_start():
+    import asyncio
+
+    from create_pdf_playwright import AsyncPlaywrightPdfRenderer
+
+    class Playwright:
+        stopped = False
+
+        async def stop(self):
+            self.stopped = True
+
+    renderer = AsyncPlaywrightPdfRenderer()
+    asyncio.run(renderer.close())
+    # Launch failed after the driver started: no browser, no page queue
+    renderer._playwright = playwright = Playwright()
+    asyncio.run(renderer.close())
+    assert playwright.stopped and renderer._playwright is None
+
+
+def _script_backend(name, script):
+    """A Backend that runs a Python one-liner with argv [html_file, pdf_file]"""
+    import sys
+
+    from pdf_backends import Backend
+
+    return Backend(name, [sys.executable], lambda binary, html_file, pdf_file: [
+        binary, '-c', script, str(html_file), str(pdf_file)], version_args=None)
+
+
+WRITE_PDF = "import sys, time; time.sleep({delay}); open(sys.argv[2], 'wb').write(b'%PDF-1.4 {name}')"
+
+
+def test_backend_registry_ranks_by_failures_and_shares_state(tmp_path, monkeypatch):
+    import pdf_backends
+
+    fast = _script_backend('fast', WRITE_PDF.format(delay=0, name='fast'))
+    steady = _script_backend('steady', WRITE_PDF.format(delay=0.3, name='steady'))
+    broken = _script_backend('broken', "raise SystemExit(3)")
+    state_file = tmp_path / "backends.json"
+    registry = pdf_backends.BackendRegistry(state_file, [fast, steady, broken])
+
+    assert [backend.name for backend, _ in registry.ordered()] == ['fast', 'steady']
+    registry.record('fast', False, 1.0)
+    registry.record('fast', False, 1.0)
+    assert [backend.name for backend, _ in registry.ordered()] == ['steady', 'fast']
+
+    # A second process's registry loaded earlier must not drop these records
+    other = pdf_backends.BackendRegistry(state_file, [fast, steady, broken])
+    other.ordered()
+    registry.record('steady', True, 0.5)
+    other.record('steady', True, 0.7)
+    stats = pdf_backends.BackendRegistry(state_file)._load()['stats']
+    assert stats['steady']['latencies'] == [0.5, 0.7] and stats['fast']['failures'] == 2
+
+    # Failed probes are retried once they expire; working ones are kept
+    probed_at = registry.probe(broken)['probed_at']
+    assert registry.probe(broken)['probed_at'] == probed_at
+    monkeypatch.setattr(pdf_backends.time, 'time', lambda: probed_at + pdf_backends.NEGATIVE_PROBE_TTL + 1)
+    assert registry.probe(broken)['probed_at'] > probed_at
+    assert registry.probe(fast)['probed_at'] < probed_at + 1
+
+
+HANG_UNLESS_PROBE = ("import os, sys, time\n"
+                     "if 'probe' not in sys.argv[1]:\n"
+                     "    open(sys.argv[1] + '.pid', 'w').write(str(os.getpid())); time.sleep(60)\n"
+                     "open(sys.argv[2], 'wb').write(b'%PDF-1.4')")
+
+
+def test_hedged_render_picks_winner_and_kills_loser(tmp_path):
+    import pdf_backends
+
+    slow = _script_backend('slow', HANG_UNLESS_PROBE)
+    fast = _script_backend('fast', WRITE_PDF.format(delay=0, name='fast'))
+    registry = pdf_backends.BackendRegistry(tmp_path / "backends.json", [slow, fast])
+    # History says the slow backend is usually quickest, so it starts first
+    registry.record('slow', True, 0.01)
+    registry.record('fast', True, 1.0)
+    html_file = tmp_path / "doc.html"
+    html_file.write_text("<h1>Doc</h1>", encoding='utf-8')
+
+    assert registry.render_hedged(html_file, tmp_path / "doc.pdf", hedge_delay=0.2, timeout=30) == 'fast'
+    assert (tmp_path / "doc.pdf").read_bytes() == b'%PDF-1.4 fast'
+    with pytest.raises(ProcessLookupError):
+        os.kill(int((tmp_path / "doc.html.pid").read_text()), 0)
+    assert not list(tmp_path.glob(".hedge-*"))
+
+
+def test_hedged_render_records_deadline_as_failure(tmp_path):
+    import pdf_backends
+
+    registry = pdf_backends.BackendRegistry(tmp_path / "backends.json", [_script_backend('slow', HANG_UNLESS_PROBE)])
+    html_file = tmp_path / "doc.html"
+    html_file.write_text("<h1>Doc</h1>", encoding='utf-8')
+
+    assert registry.render_hedged(html_file, tmp_path / "doc.pdf", hedge_delay=0.1, timeout=0.5) is None
+    assert registry._load()['stats']['slow']['failures'] == 1
+    assert not (tmp_path / "doc.pdf").exists()
+
+
+FAKE_CHROME = '''
+import base64, json, os, sys
+
+commands, replies = os.fdopen(3, 'rb', 0), os.fdopen(4, 'wb', 0)
+results = {
+    'Target.createTarget': {'targetId': 'tab'},
+    'Target.attachToTarget': {'sessionId': 'session'},
+    'Page.printToPDF': {'stream': 'pdf'},
+    'IO.read': {'data': base64.b64encode(b'%PDF-1.4 cdp').decode(), 'base64Encoded': True, 'eof': True},
+}
+buffer = b''
+while True:
+    data = commands.read(65536)
+    if not data:
+        break
+    buffer += data
+    while b'\\0' in buffer:
+        raw, buffer = buffer.split(b'\\0', 1)
+        message = json.loads(raw)
+        method = message['method']
+        if method == 'Test.exit':
+            sys.exit(0)
+        if method == 'Test.hang':
+            continue
+        reply = {'id': message['id'], 'result': results.get(method, {})}
+        replies.write(json.dumps(reply).encode() + b'\\0')
+        if method == 'Page.navigate':
+            event = {'method': 'Page.loadEventFired', 'sessionId': 'session', 'params': {}}
+            replies.write(json.dumps(event).encode() + b'\\0')
+        if method == 'Browser.close':
+            sys.exit(0)
+'''
+
+
+def test_chrome_cdp_prints_and_fails_waiters_on_timeout_and_eof(tmp_path):
+    import asyncio
+    import sys
+
+    from chrome_cdp import CDPError, ChromeCDP
+
+    fake_chrome = tmp_path / "chrome"
+    fake_chrome.write_text(f"#!{sys.executable}\n{FAKE_CHROME}", encoding='utf-8')
+    fake_chrome.chmod(0o755)
+    html_file = tmp_path / "doc.html"
+    html_file.write_text("<h1>Doc</h1>", encoding='utf-8')
+
+    async def scenario():
+        async with ChromeCDP(chrome_path=str(fake_chrome), timeout=0.3) as chrome:
+            await chrome.print_to_pdf(html_file, tmp_path / "doc.pdf")
+            assert not chrome._event_waiters
+
+            with pytest.raises(asyncio.TimeoutError):
+                await chrome.send('Test.hang')
+            assert not chrome._pending
+
+            waiter = chrome.expect_event('Never.fired')
+            with pytest.raises(CDPError):
+                await chrome.send('Test.exit')
+            with pytest.raises(CDPError):
+                await waiter
+            with pytest.raises(CDPError):
+                await chrome.send('Target.createTarget')
+            with pytest.raises(CDPError):
+                await chrome.expect_event('Page.loadEventFired')
+            assert not chrome._pending and not chrome._event_waiters
+
+    asyncio.run(scenario())
+    assert (tmp_path / "doc.pdf").read_bytes() == b'%PDF-1.4 cdp'
+
+
+def test_html_to_pdf_reports_through_progress_and_records_metrics(tmp_path, capsys):
+    import json
+
+    import pdf_backends
+    from docs_metrics import PipelineMetrics
+
+    broken = _script_backend('broken', "raise SystemExit(3)")
+    working = _script_backend('working', WRITE_PDF.format(delay=0, name='working'))
+    messages = []
+    registry = pdf_backends.BackendRegistry(tmp_path / "backends.json", [broken, working], progress=messages.append)
+    registry.ordered()
+    # Let the broken backend pass its probe so the render falls back past it
+    with registry._update() as state:
+        state['probes']['broken']['ok'] = True
+        state['stats']['broken'] = {'successes': 5, 'failures': 0, 'latencies': [0.01]}
+    html_file = tmp_path / "doc.html"
+    html_file.write_text("<h1>Doc</h1>", encoding='utf-8')
+    metrics = PipelineMetrics(document="doc.md")
+
+    pdf = generate_pdf.convert_html_to_pdf(html_file, tmp_path / "doc.pdf", registry=registry, metrics=metrics,
+                                           progress=messages.append)
+
+    assert pdf == tmp_path / "doc.pdf"
+    assert capsys.readouterr().out == ''
+    assert messages[1].startswith("✗ broken failed: RuntimeError")
+    assert messages[-1].startswith("PDF generated successfully with working")
+
+    [record] = metrics.records
+    assert record['stage'] == 'pdf' and record['backend'] == 'working'
+    assert record['output_bytes'] == len(b'%PDF-1.4 working') and record['wall_s'] >= 0
+    metrics.write(tmp_path / "metrics.jsonl")
+    assert json.loads((tmp_path / "metrics.jsonl").read_text(encoding='utf-8'))['document'] == "doc.md"
+    metrics.write(tmp_path / "trace.json")
+    events = json.loads((tmp_path / "trace.json").read_text(encoding='utf-8'))['traceEvents']
+    assert [(event['ph'], event['name']) for event in events] == [('M', 'thread_name'), ('X', 'pdf')]
+    assert events[1]['args']['backend'] == 'working' and events[1]['dur'] == record['wall_s'] * 1e6
+
+
+def test_playwright_pool_rotates_pages_and_recycles_contexts():
+    from create_pdf_playwright import PlaywrightPdfRenderer
+
+    class Page:
+        def is_closed(self):
+            return False
+
+    class Context:
+        closed = False
+
+        def new_page(self):
+            return Page()
+
+        def close(self):
+            self.closed = True
+
+    class Browser:
+        def __init__(self):
+            self.contexts = []
+
+        def new_context(self):
+            self.contexts.append(Context())
+            return self.contexts[-1]
+
+    renderer = PlaywrightPdfRenderer(pages_per_browser=2, max_renders_per_page=2)
+    browser = Browser()
+    renderer._slots = [renderer._open_slot(browser) for _ in range(2)]
+
+    used = []
+    for _ in range(5):
+        slot = renderer._acquire_slot()
+        used.append(slot['context'])
+        slot['renders'] += 1
+
+    # Round-robin over both pages; each is replaced after two renders
+    first, second, third = browser.contexts
+    assert used == [first, second, first, second, third]
+    assert first.closed and not second.closed and not third.closed
+
+
+def test_playwright_renderer_navigates_to_the_file(tmp_path):
+    from create_pdf_playwright import PlaywrightPdfRenderer
+
+    calls = []
+
+    class Page:
+        def is_closed(self):
+            return False
+
+        def goto(self, url, **options):
+            calls.append(('goto', url, options['wait_until']))
+
+        def evaluate(self, expression):
+            calls.append(('evaluate', expression))
+
+        def pdf(self, path, **options):
+            calls.append(('pdf', path))
+
+    html_file = tmp_path / "report.html"
+    renderer = PlaywrightPdfRenderer()
+    renderer._playwright = object()
+    renderer._slots = [{'browser': None, 'context': None, 'page': Page(), 'renders': 0}]
+    renderer.render(html_file, tmp_path / "report.pdf")
+
+    # Relative images resolve against the file's own directory
+    assert calls[0] == ('goto', html_file.resolve().as_uri(), 'load')
+    assert calls[-1] == ('pdf', str(tmp_path / "report.pdf"))
+
+
+def test_heading_scanner_anchors_match_rendered_ids(tmp_path):
+    import re
+
+    source = SAMPLE_MARKDOWN + (
+        "\nSetext Title\n============\n\nSetup\n-----\n\n"
+        "```\n# inside an unclosed fence\n\n## !!!\n\n## !!!\n\n### C++ & Go\n"
+    )
+    rendered = re.findall(r'<h[1-6] id="([^"]*)"', generate_pdf.markdown_to_html(source))
+
+    headings = generate_pdf.scan_headings(source)
+    assert [heading['anchor'] for heading in headings] == rendered
+    assert [heading['level'] for heading in headings][-6:] == [1, 2, 1, 2, 2, 3]
+    assert source[headings[1]['offset']:].startswith("## Setup")
+
+    # An open file (lines keep their endings) gives the same table
+    markdown_file = tmp_path / "doc.md"
+    markdown_file.write_text(source.replace('\n', '\r\n'), encoding='utf-8', newline='')
+    with open(markdown_file, 'r', encoding='utf-8', newline='') as f:
+        assert [heading['anchor'] for heading in generate_pdf.iter_headings(f)] == rendered
+
+
+def test_write_chunks_to_paths_text_and_binary_writables(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_pdf, 'WRITE_SLICE_CHARS', 3)
+    chunks = ["<p>", "Brrow — café ✓ ", "", "x" * 10, "</p>\n"]
+    expected = ''.join(chunks).encode('utf-8')
+
+    assert generate_pdf.write_chunks(iter(chunks), tmp_path / "out.html") == len(expected)
+    assert (tmp_path / "out.html").read_bytes() == expected
+
+    binary = io.BytesIO()
+    assert generate_pdf.write_chunks(chunks, binary) == len(expected)
+    assert binary.getvalue() == expected
+
+    text = io.StringIO()
+    assert generate_pdf.write_chunks(chunks, text) == len(expected)
+    assert text.getvalue() == ''.join(chunks)
+
+    with open(tmp_path / "latin.html", 'wb') as f:
+        generate_pdf.write_chunks(["café"], f, encoding='latin-1')
+    assert (tmp_path / "latin.html").read_bytes() == "café".encode('latin-1')
+
+    # The streamed document is the same as joining its chunks
+    document = list(generate_pdf.iter_html_document("<h1>A</h1>", "h1 {}", "<div>cover</div>", "<nav></nav>",
+                                                    build_date='2024-01-02'))
+    generate_pdf.write_chunks(document, tmp_path / "doc.html")
+    assert (tmp_path / "doc.html").read_text(encoding='utf-8') == ''.join(document)
+
+
+def test_streaming_blocks_are_bounded_and_output_matches(tmp_path):
+    source = SYSTEM_DOCUMENTATION.read_text(encoding='utf-8')
+    sections = generate_pdf.split_sections(source)
+    block_chars = 4096
+
+    blocks = list(generate_pdf.iter_markdown_blocks(source.splitlines(keepends=True), block_chars))
+    assert ''.join(blocks) == source and len(blocks) > 1
+    boundaries = set()
+    offset = 0
+    for section in sections:
+        boundaries.add(offset)
+        offset += len(section)
+    offset = 0
+    for block in blocks:
+        # Blocks start on section boundaries and overshoot by less than one section
+        assert offset in boundaries
+        last_section = max(len(section) for section in generate_pdf.split_sections(block))
+        assert len(block) < block_chars + last_section
+        offset += len(block)
+
+    serial = io.StringIO()
+    streamed = io.StringIO()
+    markdown_file = tmp_path / "doc.md"
+    # A reference in the first block defined in the last one still resolves
+    markdown_file.write_text("See [the ref][ref].\n\n" + source + "\n[ref]: https://example.com/ref\n",
+                             encoding='utf-8')
+    generate_pdf.convert_markdown_to_html(markdown_file, serial, CSS_FILE, progress=quiet, build_date='2024-01-02')
+    generate_pdf.convert_markdown_to_html_streaming(markdown_file, streamed, CSS_FILE, block_chars=block_chars,
+                                                    progress=quiet, build_date='2024-01-02')
+    assert streamed.getvalue() == serial.getvalue()
+    assert 'href="https://example.com/ref"' in streamed.getvalue()
+
+
+def test_render_workers_retry_timeouts_once_and_close_twice():
+    import render_workers
+
+    pool = render_workers.RenderWorkerPool(workers=1, timeout=0.5, retries=3, backoff=0.01)
+    with pytest.raises(render_workers.JobTimeout):
+        pool.submit(_sleep_forever).result()
+    pool.close()
+    pool.close()
+
+    assert pool.stats['timeouts'] == 1 + render_workers.TIMEOUT_RETRIES
+    assert pool._wakeup_writer.closed
+
+    # A pool that never ran a job still releases its wakeup pipe
+    unused = render_workers.RenderWorkerPool()
+    unused.close()
+    unused.close()
+    assert unused._wakeup_reader.closed and unused._wakeup_writer.closed
+
+
+def test_render_workers_submit_racing_close():
+    import threading
+    import render_workers
+
+    pool = render_workers.RenderWorkerPool(workers=2)
+    futures = []
+    errors = []
+
+    def submit_many():
+        for _ in range(200):
+            try:
+                futures.append(pool.submit(os.getpid))
+            except RuntimeError:
+                return
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=submit_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    pool.close()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert all(isinstance(future.result(), int) for future in futures)
+
+
+def test_bench_parse_size_and_corpus():
+    import bench_docs_pipeline as bench
+
+    assert [bench.parse_size(text) for text in ['2048', '10KB', '1.5mb', ' 1GB ', '7B']] == [
+        2048, 10 * 1024, int(1.5 * 1024 ** 2), 1024 ** 3, 7]
+    with pytest.raises(ValueError):
+        bench.parse_size('ten')
+
+    corpus = bench.generate_corpus(20 * 1024, seed=3)
+    assert corpus == bench.generate_corpus(20 * 1024, seed=3)
+    assert corpus != bench.generate_corpus(20 * 1024, seed=4)
+    assert len(corpus) >= 20 * 1024
+    levels = {heading['level'] for heading in generate_pdf.scan_headings(corpus)}
+    assert levels == {1, 2, 3}
+
+
+def test_bench_compare_reports_only_regressions_over_threshold():
+    import bench_docs_pipeline as bench
+
+    def report(**medians):
+        return {'results': {'1MB': {stage: {'median': median} for stage, median in medians.items()}}}
+
+    baseline = report(markdown=1.0, extract_toc=0.5, removed=1.0)
+    current = report(markdown=1.2, extract_toc=0.55, added=9.0)
+
+    assert bench.compare(current, baseline, 0.15) == [('1MB', 'markdown', 1.0, 1.2)]
+    assert bench.compare(current, baseline, 0.25) == []
+
+
+def test_bench_skips_full_conversion_above_pdf_limit(monkeypatch, tmp_path):
+    import bench_docs_pipeline as bench
+
+    def fail(*args, **kwargs):
+        raise AssertionError("converted a corpus whose PDF stages are skipped")
+
+    monkeypatch.setattr(generate_pdf, 'convert_markdown_to_html', fail)
+    results = bench.bench_size('4KB', 1, 1024, tmp_path)
+
+    assert 'markdown' in results and not any(stage.startswith('pdf:') for stage in results)